@@ -0,0 +1,165 @@
+"""
+Parallel workers calling a throttling model with and without the governor.
+
+Starts benchmarks/fake_model_server.py in-process (or uses --url) and sends
+--calls generateContent requests from --workers threads, first directly
+(what analyse_media did: no limit, no retry) and then through a
+ModelGovernor. For each mode it reports calls that succeeded, 429s the
+server had to send, throughput and end-to-end latency percentiles:
+
+    python benchmarks/bench_governor.py --calls 300 --workers 32 --capacity 8 --rpm 600
+    python benchmarks/bench_governor.py --client genai --hedge-after 1.5 --tail-rate 0.05
+
+--client genai goes through google.genai's Client (base_url pointed at the
+server), exactly as agent.py does with GEMINI_BASE_URL; the default posts
+with requests so only the governor itself is measured.
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Imported standalone so the benchmark does not need the ADK / Vertex AI stack
+WORKSPACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The package's modules by plain name, and the repo root for common/
+sys.path[:0] = [os.path.join(WORKSPACE_DIR, "data_ingestion_agent"), os.path.dirname(os.path.dirname(WORKSPACE_DIR))]
+from model_governor import AIMDLimiter, ModelGovernor, IMAGE_TOKENS  # noqa: E402
+from fake_model_server import add_model_arguments, model_from_args, serve  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+PROMPT = "Describe the primary event or key visual elements in this image concisely."
+IMAGE = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 64  # 16 KB stand-in for a JPEG
+
+
+def requests_caller(url):
+    session = requests.Session()
+    body = {"contents": [{"role": "user", "parts": [
+        {"text": PROMPT},
+        {"inlineData": {"mimeType": "image/jpeg", "data": base64.b64encode(IMAGE).decode()}},
+    ]}]}
+
+    def call(timeout=60):
+        # raise_for_status() raises an HTTPError carrying the response, which the governor classifies
+        response = session.post(f"{url}/v1beta/models/{MODEL}:generateContent", json=body, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    return call
+
+
+def genai_caller(url):
+    from google import genai
+    from google.genai.types import GenerateContentConfig, HttpOptions, Part
+
+    client = genai.Client(api_key="fake", http_options=HttpOptions(base_url=url))
+    contents = [PROMPT, Part.from_bytes(data=IMAGE, mime_type="image/jpeg")]
+
+    def call(timeout=60):
+        return client.models.generate_content(
+            model=MODEL, contents=contents,
+            config=GenerateContentConfig(http_options=HttpOptions(timeout=int(timeout * 1000))))
+    return call
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(mode, call, args, url):
+    requests.post(f"{url}/reset", timeout=10)
+    governor = None
+    if mode == "governed":
+        governor = ModelGovernor(rpm=args.rpm_limit, input_tpm=args.tpm_limit,
+                                 limiter=AIMDLimiter(initial=args.initial_concurrency,
+                                                     maximum=args.max_concurrency),
+                                 retry_base=args.retry_base, timeout=args.timeout,
+                                 hedge_after=args.hedge_after)
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def one(_):
+        started = time.monotonic()
+        try:
+            if governor is None:
+                call()
+            else:
+                governor.call(call, tokens=len(PROMPT) // 4 + 1 + IMAGE_TOKENS, kind="bench")
+        except Exception:
+            with lock:
+                failures[0] += 1
+            return
+        with lock:
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(one, range(args.calls)))
+    elapsed = time.monotonic() - started
+    server = requests.get(f"{url}/stats", timeout=10).json()
+    row = {
+        "mode": mode,
+        "ok": len(latencies),
+        "failed": failures[0],
+        "server_429": server["throttled_capacity"] + server["throttled_rate"],
+        "server_503": server["errors"],
+        "max_in_flight": server["max_in_flight"],
+        "seconds": elapsed,
+        "ok_per_s": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+    if governor is not None:
+        stats = governor.stats()
+        row.update(retries=stats["retries"], hedges=stats["hedges"], hedge_wins=stats["hedge_wins"],
+                   final_limit=stats["concurrency_limit"])
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="an already running fake_model_server.py (default: start one)")
+    parser.add_argument("--client", choices=["requests", "genai"], default="requests")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--modes", default="direct,governed")
+    parser.add_argument("--rpm-limit", type=float, default=6000, help="governor GEMINI_RPM")
+    parser.add_argument("--tpm-limit", type=float, default=10000000, help="governor GEMINI_INPUT_TPM")
+    parser.add_argument("--initial-concurrency", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--retry-base", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--hedge-after", type=float, default=0)
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        server = serve(model_from_args(args), port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    call = genai_caller(url) if args.client == "genai" else requests_caller(url)
+
+    print(f"{args.calls} calls from {args.workers} workers; server capacity {args.capacity}, "
+          f"rpm {args.rpm or 'unlimited'}, latency {args.latency}s")
+    for mode in args.modes.split(","):
+        row = run(mode, call, args, url)
+        extra = ""
+        if "final_limit" in row:
+            extra = (f"  retries {row['retries']}  hedges {row['hedges']} (won {row['hedge_wins']})"
+                     f"  final limit {row['final_limit']}")
+        print(f"{row['mode']:>9}: ok {row['ok']:>5}  failed {row['failed']:>5}  429s {row['server_429']:>5}"
+              f"  503s {row['server_503']:>4}  peak in flight {row['max_in_flight']:>3}"
+              f"  {row['ok_per_s']:7.1f} ok/s  p50 {row['p50']:.3f}s  p95 {row['p95']:.3f}s"
+              f"  p99 {row['p99']:.3f}s{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+How many model calls the rule-based pre-extraction saves on a recorded corpus.
+
+The corpus is JSONL, one {"platform": ..., "item": {...}} object per post as
+posted to agent_feeder's /agent. benchmarks/pre_extract_corpus.jsonl is a
+recorded one (40 posts per platform, from the social_media API on the
+stand-in database) and is measured by default:
+
+    python benchmarks/bench_pre_extract.py
+
+Record a fresh one from a running social_media API and measure it with:
+
+    python benchmarks/bench_pre_extract.py corpus.jsonl --record --api http://localhost:8081 --pages 10
+
+Without pre-extraction every post costs one agent run, plus an analyse_media
+call when it carries a media URL. With it, only posts with a missing or
+low-confidence field reach the agent.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter, defaultdict
+
+# Imported standalone so the benchmark does not need the ADK / Vertex AI stack
+WORKSPACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The package's modules by plain name, and the repo root for common/
+sys.path[:0] = [os.path.join(WORKSPACE_DIR, "data_ingestion_agent"), os.path.dirname(os.path.dirname(WORKSPACE_DIR))]
+from pre_extract import FIELDS, PRE_EXTRACT_MIN_CONFIDENCE, pre_extract  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pre_extract_corpus.jsonl")
+
+PLATFORMS = ["instagram", "reddit", "twitter", "eventbrite", "nammasuttu"]
+
+
+def extract_items(platform, data):
+    if platform == "nammasuttu":
+        return data.get("reports", [])
+    elif platform == "reddit":
+        return data.get("data", {}).get("children", [])
+    elif platform == "eventbrite":
+        return data.get("events", [])
+    items = data.get("data", [])
+    return items if isinstance(items, list) else []
+
+
+def record(path, api, pages, limit):
+    import requests
+
+    written = 0
+    with open(path, "w") as out:
+        for platform in PLATFORMS:
+            for page in range(pages):
+                response = requests.get(f"{api}/api/{platform}",
+                                        params={"limit": limit, "cursor": str(page * limit)}, timeout=30)
+                response.raise_for_status()
+                items = extract_items(platform, response.json())
+                for item in items:
+                    out.write(json.dumps({"platform": platform, "item": item}) + "\n")
+                    written += 1
+                if len(items) < limit:
+                    break
+    print(f"Recorded {written} posts to {path}")
+
+
+def measure(path, min_confidence):
+    with open(path) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    per_platform = defaultdict(Counter)
+    missing = Counter()
+    started = time.perf_counter()
+    for entry in corpus:
+        counts = per_platform[entry["platform"]]
+        extraction = pre_extract(entry["item"], entry["platform"])
+        counts["posts"] += 1
+        has_media = bool(extraction and extraction.media_url)
+        counts["baseline_calls"] += 1 + has_media
+        fields = extraction.missing_fields(min_confidence) if extraction else list(FIELDS)
+        missing.update(fields)
+        if fields:
+            counts["agent_posts"] += 1
+            counts["calls"] += 1 + has_media
+    elapsed = time.perf_counter() - started
+
+    total = Counter()
+    print(f"{'platform':<12}{'posts':>7}{'to agent':>10}{'calls before':>14}{'calls after':>13}{'saved':>8}")
+    for platform, counts in sorted(per_platform.items()):
+        total.update(counts)
+        saved = 1 - counts["calls"] / counts["baseline_calls"] if counts["baseline_calls"] else 0
+        print(f"{platform:<12}{counts['posts']:>7}{counts['agent_posts']:>10}"
+              f"{counts['baseline_calls']:>14}{counts['calls']:>13}{saved:>8.1%}")
+    saved = 1 - total["calls"] / total["baseline_calls"] if total["baseline_calls"] else 0
+    print(f"{'total':<12}{total['posts']:>7}{total['agent_posts']:>10}"
+          f"{total['baseline_calls']:>14}{total['calls']:>13}{saved:>8.1%}")
+    print(f"Fields left to the agent: {dict(missing)}")
+    print(f"Pre-extraction: {elapsed / max(len(corpus), 1) * 1e6:.1f} us/post")
+    return {"platforms": {p: dict(c) for p, c in per_platform.items()}, "missing_fields": dict(missing),
+            "call_reduction": saved, "us_per_post": elapsed / max(len(corpus), 1) * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS,
+                        help="JSONL corpus to measure (or to write with --record)")
+    parser.add_argument("--record", action="store_true", help="record the corpus from --api first")
+    parser.add_argument("--api", default="http://localhost:8081")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--min-confidence", type=float, default=PRE_EXTRACT_MIN_CONFIDENCE)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.corpus, args.api, args.pages, args.limit)
+    results = measure(args.corpus, args.min_confidence)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Bytes sent to the model and end-to-end latency of analysing media with and
+without the preprocessing stage (data_ingestion_agent/media_preprocess.py).
+
+    python benchmarks/bench_preprocess.py photo.jpg clip.mp4 interview.mp3
+    python benchmarks/bench_preprocess.py --samples /tmp/media_samples
+
+--samples writes a synthetic 12-megapixel photo, a one-minute 720p video
+with scene cuts and sound, and a three-minute recording opening with
+silence into DIR (the video and audio need ffmpeg) and measures those.
+Every file is sent as base64 inline data, as google.genai does, to
+benchmarks/fake_model_server.py started in-process with --seconds-per-mb
+and --seconds-per-ktoken standing in for upload and prefill time (or to
+--url). Latency is preprocessing plus the model call; the preprocessed run
+goes through the process pool, so its first file includes the pool start.
+"""
+import os
+import sys
+import time
+import base64
+import shutil
+import argparse
+import mimetypes
+import subprocess
+
+import requests
+
+# Imported standalone so the benchmark does not need the ADK / Vertex AI stack
+WORKSPACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The package's modules by plain name, and the repo root for common/
+sys.path[:0] = [os.path.join(WORKSPACE_DIR, "data_ingestion_agent"), os.path.dirname(os.path.dirname(WORKSPACE_DIR))]
+import media_preprocess  # noqa: E402
+from fake_model_server import add_model_arguments, model_from_args, serve  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+PROMPT = "Summarize the main events, key actions, and overall narrative depicted in this media."
+
+
+def write_samples(directory):
+    """Synthetic photo, video and audio files in `directory`; returns their paths."""
+    import numpy as np
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    photo = os.path.join(directory, "photo.jpg")
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:3000, 0:4000]
+    pixels = np.stack([x * 255 // 4000, y * 255 // 3000, (x + y) * 255 // 7000], axis=-1).astype(np.int16)
+    pixels += rng.integers(-24, 24, pixels.shape, dtype=np.int16)  # sensor noise keeps the JPEG realistic
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(photo, quality=95)
+    paths.append(photo)
+    ffmpeg = media_preprocess.MEDIA_FFMPEG
+    if shutil.which(ffmpeg) is None:
+        print(f"{ffmpeg} not found; benchmarking the photo only")
+        return paths
+    video = os.path.join(directory, "video.mp4")
+    # Six ten-second scenes, each a different moving test pattern, with a beeping tone
+    sources = ["testsrc2", "cellauto", "smptehdbars", "life=mold=10:ratio=0.1:", "rgbtestsrc", "testsrc"]
+    scenes = [f"{source if '=' in source else source + '='}size=1280x720:rate=30,trim=duration=10,format=yuv420p"
+              for source in sources]
+    graph = ";".join(f"{scene}[v{i}]" for i, scene in enumerate(scenes))
+    graph += ";" + "".join(f"[v{i}]" for i in range(len(scenes))) + f"concat=n={len(scenes)}:v=1:a=0[v]"
+    subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-filter_complex", graph,
+                    "-f", "lavfi", "-i", "sine=frequency=440:beep_factor=4:duration=60",
+                    "-map", "[v]", "-map", "0:a", "-c:v", "libx264", "-preset", "veryfast", "-b:v", "4M",
+                    "-c:a", "aac", "-b:a", "128k", "-shortest", video], check=True)
+    paths.append(video)
+    audio = os.path.join(directory, "audio.wav")
+    subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", "aevalsrc='if(gt(t,8),0.5*sin(2*PI*330*t)*sin(PI*t/3),0)':s=44100:d=180",
+                    "-ac", "2", audio], check=True)
+    paths.append(audio)
+    return paths
+
+
+def generate(url, session, parts, note):
+    contents = [{"text": PROMPT}] + ([{"text": note}] if note else []) + [
+        {"inlineData": {"mimeType": part.mime_type, "data": base64.b64encode(part.data).decode()}}
+        for part in parts]
+    body = {"contents": [{"role": "user", "parts": contents}]}
+    response = session.post(f"{url}/v1beta/models/{MODEL}:generateContent", json=body, timeout=300)
+    response.raise_for_status()
+    return response.json()["usageMetadata"]["promptTokenCount"], len(response.request.body)
+
+
+def measure(path, mime_type, preprocessed, url, session):
+    started = time.monotonic()
+    if preprocessed:
+        prepared = media_preprocess.preprocess(path, mime_type)
+    else:
+        prepared = media_preprocess.as_is(path, mime_type)
+    prepared_at = time.monotonic()
+    tokens, body_bytes = generate(url, session, prepared.parts, prepared.note)
+    return {"parts": len(prepared.parts), "sent": prepared.sent_bytes, "body": body_bytes, "tokens": tokens,
+            "prepare": prepared_at - started, "total": time.monotonic() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--samples", metavar="DIR", help="write synthetic samples to DIR and measure them")
+    parser.add_argument("--url", help="an already running fake_model_server.py (default: start one)")
+    add_model_arguments(parser)
+    parser.set_defaults(latency=0.5, jitter=0.0, capacity=0, seconds_per_mb=0.8, seconds_per_ktoken=0.05)
+    args = parser.parse_args()
+
+    files = list(args.files)
+    if args.samples:
+        files += write_samples(args.samples)
+    if not files:
+        parser.error("give media files or --samples DIR")
+    url = args.url
+    if url is None:
+        server = serve(model_from_args(args), port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    session = requests.Session()
+
+    print(f"Preprocessing with {media_preprocess.MEDIA_PREPROCESS_WORKERS} worker processes; "
+          f"{media_preprocess.preprocess_settings()}")
+    print(f"{'file':<24} {'mode':<12} {'parts':>5} {'sent':>12} {'tokens':>8} {'prepare':>9} {'total':>9}")
+    totals = {}
+    for path in files:
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        for mode in ("original", "preprocessed"):
+            row = measure(path, mime_type, mode == "preprocessed", url, session)
+            total = totals.setdefault(mode, {"sent": 0, "tokens": 0, "total": 0.0})
+            for key in total:
+                total[key] += row[key]
+            print(f"{os.path.basename(path)[:24]:<24} {mode:<12} {row['parts']:>5} {row['sent']:>12,} "
+                  f"{row['tokens']:>8,} {row['prepare']:>8.3f}s {row['total']:>8.3f}s")
+    before, after = totals["original"], totals["preprocessed"]
+    print(f"\nAll files: {before['sent']:,} -> {after['sent']:,} bytes "
+          f"({after['sent'] / max(1, before['sent']):.1%}), {before['tokens']:,} -> {after['tokens']:,} tokens, "
+          f"{before['total']:.2f}s -> {after['total']:.2f}s end to end")
+
+
+if __name__ == "__main__":
+    main()
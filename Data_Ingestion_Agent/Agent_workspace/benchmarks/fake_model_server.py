@@ -0,0 +1,236 @@
+"""
+Local stand-in for the Gemini generateContent API that injects latency and
+throttling, for exercising data_ingestion_agent/model_governor.py without
+quota or cost:
+
+    python benchmarks/fake_model_server.py --port 8090 --latency 0.5 --capacity 8 --rpm 300
+
+    GEMINI_BASE_URL=http://localhost:8090 python main.py
+
+Any POST to a path ending in ":generateContent" (the API key and Vertex AI
+URL forms both do) gets a canned summary with usageMetadata, after a
+lognormal delay around --latency that grows with the requests in flight,
+plus --seconds-per-mb of request body and --seconds-per-ktoken of input
+(standing in for upload and prefill time). Requests beyond --capacity in
+flight or --rpm per minute are answered with 429 RESOURCE_EXHAUSTED, and
+--error-rate of them with 503. GET /stats reports what was served; POST
+/reset clears it.
+"""
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IMAGE_TOKENS = 258
+VIDEO_BYTES_PER_TOKEN = 1000
+AUDIO_BYTES_PER_TOKEN = 500
+
+
+class FakeModel:
+    """The injected behaviour and counters shared by every request handler."""
+
+    def __init__(self, latency=0.5, jitter=0.3, load_factor=1.0, capacity=8, rpm=0,
+                 error_rate=0.0, tail_rate=0.0, tail_latency=5.0, seconds_per_mb=0.0,
+                 seconds_per_ktoken=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.load_factor = load_factor
+        self.capacity = capacity
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.seconds_per_mb = seconds_per_mb
+        self.seconds_per_ktoken = seconds_per_ktoken
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_flight = 0
+            self._recent = deque()  # monotonic times of the requests admitted in the last minute
+            self.stats = {"requests": 0, "ok": 0, "throttled_capacity": 0, "throttled_rate": 0,
+                          "errors": 0, "max_in_flight": 0, "prompt_tokens": 0}
+
+    def admit(self, body_bytes=0, tokens=0):
+        """(status, delay) for a new request; 200 requests count as in flight until finish()."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                self.stats["throttled_rate"] += 1
+                return 429, 0.0
+            if self.capacity and self.in_flight >= self.capacity:
+                self.stats["throttled_capacity"] += 1
+                return 429, 0.0
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 503, self.latency * self._random.random()
+            self._recent.append(now)
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+            load = self.in_flight / self.capacity if self.capacity else 0
+            if self._random.random() < self.tail_rate:
+                delay = self.tail_latency
+            else:
+                delay = self.latency * math.exp(self._random.gauss(0, self.jitter))
+            delay *= 1 + self.load_factor * load
+            return 200, delay + body_bytes / 1e6 * self.seconds_per_mb + tokens / 1000 * self.seconds_per_ktoken
+
+    def finish(self, prompt_tokens):
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["ok"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+
+    def retry_after(self):
+        with self._lock:
+            if self.rpm and len(self._recent) >= self.rpm:
+                return max(1, math.ceil(self._recent[0] + 60 - time.monotonic()))
+        return 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, in_flight=self.in_flight)
+
+
+def prompt_tokens(body):
+    """Input tokens of a generateContent request body, counted the way estimate_tokens guesses them."""
+    total = 0
+    for content in body.get("contents", []):
+        for part in content.get("parts", []) if isinstance(content, dict) else []:
+            if "text" in part:
+                total += len(part["text"]) // 4 + 1
+            elif "inlineData" in part or "inline_data" in part:
+                inline = part.get("inlineData") or part.get("inline_data")
+                mime_type = inline.get("mimeType") or inline.get("mime_type") or ""
+                size = len(inline.get("data", "")) * 3 // 4
+                if mime_type.startswith("image/"):
+                    total += IMAGE_TOKENS
+                elif mime_type.startswith("audio/"):
+                    total += size // AUDIO_BYTES_PER_TOKEN + 1
+                else:
+                    total += size // VIDEO_BYTES_PER_TOKEN + 1
+    return total
+
+
+def make_handler(model):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send(200, model.snapshot())
+            else:
+                self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            path = self.path.split("?", 1)[0]
+            if path.rstrip("/") == "/reset":
+                model.reset()
+                self._send(200, {"status": "reset"})
+                return
+            if not path.endswith(":generateContent"):
+                self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                self._send(400, {"error": {"code": 400, "message": "Invalid JSON", "status": "INVALID_ARGUMENT"}})
+                return
+            tokens = prompt_tokens(body)
+            status, delay = model.admit(len(raw), tokens)
+            if status == 429:
+                self._send(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                           "status": "RESOURCE_EXHAUSTED"}},
+                           {"Retry-After": str(model.retry_after())})
+                return
+            time.sleep(delay)
+            if status == 503:
+                self._send(503, {"error": {"code": 503, "message": "The model is overloaded.",
+                                           "status": "UNAVAILABLE"}})
+                return
+            model.finish(tokens)
+            text = "A crowd gathers at a street festival with stalls and music."
+            self._send(200, {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": tokens, "candidatesTokenCount": 14,
+                                  "totalTokenCount": tokens + 14},
+                "modelVersion": "fake-model",
+            })
+
+    return Handler
+
+
+def serve(model, host="127.0.0.1", port=8090):
+    """Start serving `model` in a daemon thread; returns the server (port=0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(model))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-model-server", daemon=True).start()
+    return server
+
+
+def add_model_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="median response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3, help="sigma of the lognormal latency")
+    parser.add_argument("--load-factor", type=float, default=1.0,
+                        help="extra latency at full capacity, as a multiple of the base latency")
+    parser.add_argument("--capacity", type=int, default=8, help="requests in flight before 429s (0 = unlimited)")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of requests taking --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--seconds-per-mb", type=float, default=0.0, help="extra latency per MB of request body")
+    parser.add_argument("--seconds-per-ktoken", type=float, default=0.0,
+                        help="extra latency per 1000 input tokens")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def model_from_args(args):
+    return FakeModel(latency=args.latency, jitter=args.jitter, load_factor=args.load_factor,
+                     capacity=args.capacity, rpm=args.rpm, error_rate=args.error_rate,
+                     tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                     seconds_per_mb=args.seconds_per_mb, seconds_per_ktoken=args.seconds_per_ktoken,
+                     seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_model_arguments(parser)
+    args = parser.parse_args()
+    server = serve(model_from_args(args), args.host, args.port)
+    print(f"Fake model server on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,10 @@
+import importlib
 
-from . import agent
\ No newline at end of file
+
+def __getattr__(name):
+    # ADK finds root_agent through `package.agent`; import it on first access so the
+    # lightweight modules (pre_extract, db_writer, model_governor, ...) can be used
+    # without building the Gemini client and LlmAgent
+    if name == "agent":
+        return importlib.import_module(".agent", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,53 +8,62 @@ from google.adk.tools.function_tool import FunctionTool
 import google.generativeai as genai
 
 from . import prompt
+from .media_cache import CachedMedia, MediaDownloadError, get_media_cache
+from .db_writer import REPORT_COLUMNS, get_report_writer, make_report_row
+from .analysis_cache import get_analysis_cache, image_dhash, prompt_version
+from .metrics import span
+from .model_governor import estimate_tokens, get_governor
+from .media_preprocess import preprocess, preprocess_settings
 
 MODEL = "gemini-2.0-flash"
 
 
 from google import genai
+import os
+import time
 import requests
-from io import BytesIO
-import mimetypes
 from typing import Optional, Tuple
-from google.genai.types import HttpOptions, Part
+from google.genai.types import GenerateContentConfig, HttpOptions, Part
 
 GEMINI_MODEL="gemini-2.0-flash"
-client = genai.Client(vertexai="true", project="omega-baton-467115-p2", location="us-central1")
+ANALYSIS_MODEL = "gemini-2.5-flash"
+# Point the client at benchmarks/fake_model_server.py (or any other generateContent endpoint)
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+if GEMINI_BASE_URL:
+    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", "fake"),
+                          http_options=HttpOptions(base_url=GEMINI_BASE_URL))
+else:
+    client = genai.Client(vertexai="true", project="omega-baton-467115-p2", location="us-central1")
 
 
-def download_media_from_url(url: str) -> Tuple[Optional[bytes], Optional[str]]:
+def fetch_media(url: str) -> Optional[CachedMedia]:
     """
-    Downloads media (image, audio, video) from a URL and returns its bytes and inferred MIME type.
+    Downloads media (image, audio, video) from a URL into the on-disk media cache (see
+    media_cache.py), so repeat URLs are only revalidated and oversized or non-media responses
+    are abandoned early. Returns None on failure.
     """
     try:
-        response = requests.get(url, stream=True, timeout=30) # Increased timeout for larger files
-        response.raise_for_status()
-        media_bytes = BytesIO(response.content).read()
-        
-        # Try to infer MIME type from URL or content
-        mime_type, _ = mimetypes.guess_type(url)
-        if not mime_type: # Fallback if guess_type fails on URL
-            # This is a very basic attempt and might not be accurate for all files.
-            # For robust production systems, you might need a more sophisticated content-type detection.
-            content_type_header = response.headers.get('Content-Type')
-            if content_type_header:
-                mime_type = content_type_header.split(';')[0].strip()
-
-        if not mime_type:
-            print(f"Warning: Could not infer MIME type for {url}. Defaulting to application/octet-stream.")
-            mime_type = "application/octet-stream" # Generic fallback
-
-        return media_bytes, mime_type
+        with span("media_download"):
+            return get_media_cache().fetch(url)
     except requests.exceptions.Timeout:
         print(f"Error: Request timed out while downloading media from {url}")
-        return None, None
     except requests.exceptions.RequestException as e:
         print(f"Error downloading media from {url}: {e}")
-        return None, None
+    except MediaDownloadError as e:
+        print(f"Error downloading media from {url}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred while downloading media: {e}")
+    return None
+
+
+def download_media_from_url(url: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Downloads media (image, audio, video) from a URL and returns its bytes and inferred MIME type.
+    """
+    media = fetch_media(url)
+    if media is None:
         return None, None
+    return media.read(), media.mime_type
 
 
 def analyse_media(media_url: str) -> str:
@@ -62,10 +71,11 @@ def analyse_media(media_url: str) -> str:
     try:
         contents = []
 
-        media_bytes, mime_type = download_media_from_url(media_url)
-        if media_bytes is None:
+        media = fetch_media(media_url)
+        if media is None:
             return f"Failed to download media from {media_url}."
-        
+        mime_type = media.mime_type
+
         if mime_type is None:
             return f"Failed to determine MIME type for media from {media_url}."
         
@@ -94,17 +104,34 @@ def analyse_media(media_url: str) -> str:
                 "Focus on what is happening or being communicated."
                 "do not add the image shows the media shows and the audio tells in the begining of summary"
             )
-        print(f"Analyzing media from {media_url} with MIME type {mime_type}...")
-        
 
-        media_part = Part.from_bytes(data=media_bytes, mime_type=mime_type)
+        # The feeds reuse a handful of images, so most analyses are already cached
+        cache = get_analysis_cache()
+        version = prompt_version(ANALYSIS_MODEL, prompt + preprocess_settings())
+        phash = image_dhash(media.path) if mime_type.startswith('image/') else None
+        cached = cache.get(media.sha256, mime_type, version, phash)
+        if cached is not None:
+            print(f"Using cached analysis for {media_url} ({cache.counters()})")
+            return cached
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[prompt, media_part],
-        )
+        print(f"Analyzing media from {media_url} with MIME type {mime_type}...")
+        # Downscaled image, video keyframes plus trimmed audio, or trimmed audio (see media_preprocess.py)
+        prepared = preprocess(media.path, mime_type)
+        print(f"Sending {prepared.sent_bytes} of {prepared.original_bytes} bytes in {len(prepared.parts)} parts")
+        contents = [prompt] + ([prepared.note] if prepared.note else [])
+        contents += [Part.from_bytes(data=part.data, mime_type=part.mime_type) for part in prepared.parts]
+        started = time.monotonic()
+        with span("gemini_generate"):
+            # Rate limits, adaptive concurrency and retries shared with every other model call
+            response = get_governor().call(
+                lambda timeout: client.models.generate_content(
+                    model=ANALYSIS_MODEL, contents=contents,
+                    # The governor's remaining deadline, so a hung request frees its slot
+                    config=GenerateContentConfig(http_options=HttpOptions(timeout=int(timeout * 1000)))),
+                tokens=estimate_tokens(contents), kind="analyse_media")
         if response is None or not response.text:
             return f"No content generated for media from {media_url}."
+        cache.put(media.sha256, mime_type, version, response.text, time.monotonic() - started, phash)
         return response.text
     
     except Exception as e:
@@ -113,13 +140,17 @@ def analyse_media(media_url: str) -> str:
 
 
 
-def inset_into_db(location: str, event_description: str, start_time: str):
+def inset_into_db(location: str, event_description: str, start_time: str, source_post_id: str = "") -> dict:
     """
-    Placeholder function to insert data into the database.
-    This should be replaced with actual database insertion logic.
+    Insert an extracted event into the reports table.
+    Rows are buffered and written in bulk (see db_writer.py); source_post_id (the id of the
+    post the event came from) makes replays of the same post update its row instead of
+    adding a duplicate.
     """
-    return print(f"Inserting into DB: Location={location}, Event Description={event_description}, Start Time={start_time}")
-    # Implement actual DB insertion logic here
+    row = make_report_row(location, event_description, start_time, source_post_id or None)
+    get_report_writer().write(row)
+    print(f"Inserting into DB: Location={location}, Event Description={event_description}, Start Time={start_time}")
+    return dict(zip(REPORT_COLUMNS, row))
 data_ingestion_agent = LlmAgent(
     name="data_ingestion_agent",
     model=MODEL,
@@ -0,0 +1,180 @@
+"""Persistent cache of media analyses, with a perceptual-hash index for near-duplicate images."""
+
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    print("WARNING: Pillow is not installed; near-duplicate image lookups are disabled.")
+
+from .metrics import METRICS, Counter
+
+ANALYSIS_CACHE_PATH = os.environ.get(
+    "ANALYSIS_CACHE_PATH", os.path.join(tempfile.gettempdir(), "data_ingestion_analysis_cache.sqlite3"))
+# Seconds an analysis stays valid
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", 7 * 24 * 3600))
+# Entries kept before the least recently used ones are evicted
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", 10000))
+# Largest Hamming distance (of 64 bits) between image dHashes treated as the same picture.
+# Candidates are found through four 16-bit bands, which is exhaustive up to a distance of 3.
+ANALYSIS_PHASH_MAX_DISTANCE = int(os.environ.get("ANALYSIS_PHASH_MAX_DISTANCE", 3))
+PHASH_BANDS = 4
+
+ANALYSIS_CACHE_LOOKUPS = Counter(METRICS.prefix + "analysis_cache_lookups_total",
+                                 "analyse_media cache lookups by result (hits, near_hits, misses)", ("result",),
+                                 registry=METRICS)
+ANALYSIS_CACHE_SAVED_SECONDS = Counter(METRICS.prefix + "analysis_cache_saved_seconds_total",
+                                       "Model time the cached analyses took when they were made", registry=METRICS)
+
+
+def prompt_version(model: str, prompt: str) -> str:
+    """Short fingerprint of the model and prompt; editing either invalidates old analyses."""
+    return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()[:16]
+
+
+def image_dhash(path: str) -> Optional[int]:
+    """64-bit difference hash of an image file, or None if Pillow can't read it."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (64, 64))  # let JPEG decode at reduced size
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception as e:
+        print(f"Could not compute perceptual hash for {path}: {e}")
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _bands(phash):
+    return [(phash >> (16 * i)) & 0xFFFF for i in range(PHASH_BANDS)]
+
+
+def _to_signed(phash):
+    # SQLite integers are signed 64-bit
+    return phash - (1 << 64) if phash >= (1 << 63) else phash
+
+
+class AnalysisCache:
+    """
+    SQLite-backed map from (content SHA-256, MIME type, prompt version) to the
+    model's analysis. Images additionally carry a dHash so re-encoded or resized
+    copies of an already analysed picture are answered from the cache too.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_PATH, ttl=ANALYSIS_CACHE_TTL,
+                 max_entries=ANALYSIS_CACHE_MAX_ENTRIES, max_distance=ANALYSIS_PHASH_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS analyses (
+                sha256 TEXT NOT NULL, mime_type TEXT NOT NULL, prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL, latency REAL NOT NULL, phash INTEGER,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                created_at REAL NOT NULL, last_hit REAL NOT NULL,
+                PRIMARY KEY (sha256, mime_type, prompt_version));
+            CREATE INDEX IF NOT EXISTS analyses_last_hit_idx ON analyses (last_hit);
+            CREATE INDEX IF NOT EXISTS analyses_band0_idx ON analyses (prompt_version, band0);
+            CREATE INDEX IF NOT EXISTS analyses_band1_idx ON analyses (prompt_version, band1);
+            CREATE INDEX IF NOT EXISTS analyses_band2_idx ON analyses (prompt_version, band2);
+            CREATE INDEX IF NOT EXISTS analyses_band3_idx ON analyses (prompt_version, band3);
+            """
+        )
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "saved_latency_s": 0.0}
+
+    def get(self, sha256, mime_type, version, phash=None) -> Optional[str]:
+        """Cached analysis for this content, or for a near-identical image when `phash` is given."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT rowid, result, latency FROM analyses "
+                "WHERE sha256 = ? AND mime_type = ? AND prompt_version = ? AND created_at > ?",
+                (sha256, mime_type, version, now - self.ttl)).fetchone()
+            kind = "hits"
+            if row is None and phash is not None:
+                row = self._nearest(version, phash, now)
+                kind = "near_hits"
+            if row is None:
+                self._stats["misses"] += 1
+                ANALYSIS_CACHE_LOOKUPS.labels("misses").inc()
+                return None
+            rowid, result, latency = row
+            with self._db:
+                self._db.execute("UPDATE analyses SET last_hit = ? WHERE rowid = ?", (now, rowid))
+            self._stats[kind] += 1
+            self._stats["saved_latency_s"] += latency
+        ANALYSIS_CACHE_LOOKUPS.labels(kind).inc()
+        ANALYSIS_CACHE_SAVED_SECONDS.inc(latency)
+        return result
+
+    def _nearest(self, version, phash, now):
+        bands = _bands(phash)
+        candidates = self._db.execute(
+            "SELECT rowid, result, latency, phash FROM analyses WHERE prompt_version = ? AND created_at > ? "
+            "AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+            (version, now - self.ttl, *bands)).fetchall()
+        best = None
+        for rowid, result, latency, other in candidates:
+            distance = bin((other & 0xFFFFFFFFFFFFFFFF) ^ phash).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, (rowid, result, latency))
+        return best[1] if best else None
+
+    def put(self, sha256, mime_type, version, result, latency, phash=None):
+        """Store an analysis that took `latency` seconds of model time."""
+        now = time.time()
+        bands = _bands(phash) if phash is not None else [None] * PHASH_BANDS
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analyses (sha256, mime_type, prompt_version, result, latency, phash, "
+                "band0, band1, band2, band3, created_at, last_hit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, mime_type, version, result, latency,
+                 _to_signed(phash) if phash is not None else None, *bands, now, now))
+            self._db.execute("DELETE FROM analyses WHERE created_at <= ?", (now - self.ttl,))
+            excess = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM analyses WHERE rowid IN "
+                    "(SELECT rowid FROM analyses ORDER BY last_hit LIMIT ?)", (excess,))
+
+    def counters(self):
+        """Hit/miss counters and hit rate, without touching the database (cheap enough to log per lookup)."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def stats(self):
+        stats = self.counters()
+        with self._lock:
+            stats["entries"] = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Process-wide AnalysisCache, created on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
@@ -0,0 +1,298 @@
+"""Buffered, idempotent bulk writes of extracted events into the reports table."""
+
+import os
+import time
+import atexit
+import hashlib
+import threading
+from datetime import datetime
+from importlib import import_module
+
+import psycopg2
+
+from .metrics import METRICS, Counter, span
+
+# Same variables as social_media/db_pool.py, but the host and password have no
+# defaults: the writer refuses to start without them (see BulkReportWriter)
+POSTGRES_CONFIG = {
+    'host': os.environ.get('POSTGRES_HOST'),
+    'user': os.environ.get('POSTGRES_USER', 'postgres'),
+    'password': os.environ.get('POSTGRES_PASSWORD'),
+    'dbname': os.environ.get('POSTGRES_DB', 'postgres'),
+    'port': int(os.environ.get('POSTGRES_PORT', 5432))
+}
+# "module:callable" replacing psycopg2.connect, e.g. social_media's pg_standin:connect
+PG_CONNECT_FACTORY = os.environ.get("PG_CONNECT_FACTORY")
+
+# Flush once this many rows are buffered...
+DB_WRITER_BATCH_SIZE = int(os.environ.get("DB_WRITER_BATCH_SIZE", 200))
+# ...or once the oldest buffered row is this many seconds old
+DB_WRITER_FLUSH_INTERVAL = float(os.environ.get("DB_WRITER_FLUSH_INTERVAL", 1.0))
+# Rows buffered at most; writers wait up to DB_WRITER_PUT_TIMEOUT seconds for room,
+# then the oldest rows are dropped (only happens while the database is unreachable)
+DB_WRITER_MAX_BUFFER = int(os.environ.get("DB_WRITER_MAX_BUFFER", 10000))
+DB_WRITER_PUT_TIMEOUT = float(os.environ.get("DB_WRITER_PUT_TIMEOUT", 5))
+# Add reports.source_post_id and its unique index on connect. Off by default: the
+# upsert needs them, but DDL belongs in a migration run once, not in every worker
+DB_WRITER_ENSURE_SCHEMA = os.environ.get("DB_WRITER_ENSURE_SCHEMA", "0") == "1"
+REQUIRED_CONFIG = ("host", "password")
+
+REPORT_COLUMNS = ("source_post_id", "title", "description", "location", "timestamp", "category",
+                  "latitude", "longitude")
+# Replays of the same post update the existing row instead of adding another
+UPSERT_SQL = (
+    "INSERT INTO reports (" + ", ".join(REPORT_COLUMNS) + ") VALUES {values} "
+    "ON CONFLICT (source_post_id) DO UPDATE SET "
+    + ", ".join(f"{c} = EXCLUDED.{c}" for c in REPORT_COLUMNS if c != "source_post_id")
+)
+ROW_PLACEHOLDER = "(" + ", ".join(["%s"] * len(REPORT_COLUMNS)) + ")"
+SOURCE_POST_ID_SQL = [
+    "ALTER TABLE reports ADD COLUMN IF NOT EXISTS source_post_id TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS reports_source_post_id_key ON reports (source_post_id)",
+]
+TITLE_LENGTH = 80
+RETRY_BACKOFF_MAX = 30
+
+REPORTS_DROPPED = Counter(METRICS.prefix + "reports_dropped_total",
+                          "Report rows dropped because the write buffer was full", ("reason",), registry=METRICS)
+REPORTS_UNPARSED_TIME = Counter(METRICS.prefix + "reports_unparsed_time_total",
+                                "Report rows written without a timestamp because start_time did not parse",
+                                registry=METRICS)
+
+
+def _connect_fn():
+    if not PG_CONNECT_FACTORY:
+        return psycopg2.connect
+    module_name, _, attr = PG_CONNECT_FACTORY.partition(":")
+    return getattr(import_module(module_name), attr or "connect")
+
+
+def _parse_start_time(start_time):
+    try:
+        return datetime.fromisoformat(str(start_time).replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        # NULL rather than a made-up time: the write time would pass for when the event started
+        print(f"Unparseable start time {start_time!r}; storing the report without one.")
+        REPORTS_UNPARSED_TIME.inc()
+        return None
+
+
+def make_report_row(location, event_description, start_time, source_post_id=None,
+                    category=None, latitude=None, longitude=None):
+    """One reports row; without a post id the content itself identifies the row."""
+    description = (event_description or "").strip()
+    if not source_post_id:
+        key = f"{location}\n{description}\n{start_time}".encode()
+        source_post_id = "sha256:" + hashlib.sha256(key).hexdigest()[:32]
+    title = description.split(". ")[0][:TITLE_LENGTH] or "Untitled event"
+    return (str(source_post_id), title, description, location, _parse_start_time(start_time), category,
+            latitude, longitude)
+
+
+class BulkReportWriter:
+    """
+    Buffers report rows and writes them with one multi-row
+    INSERT ... ON CONFLICT (source_post_id) DO UPDATE per flush, so the agent's
+    per-post calls cost a dictionary insert rather than a database round trip.
+
+    A background thread flushes when batch_size rows are waiting or the oldest
+    has waited flush_interval seconds; close() (registered with atexit) flushes
+    whatever is left. Rows for the same post id are merged in the buffer, and a
+    failed flush keeps its rows for the next attempt.
+    """
+
+    def __init__(self, config=None, batch_size=DB_WRITER_BATCH_SIZE, flush_interval=DB_WRITER_FLUSH_INTERVAL,
+                 max_buffer=DB_WRITER_MAX_BUFFER, connect=None, ensure_schema=DB_WRITER_ENSURE_SCHEMA):
+        self.config = dict(config or POSTGRES_CONFIG)
+        missing = [key for key in REQUIRED_CONFIG if not self.config.get(key)]
+        if missing and connect is None and not PG_CONNECT_FACTORY:
+            raise RuntimeError("Report writer has no database " + " or ".join(missing)
+                               + "; set POSTGRES_" + " and POSTGRES_".join(k.upper() for k in missing))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._connect = connect or _connect_fn()
+        self._ensure_schema = ensure_schema
+        self._conn = None
+        self._buffer = {}  # source_post_id -> row, in arrival order
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time; the connection is not shared
+        self._closed = False
+        self._failures = 0
+        self._retry_at = 0.0  # no flush attempts before this time after a failure
+        self._stats = {"rows_buffered": 0, "rows_written": 0, "rows_dropped": 0, "flushes": 0,
+                       "flush_errors": 0, "last_flush_rows": 0, "last_flush_s": 0.0, "max_flush_s": 0.0,
+                       "total_flush_s": 0.0}
+        self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, row):
+        """Buffer one row built by make_report_row."""
+        with self._cond:
+            deadline = time.monotonic() + DB_WRITER_PUT_TIMEOUT
+            while len(self._buffer) >= self.max_buffer and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+            self._buffer.pop(row[0], None)
+            self._buffer[row[0]] = row
+            self._stats["rows_buffered"] += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._cond.notify_all()  # start the flusher's age timer
+            self._drop_oldest("buffer_full")
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._cond.wait(backoff)
+                        continue
+                    if len(self._buffer) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def _take(self):
+        with self._cond:
+            rows = list(self._buffer.values())
+            self._buffer = {}
+            self._oldest = None
+            self._cond.notify_all()  # wake writers waiting for room
+        return rows
+
+    def _restore(self, rows):
+        # Put failed rows back in front of anything written since, unless newer
+        with self._cond:
+            merged = {row[0]: row for row in rows}
+            merged.update(self._buffer)
+            self._buffer = merged
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._drop_oldest("flush_failed")
+
+    def _drop_oldest(self, reason):
+        # Called with _cond held; the rows are lost, so say so loudly and count them
+        dropped = 0
+        while len(self._buffer) > self.max_buffer:
+            self._buffer.pop(next(iter(self._buffer)))
+            dropped += 1
+        if dropped:
+            self._stats["rows_dropped"] += dropped
+            REPORTS_DROPPED.labels(reason).inc(dropped)
+            print(f"ERROR: report buffer full ({self.max_buffer} rows, {reason}); "
+                  f"dropped the {dropped} oldest, {self._stats['rows_dropped']} in total")
+
+    def flush(self):
+        """Write everything buffered now; returns the number of rows written."""
+        with self._flush_lock:
+            rows = self._take()
+            if not rows:
+                return 0
+            start = time.monotonic()
+            try:
+                with span("db_flush"):
+                    conn = self._connection()
+                    cur = conn.cursor()
+                    try:
+                        for i in range(0, len(rows), self.batch_size):
+                            chunk = rows[i:i + self.batch_size]
+                            cur.execute(UPSERT_SQL.format(values=", ".join([ROW_PLACEHOLDER] * len(chunk))),
+                                        [v for row in chunk for v in row])
+                    finally:
+                        cur.close()
+                    conn.commit()
+            except Exception as e:
+                print(f"Error flushing {len(rows)} reports, will retry: {e}")
+                self._reset_connection()
+                self._restore(rows)
+                with self._cond:
+                    self._stats["flush_errors"] += 1
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + min(RETRY_BACKOFF_MAX, 2 ** self._failures)
+                return 0
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self._failures = 0
+                stats = self._stats
+                stats["flushes"] += 1
+                stats["rows_written"] += len(rows)
+                stats["last_flush_rows"] = len(rows)
+                stats["last_flush_s"] = elapsed
+                stats["max_flush_s"] = max(stats["max_flush_s"], elapsed)
+                stats["total_flush_s"] += elapsed
+            return len(rows)
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect(**self.config)
+            if self._ensure_schema:
+                self._add_source_post_id()
+        return self._conn
+
+    def _add_source_post_id(self):
+        cur = self._conn.cursor()
+        try:
+            for sql in SOURCE_POST_ID_SQL:
+                cur.execute(sql)
+            self._conn.commit()
+        except Exception as e:
+            self._conn.rollback()
+            print(f"Could not ensure reports.source_post_id (assuming it exists): {e}")
+        finally:
+            cur.close()
+
+    def _reset_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+        self._reset_connection()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["buffered"] = len(self._buffer)
+        stats["avg_flush_rows"] = stats["rows_written"] / stats["flushes"] if stats["flushes"] else 0
+        stats["avg_flush_s"] = stats["total_flush_s"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_report_writer() -> BulkReportWriter:
+    """Process-wide BulkReportWriter, created (and its flush thread started) on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BulkReportWriter()
+        return _writer
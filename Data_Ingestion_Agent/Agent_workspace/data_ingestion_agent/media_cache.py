@@ -0,0 +1,278 @@
+"""Streaming media downloads into a size-capped, content-addressed disk cache."""
+
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import mimetypes
+from typing import NamedTuple, Optional
+
+import requests
+
+from .metrics import METRICS, Counter
+
+# Where downloaded media is kept; blobs are named by the SHA-256 of their bytes
+MEDIA_CACHE_DIR = os.environ.get(
+    "MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data_ingestion_media_cache"))
+# Total bytes kept on disk before least recently used blobs are evicted
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get("MEDIA_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# Largest single download; Gemini only accepts ~20 MB of inline media per request anyway
+MEDIA_MAX_DOWNLOAD_BYTES = int(os.environ.get("MEDIA_MAX_DOWNLOAD_BYTES", 20 * 1024 * 1024))
+# Seconds a cached URL is served without asking the origin again
+MEDIA_CACHE_FRESH_SECONDS = int(os.environ.get("MEDIA_CACHE_FRESH_SECONDS", 300))
+DOWNLOAD_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_CACHE_REQUESTS = Counter(METRICS.prefix + "media_cache_requests_total",
+                               "Media fetches by result (fresh hits, revalidated by 304, downloaded)", ("result",),
+                               registry=METRICS)
+MEDIA_CACHE_SAVED_BYTES = Counter(METRICS.prefix + "media_cache_saved_bytes_total",
+                                  "Bytes served from the cache instead of downloaded", registry=METRICS)
+
+# (offset, magic bytes, MIME type); checked in order against the first chunk
+MAGIC_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+]
+RIFF_TYPES = {b"WEBP": "image/webp", b"WAVE": "audio/wav", b"AVI ": "video/x-msvideo"}
+# ISO base media (MP4 family) major brands that are not plain video/mp4
+FTYP_BRANDS = {
+    b"qt  ": "video/quicktime",
+    b"M4A ": "audio/mp4",
+    b"M4B ": "audio/mp4",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"mif1": "image/heif",
+    b"3gp4": "video/3gpp",
+    b"3gp5": "video/3gpp",
+}
+MEDIA_TYPE_PREFIXES = ("image/", "video/", "audio/")
+
+
+class MediaDownloadError(Exception):
+    pass
+
+
+class MediaTooLarge(MediaDownloadError):
+    pass
+
+
+class UnsupportedMedia(MediaDownloadError):
+    pass
+
+
+class CachedMedia(NamedTuple):
+    path: str
+    sha256: str
+    mime_type: str
+    size: int
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """MIME type from the leading bytes of a file, or None if unrecognised."""
+    for offset, magic, mime_type in MAGIC_SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime_type
+    if head[:4] == b"RIFF":
+        return RIFF_TYPES.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12], "video/mp4")
+    # MPEG audio frame sync without an ID3 tag
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "audio/mpeg"
+    return None
+
+
+def _declared_mime_type(url, response):
+    content_type = response.headers.get("Content-Type")
+    if content_type:
+        mime_type = content_type.split(";")[0].strip().lower()
+        if mime_type.startswith(MEDIA_TYPE_PREFIXES):
+            return mime_type
+    mime_type, _ = mimetypes.guess_type(url)
+    return mime_type
+
+
+class MediaCache:
+    """
+    On-disk media cache. Blobs live under objects/ named by SHA-256, so the same
+    bytes behind different URLs are stored once; a SQLite index maps each URL to
+    its blob and validators (ETag / Last-Modified) and tracks blob access times
+    for LRU eviction once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory=MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES,
+                 max_download_bytes=MEDIA_MAX_DOWNLOAD_BYTES, fresh_seconds=MEDIA_CACHE_FRESH_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_download_bytes = max_download_bytes
+        self.fresh_seconds = fresh_seconds
+        self._objects = os.path.join(directory, "objects")
+        os.makedirs(self._objects, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, mime_type TEXT NOT NULL,
+                etag TEXT, last_modified TEXT, checked_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS blobs_last_access_idx ON blobs (last_access);
+            """
+        )
+        self._session = requests.Session()
+        self._stats = {"hits": 0, "revalidated": 0, "downloads": 0, "saved_bytes": 0}
+
+    def _blob_path(self, sha256):
+        return os.path.join(self._objects, sha256[:2], sha256)
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT u.sha256, u.mime_type, u.etag, u.last_modified, u.checked_at, b.size "
+                "FROM urls u JOIN blobs b ON b.sha256 = u.sha256 WHERE u.url = ?", (url,)).fetchone()
+        if row and not os.path.exists(self._blob_path(row[0])):
+            return None  # blob removed behind our back; fetch it again
+        return row
+
+    def fetch(self, url) -> CachedMedia:
+        """
+        The media behind `url`, from the cache when still valid, otherwise
+        streamed from the origin. Raises MediaDownloadError (or a requests
+        exception) on failure.
+        """
+        cached = self._lookup(url)
+        headers = {}
+        if cached:
+            sha256, mime_type, etag, last_modified, checked_at, size = cached
+            if time.time() - checked_at < self.fresh_seconds:
+                self._touch(url, sha256, revalidated=False)
+                self._count("hits", size)
+                return CachedMedia(self._blob_path(sha256), sha256, mime_type, size)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        with self._session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if cached and response.status_code == 304:
+                self._touch(url, sha256, revalidated=True)
+                self._count("revalidated", size)
+                return CachedMedia(self._blob_path(sha256), sha256, mime_type, size)
+            response.raise_for_status()
+            media = self._store(url, response)
+        self._count("downloads", 0)
+        return media
+
+    def _count(self, result, saved_bytes):
+        with self._lock:
+            self._stats[result] += 1
+            self._stats["saved_bytes"] += saved_bytes
+        MEDIA_CACHE_REQUESTS.labels(result).inc()
+        if saved_bytes:
+            MEDIA_CACHE_SAVED_BYTES.inc(saved_bytes)
+
+    def _store(self, url, response):
+        declared_length = response.headers.get("Content-Length")
+        if declared_length and declared_length.isdigit() and int(declared_length) > self.max_download_bytes:
+            raise MediaTooLarge(f"{url} is {declared_length} bytes (limit {self.max_download_bytes})")
+
+        digest = hashlib.sha256()
+        size = 0
+        mime_type = None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    if mime_type is None:
+                        # Decide from the first chunk so non-media is never downloaded in full
+                        mime_type = sniff_mime_type(chunk) or _declared_mime_type(url, response)
+                        if not mime_type or not mime_type.startswith(MEDIA_TYPE_PREFIXES):
+                            raise UnsupportedMedia(f"{url} does not look like image, audio or video ({mime_type})")
+                    size += len(chunk)
+                    if size > self.max_download_bytes:
+                        raise MediaTooLarge(f"{url} exceeds {self.max_download_bytes} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise UnsupportedMedia(f"{url} returned an empty body")
+            sha256 = digest.hexdigest()
+            path = self._blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)  # same bytes from another URL simply overwrite themselves
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)", (sha256, size, now))
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, mime_type, etag, last_modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sha256, mime_type, response.headers.get("ETag"), response.headers.get("Last-Modified"), now))
+            self._evict(keep=sha256)
+        return CachedMedia(path, sha256, mime_type, size)
+
+    def _touch(self, url, sha256, revalidated):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (now, sha256))
+            if revalidated:
+                self._db.execute("UPDATE urls SET checked_at = ? WHERE url = ?", (now, url))
+
+    def _evict(self, keep):
+        # Caller holds the lock and the transaction
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for sha256, size in self._db.execute(
+                "SELECT sha256, size FROM blobs WHERE sha256 != ? ORDER BY last_access", (keep,)).fetchall():
+            try:
+                os.unlink(self._blob_path(sha256))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            blobs, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            urls = self._db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            stats = dict(self._stats)
+        fetches = stats["hits"] + stats["revalidated"] + stats["downloads"]
+        stats["hit_rate"] = (stats["hits"] + stats["revalidated"]) / fetches if fetches else 0.0
+        return dict(stats, urls=urls, blobs=blobs, bytes=total, max_bytes=self.max_bytes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """Process-wide MediaCache, created on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MediaCache()
+        return _cache
@@ -0,0 +1,268 @@
+"""
+Shrinks media before analyse_media sends it to the model. The prompts only ask
+for a one- or two-sentence summary, so the full bytes of a 12-megapixel photo
+or a ten-minute video cost upload time, tokens and latency for nothing:
+
+- images are downscaled to MEDIA_MAX_EDGE pixels on the long edge and
+  re-encoded as JPEG at MEDIA_JPEG_QUALITY (small, supported files are sent
+  as they are when that would not make them smaller)
+- videos become at most MEDIA_VIDEO_MAX_FRAMES keyframes, taken at scene
+  changes and at least every 1/MEDIA_VIDEO_MAX_FRAMES of the video, plus up
+  to MEDIA_AUDIO_MAX_SECONDS of its audio track. Only the encoded keyframes
+  are decoded (encoders place them at cuts), which is an order of magnitude
+  faster than scanning every frame
+- audio loses its leading silence and is cut to MEDIA_AUDIO_MAX_SECONDS
+
+Audio is re-encoded as mono AAC at MEDIA_AUDIO_SAMPLE_RATE. The work runs in
+a forkserver process pool (MEDIA_PREPROCESS_WORKERS, 0 = in the calling
+thread).
+Videos and audio need the ffmpeg binary (MEDIA_FFMPEG); without it, or when
+a step fails, the original file is sent as before.
+"""
+import io
+import os
+import re
+import glob
+import shutil
+import multiprocessing
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, NamedTuple, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("WARNING: Pillow is not installed; images are sent to the model at full size.")
+
+try:
+    from .metrics import span
+except ImportError:
+    # Imported standalone by benchmarks/bench_preprocess.py, without the ADK stack
+    from metrics import span
+
+MEDIA_PREPROCESS = os.environ.get("MEDIA_PREPROCESS", "1") == "1"
+MEDIA_PREPROCESS_WORKERS = int(os.environ.get("MEDIA_PREPROCESS_WORKERS", min(4, os.cpu_count() or 1)))
+# Seconds one file may take before the original is sent instead
+MEDIA_PREPROCESS_TIMEOUT = float(os.environ.get("MEDIA_PREPROCESS_TIMEOUT", 120))
+MEDIA_MAX_EDGE = int(os.environ.get("MEDIA_MAX_EDGE", 1024))
+MEDIA_JPEG_QUALITY = int(os.environ.get("MEDIA_JPEG_QUALITY", 80))
+MEDIA_VIDEO_MAX_FRAMES = int(os.environ.get("MEDIA_VIDEO_MAX_FRAMES", 8))
+# ffmpeg scene score (0-1) above which a frame starts a new scene
+MEDIA_VIDEO_SCENE_THRESHOLD = float(os.environ.get("MEDIA_VIDEO_SCENE_THRESHOLD", 0.3))
+# Seconds between two keyframes at least, and seconds of a video scanned for them
+MEDIA_VIDEO_MIN_GAP = float(os.environ.get("MEDIA_VIDEO_MIN_GAP", 2.0))
+MEDIA_VIDEO_MAX_SECONDS = float(os.environ.get("MEDIA_VIDEO_MAX_SECONDS", 600))
+MEDIA_AUDIO_MAX_SECONDS = float(os.environ.get("MEDIA_AUDIO_MAX_SECONDS", 60))
+MEDIA_AUDIO_SAMPLE_RATE = int(os.environ.get("MEDIA_AUDIO_SAMPLE_RATE", 16000))
+MEDIA_AUDIO_BITRATE = os.environ.get("MEDIA_AUDIO_BITRATE", "32k")
+MEDIA_FFMPEG = os.environ.get("MEDIA_FFMPEG", "ffmpeg")
+
+if shutil.which(MEDIA_FFMPEG) is None:
+    print(f"WARNING: {MEDIA_FFMPEG} not found; videos and audio are sent to the model as they are.")
+
+# Image types the model accepts as they are
+SUPPORTED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+# Supported images this small and within MEDIA_MAX_EDGE are not worth re-encoding
+SMALL_IMAGE_BYTES = 256 * 1024
+# Scene-change candidates kept before picking MEDIA_VIDEO_MAX_FRAMES spread over the video
+CANDIDATES_PER_FRAME = 4
+FRAME_QSCALE = 4  # ffmpeg JPEG quality, 2 (best) to 31
+SILENCE_THRESHOLD = "-45dB"
+DURATION_RE = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class MediaPart(NamedTuple):
+    data: bytes
+    mime_type: str
+
+
+class PreparedMedia(NamedTuple):
+    parts: List[MediaPart]
+    note: Optional[str]  # text sent ahead of the parts, describing what they are
+    original_bytes: int
+
+    @property
+    def sent_bytes(self) -> int:
+        return sum(len(part.data) for part in self.parts)
+
+
+def preprocess_settings() -> str:
+    """The settings that change what the model sees, for the analysis cache's prompt version."""
+    if not MEDIA_PREPROCESS:
+        return ""
+    return (f"preprocess edge={MEDIA_MAX_EDGE} quality={MEDIA_JPEG_QUALITY} frames={MEDIA_VIDEO_MAX_FRAMES} "
+            f"scene={MEDIA_VIDEO_SCENE_THRESHOLD} gap={MEDIA_VIDEO_MIN_GAP} audio={MEDIA_AUDIO_MAX_SECONDS}s "
+            f"rate={MEDIA_AUDIO_SAMPLE_RATE} bitrate={MEDIA_AUDIO_BITRATE}")
+
+
+def as_is(path: str, mime_type: str) -> PreparedMedia:
+    """The file sent unchanged, as one part."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return PreparedMedia([MediaPart(data, mime_type)], None, len(data))
+
+
+def _ffmpeg(*args):
+    subprocess.run([MEDIA_FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", *args],
+                   check=True, capture_output=True, timeout=MEDIA_PREPROCESS_TIMEOUT)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _image(path, mime_type):
+    if Image is None:
+        return as_is(path, mime_type)
+    size = os.path.getsize(path)
+    with Image.open(path) as img:
+        if max(img.size) <= MEDIA_MAX_EDGE and mime_type in SUPPORTED_IMAGE_TYPES and size < SMALL_IMAGE_BYTES:
+            return as_is(path, mime_type)
+        img.draft("RGB", (MEDIA_MAX_EDGE, MEDIA_MAX_EDGE))  # let JPEG decode at reduced size
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((MEDIA_MAX_EDGE, MEDIA_MAX_EDGE), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True)
+        data = out.getvalue()
+    if len(data) >= size and mime_type in SUPPORTED_IMAGE_TYPES:
+        return as_is(path, mime_type)
+    return PreparedMedia([MediaPart(data, "image/jpeg")], None, size)
+
+
+def _audio_track(path, directory, trim_silence):
+    """Mono AAC of the (first MEDIA_AUDIO_MAX_SECONDS of the) audio, or None if there is none."""
+    out = os.path.join(directory, "audio.aac")
+    args = ["-i", path, "-vn", "-map", "0:a:0"]
+    if trim_silence:
+        args += ["-af", f"silenceremove=start_periods=1:start_duration=0.2:start_threshold={SILENCE_THRESHOLD}"]
+    args += ["-t", str(MEDIA_AUDIO_MAX_SECONDS), "-ac", "1", "-ar", str(MEDIA_AUDIO_SAMPLE_RATE),
+             "-c:a", "aac", "-b:a", MEDIA_AUDIO_BITRATE, "-f", "adts", out]
+    try:
+        _ffmpeg(*args)
+    except subprocess.CalledProcessError:
+        return None  # no audio stream
+    data = _read(out)
+    return data or None
+
+
+def _spread(items, count):
+    """`count` items evenly spaced over `items`, first and last included."""
+    if len(items) <= count:
+        return items
+    if count == 1:
+        return items[:1]
+    return [items[round(i * (len(items) - 1) / (count - 1))] for i in range(count)]
+
+
+def _duration(path):
+    """Seconds of media in the file, from ffmpeg's probe output, or None."""
+    result = subprocess.run([MEDIA_FFMPEG, "-hide_banner", "-nostdin", "-i", path],
+                            capture_output=True, timeout=MEDIA_PREPROCESS_TIMEOUT)
+    match = DURATION_RE.search(result.stderr)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _video(path, mime_type):
+    size = os.path.getsize(path)
+    scanned = min(_duration(path) or MEDIA_VIDEO_MAX_SECONDS, MEDIA_VIDEO_MAX_SECONDS)
+    interval = max(MEDIA_VIDEO_MIN_GAP, scanned / MEDIA_VIDEO_MAX_FRAMES)
+    with tempfile.TemporaryDirectory(prefix="media_preprocess_") as directory:
+        # The first keyframe, then any opening a new scene at least MEDIA_VIDEO_MIN_GAP
+        # after the last one taken, or `interval` after it when nothing changes
+        select = (f"select='eq(n,0)+gte(t-prev_selected_t,{interval:.3f})"
+                  f"+gt(scene,{MEDIA_VIDEO_SCENE_THRESHOLD})*gte(t-prev_selected_t,{MEDIA_VIDEO_MIN_GAP})'")
+        scale = (f"scale='min({MEDIA_MAX_EDGE},iw)':'min({MEDIA_MAX_EDGE},ih)'"
+                 ":force_original_aspect_ratio=decrease")
+        _ffmpeg("-skip_frame", "nokey", "-t", str(MEDIA_VIDEO_MAX_SECONDS), "-i", path, "-an", "-vf", f"{select},{scale}",
+                "-vsync", "vfr", "-frames:v", str(MEDIA_VIDEO_MAX_FRAMES * CANDIDATES_PER_FRAME),
+                "-q:v", str(FRAME_QSCALE), os.path.join(directory, "frame%04d.jpg"))
+        frames = _spread(sorted(glob.glob(os.path.join(directory, "frame*.jpg"))), MEDIA_VIDEO_MAX_FRAMES)
+        if not frames:
+            raise ValueError("no frames decoded")
+        parts = [MediaPart(_read(frame), "image/jpeg") for frame in frames]
+        audio = _audio_track(path, directory, trim_silence=False)
+    note = f"The video is given as {len(parts)} keyframes in time order"
+    if audio is not None:
+        parts.append(MediaPart(audio, "audio/aac"))
+        note += f", followed by its audio track (at most the first {MEDIA_AUDIO_MAX_SECONDS:g} seconds)"
+    return PreparedMedia(parts, note + ".", size)
+
+
+def _audio(path, mime_type):
+    size = os.path.getsize(path)
+    with tempfile.TemporaryDirectory(prefix="media_preprocess_") as directory:
+        data = _audio_track(path, directory, trim_silence=True)
+    if data is None or len(data) >= size:
+        return as_is(path, mime_type)
+    return PreparedMedia([MediaPart(data, "audio/aac")], None, size)
+
+
+def preprocess_file(path: str, mime_type: str) -> PreparedMedia:
+    """The parts to send the model for the media file at `path` (runs in the worker processes)."""
+    try:
+        if mime_type.startswith("image/"):
+            return _image(path, mime_type)
+        if shutil.which(MEDIA_FFMPEG) is not None:
+            if mime_type.startswith("video/"):
+                return _video(path, mime_type)
+            if mime_type.startswith("audio/"):
+                return _audio(path, mime_type)
+    except Exception as e:
+        print(f"Error preprocessing {mime_type} media {path}, sending it as it is: {e}")
+    return as_is(path, mime_type)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: this process already runs threads (DB writer, media cache, hedges)
+            # whose locks a forked child could inherit held
+            _pool = ProcessPoolExecutor(MEDIA_PREPROCESS_WORKERS,
+                                        mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def preprocess(path: str, mime_type: str) -> PreparedMedia:
+    """preprocess_file in the process pool; the original file if preprocessing is off, fails or times out."""
+    if not MEDIA_PREPROCESS:
+        return as_is(path, mime_type)
+    with span("media_preprocess"):
+        if MEDIA_PREPROCESS_WORKERS <= 0:
+            return preprocess_file(path, mime_type)
+        pool = _get_pool()
+        try:
+            return pool.submit(preprocess_file, path, mime_type).result(MEDIA_PREPROCESS_TIMEOUT)
+        except BrokenProcessPool as e:
+            print(f"Media preprocessing pool failed, starting a new one: {e}")
+            _discard_pool(pool)
+        except Exception as e:
+            print(f"Error preprocessing {mime_type} media {path}, sending it as it is: {e}")
+        return as_is(path, mime_type)
@@ -0,0 +1,61 @@
+"""
+The package's metrics: the data_ingestion_agent_ registry of the repo's
+common/metrics.py when the repo root is importable (inside agent_feeder, the
+benchmarks), else no-op stand-ins. The package is also deployed on its own to
+Vertex AI / ADK, where common/ is not shipped and nothing scrapes /metrics.
+"""
+
+try:
+    from common.metrics import Counter, Gauge, Histogram, get_registry
+except ImportError:
+    print("WARNING: common.metrics is not importable; data_ingestion_agent metrics are disabled.")
+
+    class _NoopMetric:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def labels(self, *values):
+            return self
+
+        def inc(self, amount=1):
+            pass
+
+        def dec(self, amount=1):
+            pass
+
+        def set(self, value):
+            pass
+
+        def set_function(self, function):
+            pass
+
+        def observe(self, value):
+            pass
+
+    Counter = Gauge = Histogram = _NoopMetric
+
+    class _NoopSpan:
+        def __init__(self, name):
+            self.name = name
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def __call__(self, function):
+            return function
+
+    class _NoopRegistry:
+        def __init__(self, prefix):
+            self.prefix = prefix
+
+        def span(self, name):
+            return _NoopSpan(name)
+
+    def get_registry(prefix=""):
+        return _NoopRegistry(prefix)
+
+METRICS = get_registry("data_ingestion_agent_")
+span = METRICS.span
@@ -0,0 +1,494 @@
+"""
+One governor in front of every Gemini call a process makes (analyse_media's
+generate_content, agent_feeder's stream_query), so parallel workers share the
+quota instead of each discovering it through 429s.
+
+    response = get_governor().call(
+        lambda timeout: client.models.generate_content(
+            model=..., contents=contents,
+            config=GenerateContentConfig(http_options=HttpOptions(timeout=int(timeout * 1000)))),
+        tokens=estimate_tokens(contents), kind="analyse_media")
+
+The function gets the seconds left before the call's deadline
+(GEMINI_CALL_TIMEOUT) and must give up by then, typically by passing them on
+as the client's request timeout, so a hung request cannot hold its
+concurrency slot forever.
+
+A call first takes a request and its estimated input tokens from two token
+buckets (GEMINI_RPM, GEMINI_INPUT_TPM), then a slot from an AIMD concurrency
+limit: every success adds 1/limit to it while the limit is what holds callers
+back, a 429 halves it, and once the recent average latency of a kind of call
+exceeds GEMINI_LATENCY_TOLERANCE times its usual fast case (the 10th
+percentile of the last LATENCY_WINDOW calls) it shrinks by 10%. Callers
+waiting for a slot are served in arrival order. 429s, 5xx and connection
+errors are retried with full-jitter exponential backoff (honouring
+Retry-After) until GEMINI_MAX_RETRIES or the call's deadline. With GEMINI_HEDGE_AFTER set, a
+call still running after that many seconds is sent a second time when a
+slot and tokens are free right away, and the first answer wins.
+
+benchmarks/fake_model_server.py serves the generateContent API with injected
+latency and throttling; GEMINI_BASE_URL points agent.py's client at it.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from .metrics import METRICS, Counter, Gauge, Histogram
+except ImportError:
+    # Imported standalone by benchmarks/bench_governor.py, without the ADK stack
+    from metrics import METRICS, Counter, Gauge, Histogram
+
+# Requests and input tokens per minute across every call in this process (0 = unlimited)
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", 600))
+GEMINI_INPUT_TPM = float(os.environ.get("GEMINI_INPUT_TPM", 1000000))
+# Bounds and starting point of the adaptive concurrency limit
+GEMINI_MIN_CONCURRENCY = int(os.environ.get("GEMINI_MIN_CONCURRENCY", 1))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 32))
+GEMINI_INITIAL_CONCURRENCY = int(os.environ.get("GEMINI_INITIAL_CONCURRENCY", 4))
+# Recent latency this many times a kind's usual fast case counts as queueing and shrinks the limit
+GEMINI_LATENCY_TOLERANCE = float(os.environ.get("GEMINI_LATENCY_TOLERANCE", 2.0))
+# Retries after the first attempt, and the backoff bounds in seconds
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 4))
+GEMINI_RETRY_BASE = float(os.environ.get("GEMINI_RETRY_BASE", 1.0))
+GEMINI_RETRY_MAX = float(os.environ.get("GEMINI_RETRY_MAX", 30))
+# Seconds a call may take overall: waiting for tokens and slots, every attempt (each
+# gets the remaining time as its request timeout) and the backoff between them
+GEMINI_CALL_TIMEOUT = float(os.environ.get("GEMINI_CALL_TIMEOUT", 120))
+# Send a second copy of a call still running after this many seconds (0 = never)
+GEMINI_HEDGE_AFTER = float(os.environ.get("GEMINI_HEDGE_AFTER", 0))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 100
+LATENCY_MIN_SAMPLES = 10
+LATENCY_BASELINE_QUANTILE = 0.1
+# Weight of the newest call in the recent latency average
+LATENCY_SMOOTHING = 0.2
+THROTTLE_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+HEDGE_WORKERS = 8
+# Rough input token counts for inline media, corrected from usage_metadata once the
+# response arrives: Gemini bills an image at 258 tokens, video at 263/s and audio at 32/s
+IMAGE_TOKENS = 258
+VIDEO_BYTES_PER_TOKEN = 1000
+AUDIO_BYTES_PER_TOKEN = 500
+
+GEMINI_CALLS = Counter(METRICS.prefix + "gemini_calls_total", "Governed model calls by outcome",
+                       ("kind", "outcome"), registry=METRICS)
+GEMINI_RETRIES = Counter(METRICS.prefix + "gemini_retries_total", "Model call attempts retried",
+                         ("kind", "reason"), registry=METRICS)
+GEMINI_HEDGES = Counter(METRICS.prefix + "gemini_hedges_total", "Hedged model calls sent and won",
+                        ("kind", "result"), registry=METRICS)
+GEMINI_ATTEMPT_SECONDS = Histogram(METRICS.prefix + "gemini_attempt_seconds",
+                                   "Latency of one model call attempt", ("kind", "outcome"), registry=METRICS)
+GEMINI_WAIT_SECONDS = Histogram(METRICS.prefix + "gemini_wait_seconds",
+                                "Time a call waited for rate tokens or a concurrency slot", ("kind",),
+                                registry=METRICS)
+GEMINI_INPUT_TOKENS = Counter(METRICS.prefix + "gemini_input_tokens_total",
+                              "Input tokens charged to the token bucket", ("kind",), registry=METRICS)
+GEMINI_CONCURRENCY_LIMIT = Gauge(METRICS.prefix + "gemini_concurrency_limit",
+                                 "Current adaptive concurrency limit for model calls", registry=METRICS)
+GEMINI_IN_FLIGHT = Gauge(METRICS.prefix + "gemini_in_flight", "Model calls in flight", registry=METRICS)
+
+
+class GovernorTimeout(TimeoutError):
+    pass
+
+
+def error_status(error):
+    """HTTP status of a failed call (google.genai APIError.code, requests' response), or None."""
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error):
+    status = error_status(error)
+    if status is not None:
+        # requests' HTTPError is an OSError too: a 400 or 404 fails the same way every time
+        return status in RETRY_STATUSES
+    # requests' and the builtin connection errors are OSErrors; httpx's are TransportErrors
+    return isinstance(error, OSError) or any(c.__name__ == "TransportError" for c in type(error).__mro__)
+
+
+def retry_after(error):
+    """Seconds from the Retry-After header of a throttled response, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(contents):
+    """Rough input token count of generate_content `contents` (strings and inline-data Parts)."""
+    total = 0
+    for content in contents:
+        if isinstance(content, str):
+            total += len(content) // 4 + 1
+            continue
+        inline = getattr(content, "inline_data", None)
+        data, mime_type = getattr(inline, "data", None) or b"", getattr(inline, "mime_type", None) or ""
+        if mime_type.startswith("image/"):
+            total += IMAGE_TOKENS
+        elif mime_type.startswith("video/"):
+            total += len(data) // VIDEO_BYTES_PER_TOKEN + 1
+        elif mime_type.startswith("audio/"):
+            total += len(data) // AUDIO_BYTES_PER_TOKEN + 1
+        elif getattr(content, "text", None):
+            total += len(content.text) // 4 + 1
+    return total
+
+
+def _prompt_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    value = getattr(usage, "prompt_token_count", None)
+    return value if isinstance(value, int) else None
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, bursting up to `capacity`. take() reserves its
+    tokens right away (the balance may go negative) and returns how long the
+    caller must sleep before using them, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount, max_wait=None):
+        """Seconds to wait for `amount` tokens, or None (nothing taken) if that exceeds max_wait."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            wait_time = max(0.0, (amount - self._tokens) / self.rate)
+            if max_wait is not None and wait_time > max_wait:
+                return None
+            self._tokens -= amount
+            return wait_time
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) `amount` tokens after the fact."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class _Latency:
+    """Recent latencies of one kind of call: a smoothed average and the fast-case baseline."""
+
+    __slots__ = ("window", "average")
+
+    def __init__(self):
+        self.window = deque(maxlen=LATENCY_WINDOW)
+        self.average = None
+
+    def add(self, latency):
+        self.window.append(latency)
+        if self.average is None:
+            self.average = latency
+        else:
+            self.average += LATENCY_SMOOTHING * (latency - self.average)
+
+    def baseline(self):
+        if len(self.window) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.window)
+        return ordered[int(LATENCY_BASELINE_QUANTILE * len(ordered))]
+
+
+class AIMDLimiter:
+    """
+    Adaptive limit on calls in flight: additive increase on healthy calls
+    while the limit is what holds callers back, multiplicative decrease on
+    throttling or queueing latency. Only calls started after the last
+    decrease can cause another one, so one burst of 429s halves it once.
+    Slots go to waiting callers first come, first served.
+    """
+
+    def __init__(self, initial=GEMINI_INITIAL_CONCURRENCY, minimum=GEMINI_MIN_CONCURRENCY,
+                 maximum=GEMINI_MAX_CONCURRENCY, tolerance=GEMINI_LATENCY_TOLERANCE):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._latencies = {}  # kind -> _Latency
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline=None):
+        """Take a slot, waiting until `deadline` (time.monotonic()); returns when the slot was granted."""
+        with self._cond:
+            ticket = object()
+            self._waiters.append(ticket)
+            while self._waiters[0] is not ticket or self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+                    raise GovernorTimeout("no model call slot free before the deadline")
+                self._cond.wait(remaining)
+            self._waiters.popleft()
+            self.in_flight += 1
+            # The next waiter may fit too (the limit can grow by more than one slot)
+            self._cond.notify_all()
+            return time.monotonic()
+
+    def try_acquire(self):
+        with self._cond:
+            if self._waiters or self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, kind, latency=None, throttled=False):
+        """Free a slot taken at `started`; latency is None for a failed call."""
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if throttled:
+                self._decrease(started, THROTTLE_DECREASE)
+            elif latency is not None:
+                recent = self._latencies.setdefault(kind, _Latency())
+                recent.add(latency)
+                baseline = recent.baseline()
+                if baseline is not None and recent.average > self.tolerance * baseline:
+                    self._decrease(started, LATENCY_DECREASE)
+                elif saturated:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, started, factor):
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * factor)
+        self._last_decrease = time.monotonic()
+
+
+class ModelGovernor:
+    """Token buckets, AIMD limiter, retries and hedging around model calls (see module docstring)."""
+
+    def __init__(self, rpm=GEMINI_RPM, input_tpm=GEMINI_INPUT_TPM, limiter=None,
+                 max_retries=GEMINI_MAX_RETRIES, retry_base=GEMINI_RETRY_BASE, retry_max=GEMINI_RETRY_MAX,
+                 timeout=GEMINI_CALL_TIMEOUT, hedge_after=GEMINI_HEDGE_AFTER):
+        # Capacity of one second's worth (at least one call) keeps bursts short
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60))
+        self.tokens = TokenBucket(input_tpm / 60, max(1.0, input_tpm / 60))
+        self.limiter = limiter or AIMDLimiter()
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self._hedge_pool = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "succeeded": 0, "failed": 0, "attempts": 0, "retries": 0,
+                       "throttled": 0, "hedges": 0, "hedge_wins": 0}
+        GEMINI_CONCURRENCY_LIMIT.set_function(lambda: self.limiter.limit)
+        GEMINI_IN_FLIGHT.set_function(lambda: self.limiter.in_flight)
+
+    def _incr(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(concurrency_limit=round(self.limiter.limit, 2), in_flight=self.limiter.in_flight)
+        return stats
+
+    def _admit(self, tokens, kind, deadline):
+        """Wait for a request token, `tokens` input tokens and a slot; returns the slot's start time."""
+        waited = time.monotonic()
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if amount <= 0:
+                continue
+            delay = bucket.take(amount, max_wait=deadline - time.monotonic())
+            if delay is None:
+                raise GovernorTimeout("model call quota exhausted until past the deadline")
+            if delay > 0:
+                time.sleep(delay)
+        started = self.limiter.acquire(deadline)
+        GEMINI_WAIT_SECONDS.labels(kind).observe(time.monotonic() - waited)
+        GEMINI_INPUT_TOKENS.labels(kind).inc(tokens)
+        return started
+
+    def _attempt(self, function, kind, tokens, started, deadline):
+        """One attempt holding the slot taken at `started`; the slot is released here."""
+        self._incr("attempts")
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GovernorTimeout("model call deadline passed before the request was sent")
+            result = function(remaining)
+        except Exception as e:
+            throttled = error_status(e) == 429
+            self.limiter.release(started, kind, throttled=throttled)
+            GEMINI_ATTEMPT_SECONDS.labels(kind, "throttled" if throttled else "error").observe(
+                time.monotonic() - started)
+            if throttled:
+                self._incr("throttled")
+            raise
+        latency = time.monotonic() - started
+        self.limiter.release(started, kind, latency=latency)
+        GEMINI_ATTEMPT_SECONDS.labels(kind, "ok").observe(latency)
+        actual = _prompt_tokens(result)
+        if actual is not None and tokens:
+            self.tokens.adjust(actual - tokens)
+            GEMINI_INPUT_TOKENS.labels(kind).inc(actual - tokens)
+        return result
+
+    def _hedged(self, function, kind, tokens, started, deadline):
+        """Run the attempt in the hedge pool and race a second copy if it is slow."""
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix="gemini-hedge")
+        primary = self._hedge_pool.submit(self._attempt, function, kind, tokens, started, deadline)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        # Only hedge with capacity that is free right now; a hedge must never queue
+        hedge_started = self.limiter.try_acquire()
+        if hedge_started is None:
+            return primary.result()
+        if self.requests.take(1, max_wait=0) is None or self.tokens.take(tokens, max_wait=0) is None:
+            self.limiter.release(hedge_started, kind)
+            return primary.result()
+        self._incr("hedges")
+        GEMINI_HEDGES.labels(kind, "sent").inc()
+        hedge = self._hedge_pool.submit(self._attempt, function, kind, tokens, hedge_started, deadline)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._incr("hedge_wins")
+                        GEMINI_HEDGES.labels(kind, "won").inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        return max(delay, retry_after(error) or 0)
+
+    def call(self, function, tokens=0, kind="generate", hedge=True, timeout=None):
+        """
+        function(timeout) under the governor, retried on transient errors; `timeout`
+        is the seconds left before the call's deadline. `tokens` is the estimated
+        input size (see estimate_tokens); hedge=False for calls that must not run
+        twice.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._incr("calls")
+        attempt = 0
+        while True:
+            started = self._admit(tokens, kind, deadline)
+            try:
+                if hedge and self.hedge_after > 0:
+                    result = self._hedged(function, kind, tokens, started, deadline)
+                else:
+                    result = self._attempt(function, kind, tokens, started, deadline)
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if not is_retryable(e) or attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    self._incr("failed")
+                    GEMINI_CALLS.labels(kind, "failed").inc()
+                    raise
+                attempt += 1
+                self._incr("retries")
+                GEMINI_RETRIES.labels(kind, str(error_status(e) or type(e).__name__)).inc()
+                time.sleep(delay)
+                continue
+            self._incr("succeeded")
+            GEMINI_CALLS.labels(kind, "retried" if attempt else "ok").inc()
+            return result
+
+    def stream(self, function, tokens=0, kind="stream", timeout=None):
+        """
+        Iterate function(timeout)'s events under the governor. Attempts are retried
+        only until the first event arrives (a partial stream cannot be replayed), and
+        the slot is held until the stream ends; its time to first event is the
+        latency the limiter sees.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._incr("calls")
+        attempt = 0
+        while True:
+            started = self._admit(tokens, kind, deadline)
+            self._incr("attempts")
+            first_event = None
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GovernorTimeout("model call deadline passed before the request was sent")
+                for event in function(remaining):
+                    if first_event is None:
+                        first_event = time.monotonic()
+                    yield event
+            except Exception as e:
+                throttled = error_status(e) == 429
+                self.limiter.release(started, kind, throttled=throttled)
+                if throttled:
+                    self._incr("throttled")
+                delay = self._backoff(attempt, e)
+                if (first_event is not None or not is_retryable(e) or attempt >= self.max_retries
+                        or time.monotonic() + delay > deadline):
+                    self._incr("failed")
+                    GEMINI_CALLS.labels(kind, "failed").inc()
+                    raise
+                attempt += 1
+                self._incr("retries")
+                GEMINI_RETRIES.labels(kind, str(error_status(e) or type(e).__name__)).inc()
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # GeneratorExit from a consumer that stopped early
+                self.limiter.release(started, kind)
+                raise
+            latency = (first_event or time.monotonic()) - started
+            self.limiter.release(started, kind, latency=latency)
+            GEMINI_ATTEMPT_SECONDS.labels(kind, "ok").observe(latency)
+            self._incr("succeeded")
+            GEMINI_CALLS.labels(kind, "retried" if attempt else "ok").inc()
+            return
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> ModelGovernor:
+    """The process-wide ModelGovernor every model call goes through."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ModelGovernor()
+        return _governor
@@ -0,0 +1,198 @@
+"""
+Rule-based extraction of location, event description and start time from posts
+that already carry them as structured fields, so the LLM agent is only asked
+for what is missing or uncertain.
+"""
+
+import os
+import re
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+FIELDS = ("location", "event_description", "start_time")
+# Fields below this confidence are left for the agent to work out
+PRE_EXTRACT_MIN_CONFIDENCE = float(os.environ.get("PRE_EXTRACT_MIN_CONFIDENCE", 0.6))
+
+# Words suggesting the text names its own time, so the post time is only a guess
+TIME_CUE_RE = re.compile(
+    r"\b(?:today|tonight|tomorrow|yesterday|morning|afternoon|evening|"
+    r"mon(?:day)?|tue(?:sday)?|wed(?:nesday)?|thu(?:rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?|"
+    r"\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2})\b",
+    re.IGNORECASE,
+)
+# "... at Cubbon Park, Bangalore." style place mentions in free text
+PLACE_RE = re.compile(
+    r"\b(?:at|near|in)\s+((?:[A-Z][\w'&.-]*\s?)+(?:,\s*[A-Z][\w'&.-]*(?:\s[A-Z][\w'&.-]*)*)?)")
+HASHTAG_RE = re.compile(r"\s*#\w*")
+
+
+class Field(NamedTuple):
+    value: Optional[str]
+    confidence: float
+
+
+MISSING = Field(None, 0.0)
+
+
+class PreExtraction(NamedTuple):
+    platform: str
+    post_id: Optional[str]
+    media_url: Optional[str]
+    location: Field
+    event_description: Field
+    start_time: Field
+
+    def missing_fields(self, min_confidence=PRE_EXTRACT_MIN_CONFIDENCE):
+        """Fields the agent still has to determine."""
+        return [name for name in FIELDS if getattr(self, name).confidence < min_confidence]
+
+    def values(self):
+        return {name: getattr(self, name).value for name in FIELDS}
+
+    @property
+    def source_post_id(self):
+        """reports.source_post_id of the post: its id scoped by platform, as ids of different platforms collide."""
+        return f"{self.platform}:{self.post_id}" if self.post_id else None
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _join(*parts):
+    parts = [p for p in (_text(p) for p in parts) if p]
+    return ": ".join(parts) if parts else None
+
+
+def _coordinates(lat, lng):
+    if lat is None or lng is None:
+        return MISSING
+    return Field(f"{lat}, {lng}", 0.6)
+
+
+def _place_in(text, fallback):
+    """A place named in free text, else `fallback`."""
+    match = PLACE_RE.search(text or "")
+    if match:
+        return Field(match.group(1).strip().rstrip("."), 0.7)
+    return fallback
+
+
+def _post_time(value, text):
+    """The post's creation time as a start-time fallback (what the prompt tells the agent to do)."""
+    if value is None:
+        return MISSING
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value, timezone.utc).isoformat()
+    # If the text talks about when it happens, the post time is probably wrong
+    return Field(str(value), 0.4 if TIME_CUE_RE.search(text or "") else 0.7)
+
+
+def detect_platform(item):
+    """Best guess at which platform shape (see SyncedEventStore._format_event) `item` is."""
+    if isinstance(item.get("data"), dict) and "subreddit" in item["data"]:
+        return "reddit"
+    if "venue" in item or "start" in item:
+        return "eventbrite"
+    if "caption" in item:
+        return "instagram"
+    if "geo" in item and "text" in item:
+        return "twitter"
+    if "title" in item:
+        return "nammasuttu"
+    return None
+
+
+def _twitter(item):
+    text = _text(item.get("text"))
+    geo = item.get("geo") or {}
+    coords = geo.get("coordinates") or {}
+    location = Field(_text(geo.get("place_name")), 0.9) if _text(geo.get("place_name")) else \
+        _place_in(text, _coordinates(coords.get("latitude"), coords.get("longitude")))
+    return location, Field(text, 0.8) if text else MISSING, _post_time(item.get("created_at"), text)
+
+
+def _reddit(item):
+    data = item.get("data") or {}
+    geo = data.get("geo") or {}
+    description = _join(data.get("title"), data.get("selftext"))
+    location = _place_in(data.get("selftext"), _coordinates(geo.get("lat"), geo.get("lng")))
+    return location, Field(description, 0.8) if description else MISSING, \
+        _post_time(data.get("created_utc"), description)
+
+
+def _instagram(item):
+    caption = _text(HASHTAG_RE.sub("", item.get("caption") or ""))
+    place = item.get("location") or {}
+    location = Field(_text(place.get("name")), 0.9) if _text(place.get("name")) else \
+        _place_in(caption, _coordinates(place.get("latitude"), place.get("longitude")))
+    # A short caption says little about the event; the media analysis would have to
+    description = Field(caption, 0.7 if len(caption.split()) >= 3 else 0.4) if caption else MISSING
+    return location, description, _post_time(item.get("timestamp"), caption)
+
+
+def _eventbrite(item):
+    address = (item.get("venue") or {}).get("address") or {}
+    display = _text(address.get("localized_address_display"))
+    description = _join((item.get("name") or {}).get("text"), (item.get("description") or {}).get("text"))
+    start = _text((item.get("start") or {}).get("local"))
+    return (
+        Field(display, 0.95) if display else _coordinates(address.get("latitude"), address.get("longitude")),
+        Field(description, 0.9) if description else MISSING,
+        Field(start, 0.95) if start else MISSING,  # the event's own start, not a post time
+    )
+
+
+def _nammasuttu(item):
+    location = _text(item.get("location"))
+    description = _join(item.get("title"), item.get("description"))
+    return (
+        Field(location, 0.9) if location else _coordinates(item.get("latitude"), item.get("longitude")),
+        Field(description, 0.9) if description else MISSING,
+        _post_time(item.get("timestamp"), description),
+    )
+
+
+EXTRACTORS = {
+    "twitter": _twitter,
+    "reddit": _reddit,
+    "instagram": _instagram,
+    "eventbrite": _eventbrite,
+    "nammasuttu": _nammasuttu,
+}
+
+
+def pre_extract(item, platform=None) -> Optional[PreExtraction]:
+    """Structured fields of one post, each with a confidence; None for unrecognised items."""
+    if not isinstance(item, dict):
+        return None
+    platform = platform or detect_platform(item)
+    extractor = EXTRACTORS.get(platform)
+    if extractor is None:
+        return None
+    location, description, start_time = extractor(item)
+    post = item.get("data", item) if platform == "reddit" else item
+    media_url = post.get("media_url") or post.get("media")
+    return PreExtraction(
+        platform, _text(post.get("id")), media_url if isinstance(media_url, str) else None,
+        location, description, start_time,
+    )
+
+
+def agent_message(item, extraction, min_confidence=PRE_EXTRACT_MIN_CONFIDENCE):
+    """The message for the agent: the post plus what is already known, asking only for the rest."""
+    if extraction is None:
+        return str(item)
+    missing = extraction.missing_fields(min_confidence)
+    known = {name: getattr(extraction, name).value for name in FIELDS if name not in missing}
+    # The same key the feeder writes pre-extracted posts under
+    source = [f"source_post_id: {extraction.source_post_id}"] if extraction.source_post_id else []
+    if not known:
+        return "\n".join([str(item), ""] + source) if source else str(item)
+    lines = [str(item), "", *source, "Already extracted from the post's structured fields (use as-is):"]
+    lines += [f" - {name}: {value}" for name, value in known.items()]
+    lines.append(f"Only determine: {', '.join(missing)}." if missing else "Insert these as they are.")
+    return "\n".join(lines)
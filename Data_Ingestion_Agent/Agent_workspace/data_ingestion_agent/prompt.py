@@ -26,7 +26,7 @@ step by step instruction:
 2. you will try to extract the media url from the post data
 3. if media_url is present then call the analyse_media function with the media url which will return the media analysis report
 4. you will extract the location, event description and start time from the media analysis report and input post data
-5. pass all the 3 data to the DB insertion function
+5. pass all the 3 data to the DB insertion function, along with the source_post_id given after the post (else the post's id)
 6. output the result of the DB insertion function
 
 details need to be noted for each entity:
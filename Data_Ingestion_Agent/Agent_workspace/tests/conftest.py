@@ -0,0 +1,10 @@
+import os
+import sys
+
+# data_ingestion_agent as a package (its lightweight modules import without the
+# ADK stack), benchmarks/ for fake_model_server, the repo root for common/ and
+# social_media/ for the pg_standin database
+WORKSPACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(WORKSPACE_DIR))
+sys.path[:0] = [WORKSPACE_DIR, os.path.join(WORKSPACE_DIR, "benchmarks"), REPO_DIR,
+                os.path.join(REPO_DIR, "social_media")]
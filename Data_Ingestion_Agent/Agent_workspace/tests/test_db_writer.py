@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+import pg_standin
+from data_ingestion_agent.db_writer import BulkReportWriter, make_report_row
+
+
+@pytest.fixture
+def reports():
+    """Rows of the (emptied) stand-in reports table, by source_post_id."""
+    conn = pg_standin.connect()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM reports")
+    conn.commit()
+
+    def rows():
+        cur.execute("SELECT source_post_id, title, location, timestamp FROM reports ORDER BY source_post_id")
+        return {row[0]: row[1:] for row in cur.fetchall()}
+    yield rows
+    conn.close()
+
+
+@pytest.fixture
+def writers():
+    opened = []
+
+    def make(**kwargs):
+        kwargs.setdefault("flush_interval", 60)
+        writer = BulkReportWriter(connect=pg_standin.connect, **kwargs)
+        opened.append(writer)
+        return writer
+    yield make
+    for writer in opened:
+        writer.close()
+
+
+def test_replayed_post_updates_its_row(reports, writers):
+    writer = writers()
+    writer.write(make_report_row("MG Road", "Marathon. Roads closed till noon", "2026-10-18T06:00:00",
+                                 "twitter:1"))
+    writer.write(make_report_row("Ulsoor", "Boat race. By the lake", "2026-10-19T09:00:00", "reddit:1"))
+    assert writer.flush() == 2
+
+    writer.write(make_report_row("MG Road", "Marathon moved. Roads closed till 1pm", "2026-10-18T07:00:00",
+                                 "twitter:1"))
+    assert writer.flush() == 1
+    assert reports() == {
+        "reddit:1": ("Boat race", "Ulsoor", "2026-10-19T09:00:00"),
+        "twitter:1": ("Marathon moved", "MG Road", "2026-10-18T07:00:00"),
+    }
+
+
+def test_rows_for_one_post_merge_in_the_buffer(reports, writers):
+    writer = writers()
+    for hour in (6, 7, 8):
+        writer.write(make_report_row("MG Road", "Marathon", f"2026-10-18T0{hour}:00:00", "twitter:1"))
+    assert writer.stats()["buffered"] == 1
+    assert writer.flush() == 1
+    assert reports()["twitter:1"][2] == "2026-10-18T08:00:00"
+
+
+def test_rows_without_post_id_are_keyed_by_content(reports, writers):
+    writer = writers()
+    for _ in range(2):
+        writer.write(make_report_row("Hebbal", "Flyover repairs", "2026-10-18"))
+    writer.write(make_report_row("Hebbal", "Flyover repairs", "not a time"))
+    assert writer.flush() == 2
+    assert sorted(str(row[2]) for row in reports().values()) == ["2026-10-18T00:00:00", "None"]
+
+
+def test_batch_size_triggers_a_background_flush(reports, writers):
+    writer = writers(batch_size=3)
+    for i in range(3):
+        writer.write(make_report_row("Jayanagar", f"Event {i}", "2026-10-18", f"eventbrite:{i}"))
+    for _ in range(200):
+        if writer.stats()["rows_written"] == 3:
+            break
+        time.sleep(0.01)
+    assert len(reports()) == 3
+    assert writer.stats()["flushes"] == 1
+
+
+def test_failed_flush_keeps_its_rows(reports, writers):
+    attempts = []
+
+    def flaky_connect(**config):
+        attempts.append(config)
+        if len(attempts) == 1:
+            raise OSError("connection refused")
+        return pg_standin.connect(**config)
+
+    writer = BulkReportWriter(connect=flaky_connect, flush_interval=60)
+    try:
+        writer.write(make_report_row("Indiranagar", "Gig", "2026-10-18", "instagram:5"))
+        assert writer.flush() == 0
+        # A newer row for the same post written meanwhile wins over the restored one
+        writer.write(make_report_row("Indiranagar", "Gig moved", "2026-10-18", "instagram:5"))
+        assert writer.stats()["flush_errors"] == 1
+        assert writer.flush() == 1
+        assert reports() == {"instagram:5": ("Gig moved", "Indiranagar", "2026-10-18T00:00:00")}
+    finally:
+        writer.close()
+
+
+def test_refuses_to_start_without_a_database():
+    with pytest.raises(RuntimeError, match="POSTGRES_HOST"):
+        BulkReportWriter(config={"host": None, "password": None})
@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+import requests
+
+from data_ingestion_agent.model_governor import AIMDLimiter, GovernorTimeout, ModelGovernor
+from fake_model_server import FakeModel, serve
+
+MODEL = "gemini-2.5-flash"
+
+
+@pytest.fixture
+def fake_model():
+    """A fake_model_server on a free port; returns (model, base URL)."""
+    servers = []
+
+    def start(**kwargs):
+        model = FakeModel(seed=1, **kwargs)
+        server = serve(model, port=0)
+        servers.append(server)
+        return model, f"http://127.0.0.1:{server.server_address[1]}"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def caller(url, path=f"/v1beta/models/{MODEL}:generateContent"):
+    def call(timeout=10):
+        response = requests.post(url + path, json={"contents": [{"role": "user", "parts": [{"text": "hi"}]}]},
+                                 timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    return call
+
+
+def governor(limiter, **kwargs):
+    # No quota buckets and near-instant backoff: only the limiter and retries are exercised
+    kwargs.setdefault("max_retries", 3)
+    return ModelGovernor(rpm=0, input_tpm=0, limiter=limiter, retry_base=0.01, retry_max=0.02, timeout=10,
+                         hedge_after=0, **kwargs)
+
+
+class RecordingLimiter(AIMDLimiter):
+    """AIMDLimiter remembering its limit after every release."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.history = []
+
+    def release(self, *args, **kwargs):
+        super().release(*args, **kwargs)
+        self.history.append(self.limit)
+
+
+class Flaky(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_one_burst_of_throttling_halves_the_limit_once():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=8)
+    started = [limiter.acquire() for _ in range(4)]
+    for when in started:
+        limiter.release(when, "generate", throttled=True)
+    assert limiter.limit == 2
+
+    # Only a call started after that decrease can cause the next one
+    limiter.release(limiter.acquire(), "generate", throttled=True)
+    assert limiter.limit == 1
+    limiter.release(limiter.acquire(), "generate", throttled=True)
+    assert limiter.limit == 1  # never below the minimum
+
+
+def test_limit_grows_only_while_it_holds_callers_back():
+    limiter = AIMDLimiter(initial=2, minimum=1, maximum=3)
+    limiter.release(limiter.acquire(), "generate", latency=0.1)
+    assert limiter.limit == 2  # one call in flight of two: the limit was not the constraint
+
+    started = [limiter.acquire(), limiter.acquire()]
+    for when in started:
+        limiter.release(when, "generate", latency=0.1)
+    assert limiter.limit == 2.5
+    for _ in range(20):
+        started = [limiter.acquire(), limiter.acquire()]
+        for when in started:
+            limiter.release(when, "generate", latency=0.1)
+    assert limiter.limit == 3
+
+
+def test_acquire_gives_up_at_the_deadline():
+    limiter = AIMDLimiter(initial=1, minimum=1, maximum=1)
+    limiter.acquire()
+    with pytest.raises(GovernorTimeout):
+        limiter.acquire(deadline=0)
+
+
+def test_throttled_calls_are_retried_and_back_off_the_limit(fake_model):
+    model, url = fake_model(latency=0.2, jitter=0, load_factor=0, capacity=1)
+    limiter = RecordingLimiter(initial=2, minimum=1, maximum=4)
+    gov = governor(limiter)
+    call = caller(url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gov.call(call, tokens=1)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 2
+    assert model.snapshot()["throttled_capacity"] >= 1
+    stats = gov.stats()
+    assert stats["succeeded"] == 2 and stats["failed"] == 0
+    assert stats["throttled"] >= 1 and stats["retries"] >= 1
+    assert stats["in_flight"] == 0
+    # The 429 halved the limit; the successes after it (held back by it) grew it again
+    assert min(limiter.history) == 1
+    assert limiter.history[-1] > 1
+
+
+def test_errors_that_are_not_transient_are_not_retried(fake_model):
+    model, url = fake_model(latency=0, capacity=0)
+    gov = governor(AIMDLimiter(initial=2, minimum=1, maximum=4))
+    with pytest.raises(requests.HTTPError):
+        gov.call(caller(url, path="/v1beta/models/unknown"))
+    assert model.snapshot()["requests"] == 0  # 404s are answered before admission
+    stats = gov.stats()
+    assert (stats["attempts"], stats["retries"], stats["failed"]) == (1, 0, 1)
+
+
+def test_stream_retries_only_until_its_first_event():
+    gov = governor(AIMDLimiter(initial=2, minimum=1, maximum=4))
+    failures = iter([Flaky(503), Flaky(503)])
+
+    def before_first_event(timeout):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        yield "event"
+
+    assert list(gov.stream(before_first_event)) == ["event"]
+    assert gov.stats()["retries"] == 2
+
+    def after_first_event(timeout):
+        yield "event"
+        raise Flaky(503)
+
+    events = []
+    with pytest.raises(Flaky):
+        for event in gov.stream(after_first_event):
+            events.append(event)
+    assert events == ["event"]
+    stats = gov.stats()
+    assert stats["retries"] == 2 and stats["failed"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,160 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+
+# Concurrent agent invocations; size this against the model quota
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", 4))
+# Items waiting for a worker; /agent answers 503 once this is full
+AGENT_QUEUE_SIZE = int(os.environ.get("AGENT_QUEUE_SIZE", 1000))
+# Seconds one item may spend in the agent before it is abandoned
+AGENT_ITEM_TIMEOUT = float(os.environ.get("AGENT_ITEM_TIMEOUT", 120))
+LATENCY_SAMPLES = 1000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AgentWorkQueue:
+    """
+    Bounded in-process queue drained by a pool of worker threads.
+
+    `handler(item, deadline)` is called for every submitted item. Python threads
+    cannot be interrupted, so the timeout is cooperative: the handler gets a
+    time.monotonic() deadline and is expected to stop and raise TimeoutError
+    once it passes (iter_until_deadline bounds a stream that stops yielding).
+    """
+
+    def __init__(self, handler, workers=AGENT_WORKERS, maxsize=AGENT_QUEUE_SIZE,
+                 item_timeout=AGENT_ITEM_TIMEOUT):
+        self.handler = handler
+        self.workers = workers
+        self.item_timeout = item_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started = False
+        self._in_flight = 0
+        self._counters = {"accepted": 0, "rejected": 0, "processed": 0, "failed": 0, "timed_out": 0}
+        self._wait_times = deque(maxlen=LATENCY_SAMPLES)     # seconds queued before a worker picked it up
+        self._process_times = deque(maxlen=LATENCY_SAMPLES)  # seconds inside the handler
+
+    def start(self):
+        with self._submit_lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"agent-worker-{i}", daemon=True).start()
+
+    def submit(self, items):
+        """Enqueue all `items` or none of them; raises QueueFull if they don't fit."""
+        self.start()
+        with self._submit_lock:
+            free = self._queue.maxsize - self._queue.qsize()
+            if len(items) > free:
+                with self._stats_lock:
+                    self._counters["rejected"] += len(items)
+                raise QueueFull(f"Agent queue full ({self._queue.qsize()}/{self._queue.maxsize})")
+            now = time.monotonic()
+            for item in items:
+                self._queue.put_nowait((now, item))
+        with self._stats_lock:
+            self._counters["accepted"] += len(items)
+        return len(items)
+
+    def incr(self, name, amount=1):
+        """Bump a handler-defined counter reported alongside the queue stats."""
+        with self._stats_lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def _work(self):
+        while True:
+            enqueued_at, item = self._queue.get()
+            started = time.monotonic()
+            with self._stats_lock:
+                self._in_flight += 1
+                self._wait_times.append(started - enqueued_at)
+            outcome = "processed"
+            try:
+                self.handler(item, started + self.item_timeout)
+            except TimeoutError as e:
+                outcome = "timed_out"
+                print(f"Agent item timed out after {self.item_timeout}s: {e}")
+            except Exception as e:
+                outcome = "failed"
+                print(f"Exception in agent worker: {e}")
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+                    self._counters[outcome] += 1
+                    self._process_times.append(time.monotonic() - started)
+                self._queue.task_done()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._counters)
+            stats.update(
+                workers=self.workers,
+                queue_depth=self._queue.qsize(),
+                queue_capacity=self._queue.maxsize,
+                in_flight=self._in_flight,
+                queue_wait_s=_summary(self._wait_times),
+                processing_s=_summary(self._process_times),
+            )
+        return stats
+
+
+_END = object()
+
+
+def iter_until_deadline(events, deadline):
+    """
+    Iterate `events` from a helper thread, raising TimeoutError once `deadline`
+    (time.monotonic()) passes with no event, so a stream that hangs mid-call
+    cannot hold the caller past it. The abandoned helper thread exits with the
+    stream, and stops pulling once the caller has given up.
+    """
+    handoff = queue.Queue()
+    abandoned = threading.Event()
+
+    def pull():
+        try:
+            for event in events:
+                if abandoned.is_set():
+                    return
+                handoff.put((event, None))
+            handoff.put((_END, None))
+        except BaseException as e:
+            handoff.put((_END, e))
+
+    threading.Thread(target=pull, name="agent-stream", daemon=True).start()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                event, error = handoff.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise TimeoutError("stream sent no event before the deadline") from None
+            if error is not None:
+                raise error
+            if event is _END:
+                return
+            yield event
+    finally:
+        abandoned.set()
+
+
+def _summary(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
@@ -1,23 +1,93 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import threading
 import time
 import requests
 import os
 
+from agent_workers import AgentWorkQueue, QueueFull, iter_until_deadline
+from common.checkpoint_store import get_checkpoints
+from common.metrics import Gauge, Histogram, get_registry, profile_request, wants_profile, render, CONTENT_TYPE
+
 try:
     from vertexai.preview import agent as agent_engines
 except ImportError:
     agent_engines = None
     print("WARNING: vertexai.preview.agent could not be imported. Vertex AI agent functionality will be disabled.")
 
+try:
+    # Available when Data_Ingestion_Agent/Agent_workspace is on PYTHONPATH
+    from data_ingestion_agent.pre_extract import pre_extract, agent_message
+    from data_ingestion_agent.db_writer import get_report_writer, make_report_row
+    from data_ingestion_agent.model_governor import get_governor
+    from data_ingestion_agent.analysis_cache import get_analysis_cache
+    from data_ingestion_agent.media_cache import get_media_cache
+except Exception as e:
+    # Not only ImportError: the feeder must start whatever the optional package raises
+    pre_extract = None
+    get_report_writer = None
+    get_governor = None
+    get_analysis_cache = get_media_cache = None
+    print(f"WARNING: data_ingestion_agent could not be imported ({e}). Every item will go through the agent.")
+
 app = Flask(__name__)
 
+METRICS = get_registry("agent_feeder_")
+span = METRICS.span
+HTTP_REQUEST_SECONDS = Histogram("agent_feeder_http_request_duration_seconds",
+                                 "Request handling time per route", ("method", "route", "status"), registry=METRICS)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # METRICS_PROFILE=1 and ?profile=1: return this request's spans as Server-Timing
+    if wants_profile(request.args.get("profile"), request.headers.get("X-Profile")):
+        g.profile = profile_request().__enter__()
+
+@app.after_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.request_start
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile.__exit__(None, None, None)
+        response.headers["Server-Timing"] = profile.server_timing(elapsed)
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(elapsed)
+    return response
+
 platforms = ["instagram", "reddit", "twitter", "eventbrite", "nammasuttu"]
-platform_cursors = {platform: "0" for platform in platforms}
+# Checkpointed to FORWARDER_STATE_PATH with the ids already posted, so a restart
+# resumes the rotation instead of replaying every platform from "0". A walk that
+# had finished starts over; the seen ids keep its items from being posted again.
+checkpoints = get_checkpoints()
+platform_cursors = {platform: checkpoints.cursor(f"rotate:{platform}") or "0" for platform in platforms}
 
 # Your deployed FastAPI backend base URL
 FASTAPI_BASE_URL = "http://localhost:8081/api"
 
+def platform_items(platform, data):
+    """The list of items inside an /api/{platform} response."""
+    if platform == "reddit":
+        return data.get("data", {}).get("children", [])
+    elif platform == "nammasuttu":
+        return data.get("reports", [])
+    elif platform == "eventbrite":
+        return data.get("events", [])
+    items = data.get("data", [])
+    return items if isinstance(items, list) else []
+
+def with_items(platform, data, items):
+    """Copy of an /api/{platform} response holding `items` instead."""
+    data = dict(data)
+    if platform == "reddit":
+        data["data"] = dict(data.get("data", {}), children=items)
+    elif platform == "nammasuttu":
+        data["reports"] = items
+    elif platform == "eventbrite":
+        data["events"] = items
+    else:
+        data["data"] = items
+    return data
+
 # Global control for the background thread
 rotation_thread = None
 rotation_running = False
@@ -55,11 +125,21 @@ def rotate_requests_loop():
                         next_cursor = data.get("paging", {}).get("next")
                         if not data.get("reports") and next_cursor is None:
                             print(f"{platform}: No reports and no next cursor. Done.")
-                    platform_cursors[platform] = next_cursor
                     print(f"{platform} → Next cursor: {next_cursor}")
-                    print(f"→ POSTing to /agent from {platform}")
-                    print(f"POST body: {data}")
-                    requests.post("http://localhost:8081", json=data)
+                    items = platform_items(platform, data)
+                    fresh = checkpoints.unseen(platform, items)
+                    if items and not fresh:
+                        print(f"{platform}: all {len(items)} items already posted. Skipping.")
+                    else:
+                        if len(fresh) < len(items):
+                            data = with_items(platform, data, fresh)
+                        print(f"→ POSTing to /agent from {platform}")
+                        print(f"POST body: {data}")
+                        requests.post("http://localhost:8081", json=data).raise_for_status()
+                        checkpoints.mark_seen(platform, fresh)
+                    # Only after the POST went through: a failure raises above and the page is retried
+                    platform_cursors[platform] = next_cursor
+                    checkpoints.set_cursor(f"rotate:{platform}", next_cursor)
                 else:
                     print(f"ERROR: {platform} GET failed: {response.status_code} - {response.text}")
             except requests.exceptions.ConnectionError:
@@ -95,6 +175,68 @@ def proxy_platform(platform):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+report_writer_warned = False
+
+def report_writer():
+    """
+    The agent package's report writer, or None when this process has no database
+    (POSTGRES_HOST / POSTGRES_PASSWORD unset): the (remote) agent then writes the
+    row itself.
+    """
+    global report_writer_warned
+    try:
+        return get_report_writer()
+    except RuntimeError as e:
+        work_queue.incr("report_writer_unavailable")
+        if not report_writer_warned:
+            report_writer_warned = True
+            print(f"WARNING: {e}; pre-extracted items go to the agent instead.")
+        return None
+
+def run_agent_item(item, deadline):
+    """Send one item to the agent; gives up once `deadline` (time.monotonic()) has passed."""
+    message = str(item)
+    if pre_extract:
+        with span("pre_extract"):
+            extraction = pre_extract(item)
+        writer = report_writer() if extraction and not extraction.missing_fields() else None
+        if writer is not None:
+            # The post's own fields answer everything; no model call needed
+            writer.write(make_report_row(source_post_id=extraction.source_post_id, **extraction.values()))
+            work_queue.incr("pre_extracted")
+            return
+        if extraction and extraction.missing_fields():
+            work_queue.incr("partially_pre_extracted")
+        message = agent_message(item, extraction)
+
+    def stream_query(timeout=None):
+        # stream_query takes no request timeout: wait on its events from a helper
+        # thread instead, so a hung stream raises and releases the governor slot
+        stream_deadline = deadline if timeout is None else min(deadline, time.monotonic() + timeout)
+        return iter_until_deadline(adk_app.stream_query(
+            user_id="098765",
+            session_id="692791831301193728",
+            message=message,
+        ), stream_deadline)
+
+    with span("agent_stream_query"):
+        if get_governor:
+            # Shares rate limits and the adaptive concurrency limit with analyse_media's calls
+            governor = get_governor()
+            events = governor.stream(stream_query, tokens=len(message) // 4 + 1, kind="agent",
+                                     timeout=min(governor.timeout, deadline - time.monotonic()))
+        else:
+            events = stream_query()
+        for event in events:
+            print(event)
+
+# Items posted to /agent are processed here, off the request thread
+work_queue = AgentWorkQueue(run_agent_item)
+Gauge("agent_feeder_queue_depth", "Items waiting for an agent worker",
+      registry=METRICS).set_function(lambda: work_queue.stats()["queue_depth"])
+Gauge("agent_feeder_in_flight", "Items an agent worker is processing",
+      registry=METRICS).set_function(lambda: work_queue.stats()["in_flight"])
+
 @app.route('/agent', methods=["POST"])
 def agent():
     payload = request.json
@@ -111,22 +253,38 @@ def agent():
         elif "events" in payload:
             data_array = payload["events"]
 
-    print(f"✓ Processed {len(data_array)} items at /agent.")
-    if agent_engines:
-        try:
-           
-            for item in data_array:
-                for event in adk_app.stream_query(
-                    user_id="098765",
-                    session_id="692791831301193728",
-                    message=str(item),
-                ):
-                    print(event)
-        except Exception as e:
-            print(f"Exception in /agent: {e}")
-    else:
+    if not agent_engines:
         print("Vertex AI agent functionality is not available.")
-    return jsonify({"status": "received", "data_length": len(data_array)})
+        return jsonify({"status": "received", "data_length": len(data_array)})
+    try:
+        work_queue.submit(data_array)
+    except QueueFull as e:
+        # Backpressure: tell the forwarder to retry later instead of buffering without bound
+        print(f"Rejected {len(data_array)} items at /agent: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    print(f"✓ Queued {len(data_array)} items at /agent.")
+    return jsonify({"status": "queued", "data_length": len(data_array)}), 202
+
+@app.route('/agent/stats')
+def agent_stats():
+    stats = work_queue.stats()
+    if get_governor:
+        stats["model_governor"] = get_governor().stats()
+    if get_report_writer:
+        try:
+            stats["report_writer"] = get_report_writer().stats()
+        except RuntimeError as e:
+            stats["report_writer"] = {"error": str(e)}
+    if get_analysis_cache:
+        # Hit rate and model seconds saved by analyse_media's cache, hit rate and bytes saved by the media cache
+        stats["analysis_cache"] = get_analysis_cache().stats()
+        stats["media_cache"] = get_media_cache().stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text; includes the embedded agent's data_ingestion_agent_* metrics when it was imported
+    return Response(render(), content_type=CONTENT_TYPE)
 
 @app.route('/trigger', methods=['POST'])
 def trigger_rotation():
@@ -0,0 +1,287 @@
+"""
+Durable forwarder state in a local SQLite file (WAL mode): the cursor of each
+platform walk and the ids of items already forwarded, so a restart
+(supervisord autorestart, a rescheduled container) resumes where the last
+process stopped instead of replaying every platform from "0" through the
+agent. Shared by social_media's forwarder and agent_feeder's rotation.
+
+    checkpoints = get_checkpoints()
+    cursor = checkpoints.cursor("poll:reddit")
+    items = checkpoints.unseen("reddit", items)
+    ...
+    checkpoints.advance("poll:reddit", "reddit", cursor, next_cursor, items)
+    ...  # once /agent answered 2xx for them:
+    checkpoints.mark_seen("reddit", items)
+
+mark_seen is only for items /agent accepted, and a walk's checkpointed cursor
+only moves past a page once all of its items were marked seen (see advance),
+so items still in flight, waiting in the dedup window or lost to a failed POST
+are fetched again after a restart.
+
+Reads come from memory (a dict per platform, so the seen check is O(1));
+writes are committed in batches by a background thread.
+"""
+import os
+import time
+import atexit
+import sqlite3
+import threading
+from collections import deque
+
+# ":memory:" keeps the state for this process only (nothing survives a restart)
+FORWARDER_STATE_PATH = os.environ.get("FORWARDER_STATE_PATH", "forwarder_state.db")
+# Commit once this many changes are pending, or the oldest is this many seconds old
+CHECKPOINT_BATCH_SIZE = int(os.environ.get("CHECKPOINT_BATCH_SIZE", 100))
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", 1.0))
+# Forwarded ids remembered per platform; the oldest are forgotten first
+SEEN_IDS_MAX = int(os.environ.get("SEEN_IDS_MAX", 100000))
+# Pages a walk may have outstanding (items read but not yet accepted) before the
+# oldest is given up on and the checkpoint moves past it anyway
+WALK_MAX_PENDING_PAGES = int(os.environ.get("WALK_MAX_PENDING_PAGES", 1000))
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS cursors (name TEXT PRIMARY KEY, cursor TEXT)",
+    "CREATE TABLE IF NOT EXISTS seen_ids (seq INTEGER PRIMARY KEY, platform TEXT NOT NULL, "
+    "item_id TEXT NOT NULL, UNIQUE (platform, item_id))",
+]
+_MISSING = object()
+
+
+def item_id(item):
+    """Id of one /api/{platform} item (reddit nests it under "data"), or None."""
+    if not isinstance(item, dict):
+        return None
+    value = item.get("id")
+    if value is None and isinstance(item.get("data"), dict):
+        value = item["data"].get("id")
+    return None if value is None else str(value)
+
+
+class CheckpointStore:
+    """
+    Cursors by name and forwarded ids by platform, mirrored in memory and
+    checkpointed to SQLite. A cursor of None (a finished walk) is stored too.
+    A failed commit keeps its changes for the next attempt; close()
+    (registered with atexit) commits whatever is left.
+    """
+
+    def __init__(self, path=FORWARDER_STATE_PATH, batch_size=CHECKPOINT_BATCH_SIZE,
+                 flush_interval=CHECKPOINT_INTERVAL, seen_max=SEEN_IDS_MAX):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.seen_max = seen_max
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL: commits append to the log instead of rewriting pages; NORMAL
+        # syncs at checkpoints, which survives a process crash
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for sql in SCHEMA:
+            self._conn.execute(sql)
+        self._conn.commit()
+        self._cursors = dict(self._conn.execute("SELECT name, cursor FROM cursors"))
+        self._seen = {}  # platform -> {item_id: None}, oldest first
+        for platform, seen_id in self._conn.execute("SELECT platform, item_id FROM seen_ids ORDER BY seq"):
+            self._seen.setdefault(platform, {})[seen_id] = None
+        for ids in self._seen.values():
+            self._trim(ids)
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM seen_ids").fetchone()[0]
+        self._walks = {}  # walk name -> deque of [start, end, platform, ids not accepted yet]
+        self._pending_cursors = {}
+        self._pending_seen = []  # (seq, platform, item_id)
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._stats = {"commits": 0, "commit_errors": 0, "cursors_written": 0, "ids_written": 0, "skipped": 0,
+                       "pages_abandoned": 0}
+        print(f"Loaded forwarder checkpoints from {path}: {len(self._cursors)} cursors, "
+              f"{sum(len(ids) for ids in self._seen.values())} seen ids")
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def cursor(self, name, default="0"):
+        """Last checkpointed cursor for `name` (may be None), else `default`."""
+        with self._cond:
+            value = self._cursors.get(name, _MISSING)
+        return default if value is _MISSING else value
+
+    def set_cursor(self, name, cursor):
+        with self._cond:
+            if self._cursors.get(name, _MISSING) == cursor:
+                return
+            self._cursors[name] = cursor
+            self._pending_cursors[name] = cursor
+            self._changed()
+
+    def advance(self, name, platform, start, end, items):
+        """
+        The walk `name` read the page from cursor `start` (next cursor `end`) whose
+        `items` are on their way to /agent. The checkpointed cursor becomes `end`
+        once these and every earlier page's items were marked seen; until then it
+        stays at the `start` of the oldest page still outstanding.
+        """
+        keys = {k for k in (item_id(item) for item in items) if k is not None}
+        with self._cond:
+            seen = self._seen.get(platform, {})
+            pages = self._walks.setdefault(name, deque())
+            pages.append([start, end, platform, {k for k in keys if k not in seen}])
+            while len(pages) > WALK_MAX_PENDING_PAGES:
+                abandoned = pages.popleft()
+                self._stats["pages_abandoned"] += 1
+                print(f"Giving up on {len(abandoned[3])} {platform} items from {name} cursor {abandoned[0]!r}: "
+                      f"{WALK_MAX_PENDING_PAGES} later pages are waiting on them")
+            self._settle(name)
+
+    def _settle(self, name):
+        # Caller holds self._cond: drop finished pages from the front and checkpoint
+        pages = self._walks[name]
+        finished = None
+        while pages and not pages[0][3]:
+            finished = pages.popleft()
+        if pages:
+            self.set_cursor(name, pages[0][0])
+        elif finished is not None:
+            self.set_cursor(name, finished[1])
+
+    def is_seen(self, platform, seen_id):
+        return seen_id in self._seen.get(platform, ())
+
+    def unseen(self, platform, items):
+        """The items not forwarded yet (items without an id always pass), duplicates dropped."""
+        seen = self._seen.get(platform, {})
+        batch = set()
+        fresh = []
+        for item in items:
+            key = item_id(item)
+            if key is not None:
+                if key in seen or key in batch:
+                    continue
+                batch.add(key)
+            fresh.append(item)
+        if len(fresh) < len(items):
+            with self._cond:
+                self._stats["skipped"] += len(items) - len(fresh)
+        return fresh
+
+    def mark_seen(self, platform, items):
+        """Remember the ids of `items` as forwarded."""
+        keys = [k for k in (item_id(item) for item in items) if k is not None]
+        if not keys:
+            return
+        with self._cond:
+            ids = self._seen.setdefault(platform, {})
+            for key in keys:
+                if key in ids:
+                    continue
+                ids[key] = None
+                self._seq += 1
+                self._pending_seen.append((self._seq, platform, key))
+            self._trim(ids)
+            self._changed()
+            accepted = set(keys)
+            for name, pages in self._walks.items():
+                waited = False
+                for page in pages:
+                    if page[2] == platform and page[3]:
+                        page[3] -= accepted
+                        waited = True
+                if waited:
+                    self._settle(name)
+
+    def _trim(self, ids):
+        while len(ids) > self.seen_max:
+            ids.pop(next(iter(ids)))
+
+    def _changed(self):
+        # Caller holds self._cond
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+            self._cond.notify_all()
+        if len(self._pending_cursors) + len(self._pending_seen) >= self.batch_size:
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending_cursors) + len(self._pending_seen) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            if not self.flush():
+                time.sleep(self.flush_interval)  # keep the changes, retry later
+
+    def flush(self):
+        """Commit every pending change in one transaction; False if the commit failed."""
+        with self._flush_lock:
+            with self._cond:
+                cursors, seen = self._pending_cursors, self._pending_seen
+                self._pending_cursors, self._pending_seen, self._oldest = {}, [], None
+            if not cursors and not seen:
+                return True
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT OR REPLACE INTO cursors (name, cursor) VALUES (?, ?)",
+                                           list(cursors.items()))
+                    self._conn.executemany("INSERT OR IGNORE INTO seen_ids (seq, platform, item_id) VALUES (?, ?, ?)",
+                                           seen)
+                    for platform in {p for _, p, _ in seen}:
+                        # Forget what the in-memory set already dropped
+                        self._conn.execute(
+                            "DELETE FROM seen_ids WHERE platform = ? AND seq <= "
+                            "(SELECT seq FROM seen_ids WHERE platform = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                            (platform, platform, self.seen_max))
+            except sqlite3.Error as e:
+                print(f"Error checkpointing forwarder state to {self.path}, will retry: {e}")
+                with self._cond:
+                    self._stats["commit_errors"] += 1
+                    cursors.update(self._pending_cursors)
+                    self._pending_cursors = cursors
+                    self._pending_seen = seen + self._pending_seen
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                return False
+            with self._cond:
+                self._stats["commits"] += 1
+                self._stats["cursors_written"] += len(cursors)
+                self._stats["ids_written"] += len(seen)
+            return True
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, cursors=len(self._cursors),
+                        outstanding_pages={name: len(pages) for name, pages in self._walks.items() if pages},
+                        seen_ids=sum(len(ids) for ids in self._seen.values()),
+                        pending=len(self._pending_cursors) + len(self._pending_seen))
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+        self._conn.close()
+
+
+_checkpoints = None
+_checkpoints_lock = threading.Lock()
+
+
+def get_checkpoints():
+    """The process-wide CheckpointStore at FORWARDER_STATE_PATH."""
+    global _checkpoints
+    with _checkpoints_lock:
+        if _checkpoints is None:
+            _checkpoints = CheckpointStore()
+        return _checkpoints
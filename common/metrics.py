@@ -0,0 +1,271 @@
+"""
+Counters, gauges, histograms and span timing in the Prometheus text format,
+with no dependencies. Shared by every service (each Docker image copies
+common/ next to its own modules); a service keeps its metrics in the registry
+of its name prefix, so the agent package embedded in agent_feeder still
+exports data_ingestion_agent_* next to agent_feeder_*.
+
+    METRICS = get_registry("social_media_")
+    span = METRICS.span
+    ITEMS = Counter(METRICS.prefix + "items_total", "Items", registry=METRICS)
+
+    with span("fetch_reports_from_db"):
+        rows = ...
+
+Spans feed prefix + "span_seconds"{span=...}. With METRICS_PROFILE=1,
+a request sent with ?profile=1 or an X-Profile: 1 header also gets the spans
+it went through back as a Server-Timing header (see profile_request).
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans of the request being profiled, or None (the usual case)
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class Registry:
+    """The metrics of one service (or embedded library), named from prefix."""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._metrics = []
+        self._lock = threading.Lock()
+        self.span_seconds = Histogram(prefix + "span_seconds", "Time spent in instrumented code paths",
+                                      ("span",), registry=self)
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def span(self, name):
+        return span(name, self)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(prefix=""):
+    """The process-wide registry for metrics named prefix + ..., created on first use."""
+    registry = _registries.get(prefix)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(prefix)
+            if registry is None:
+                registry = _registries[prefix] = Registry(prefix)
+    return registry
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or get_registry()).register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, _label_text(self.labelnames, values))
+
+
+class _Value:
+    __slots__ = ("value", "function", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time (e.g. a queue depth)."""
+        self.function = function
+
+    def samples(self, name, labels):
+        value = self.function() if self.function is not None else self.value
+        yield f"{name}{labels} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        inner = labels[1:-1] + "," if labels else ""
+        cumulative = 0
+        for bound, count in zip((*self.bounds, float("inf")), counts):
+            cumulative += count
+            yield f'{name}_bucket{{{inner}le="{_number(bound)}"}} {cumulative}'
+        yield f"{name}_sum{labels} {_number(total)}"
+        yield f"{name}_count{labels} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class span:
+    """
+    Time a block (`with span("name"):`) or a function (`@span("name")`) into
+    the registry's span_seconds, and into the current request's profile when
+    one is active. Services use their registry's span (METRICS.span).
+    """
+
+    __slots__ = ("name", "registry", "_child", "_start")
+
+    def __init__(self, name, registry=None):
+        self.name = name
+        self.registry = registry or get_registry()
+        self._child = self.registry.span_seconds.labels(name)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self._child.observe(elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        return False
+
+    def __call__(self, function):
+        name, registry = self.name, self.registry
+
+        def timed(*args, **kwargs):
+            with span(name, registry):
+                return function(*args, **kwargs)
+        timed.__name__ = function.__name__
+        timed.__doc__ = function.__doc__
+        timed.__wrapped__ = function
+        return timed
+
+
+def wants_profile(query_value, header_value):
+    """Whether a request asked to be profiled (?profile=1 / X-Profile: 1) and METRICS_PROFILE allows it."""
+    return METRICS_PROFILE and "1" in (query_value, header_value)
+
+
+class profile_request:
+    """
+    Collect the spans a request goes through (threads or tasks it spawns
+    inherit the context) and render them as a Server-Timing header value.
+    """
+
+    def __enter__(self):
+        self.spans = []
+        self._token = _request_spans.set(self.spans)
+        return self
+
+    def __exit__(self, *exc):
+        _request_spans.reset(self._token)
+        return False
+
+    def server_timing(self, total=None):
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.spans]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
+
+
+def render():
+    """Prometheus text for every registry in the process (the service's and any embedded library's)."""
+    return "".join(registry.render() for registry in list(_registries.values()))
@@ -1,36 +1,187 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
-from data_store import SyncedEventStore # Import SyncedEventStore from data_store.py
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from data_store import InvalidCursor
+from async_data_store import AsyncSyncedEventStore, ThreadpoolEventStore
+from http_cache import PageCache, page_response
+from event_stream import stream_events
+from event_fragments import PAGE_ITEMS, splice_items
+from common.metrics import Histogram, get_registry, profile_request, wants_profile, render, CONTENT_TYPE, METRICS_PROFILE
 # If you have other routers in data_store, import them like this:
 # from data_store import router as data_store_router 
 import os
+import time
+from urllib.parse import parse_qs
+from contextlib import asynccontextmanager
 
-app = FastAPI()
-store = SyncedEventStore()
+# "async" (default): asyncpg + asyncio refresh task. "sync": the thread-based
+# SyncedEventStore with its blocking calls run in the threadpool.
+EVENT_STORE_MODE = os.environ.get("EVENT_STORE_MODE", "async")
+
+store = ThreadpoolEventStore() if EVENT_STORE_MODE == "sync" else AsyncSyncedEventStore()
+page_cache = PageCache()
+MAX_NEAR_RADIUS_M = 50000
+
+@asynccontextmanager
+async def lifespan(app):
+    await store.start()
+    yield
+    await store.stop()
+
+HTTP_REQUEST_SECONDS = Histogram("social_media_http_request_duration_seconds",
+                                 "Time to the response headers per route", ("method", "route", "status"),
+                                 registry=get_registry("social_media_"))
+
+class RequestMetrics:
+    """
+    Plain ASGI middleware (no per-request task like @app.middleware("http")):
+    times every request by route template, and answers ?profile=1 requests
+    with a Server-Timing header of the spans they went through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        started = False
+        profile = None
+        if METRICS_PROFILE and wants_profile(parse_qs(scope.get("query_string", b"").decode()).get("profile", [None])[0],
+                                             dict(scope["headers"]).get(b"x-profile", b"").decode()):
+            profile = profile_request().__enter__()
+
+        def observe(status):
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route.path if route else "unmatched",
+                                        str(status)).observe(time.perf_counter() - start)
+
+        async def timed_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                # Observed at the headers, so streams (/api/stream, SSE) don't
+                # record their whole lifetime as request latency
+                started = True
+                observe(message["status"])
+                if profile is not None:
+                    timing = profile.server_timing(time.perf_counter() - start)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if profile is not None:
+                profile.__exit__(None, None, None)
+            if not started:
+                observe(500)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetrics)
 # app.include_router(data_store_router) # Uncomment if you have other routers to include
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "FastAPI backend is running. See /api/{platform}"}
 
 @app.post("/")
-def root_post():
+async def root_post():
     return {"message": "POST not supported on root. Use GET or see /api/{platform}"}
 
+@app.get("/stats/db-pool")
+async def db_pool_stats():
+    # Pool wait time and checkout latency counters for the store's Postgres pool
+    return store.db_pool_stats()
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text: request latency per route and the span_seconds of the store's hot paths
+    return Response(render(), media_type=CONTENT_TYPE)
+
+def _platform_filter(platforms):
+    return set(platforms.split(",")) if platforms else None
+
+@app.get("/api/events/near")
+async def events_near(lat: float = Query(...), lon: float = Query(...), radius_m: float = Query(1000),
+                      limit: int = Query(50), platforms: str = Query(None)):
+    # Cached events of every platform around a point, nearest first (for the map views)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 0 < radius_m <= MAX_NEAR_RADIUS_M:
+        return {"error": f"lat/lon out of range or radius_m not in (0, {MAX_NEAR_RADIUS_M}]"}
+    events = store.events_near(lat, lon, radius_m, limit, _platform_filter(platforms))
+    return {"events": events, "count": len(events)}
+
+@app.get("/api/events/bbox")
+async def events_bbox(min_lat: float = Query(...), min_lon: float = Query(...), max_lat: float = Query(...),
+                      max_lon: float = Query(...), limit: int = Query(50), platforms: str = Query(None)):
+    # Cached events of every platform inside the box, nearest its centre first
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        return {"error": "Expected -90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180"}
+    events = store.events_in_bbox(min_lat, min_lon, max_lat, max_lon, limit, _platform_filter(platforms))
+    return {"events": events, "count": len(events)}
+
 @app.get("/api/{platform}")
-def get_events(platform: str, limit: int = Query(20), cursor: str = Query("0")):
+async def get_events(request: Request, platform: str, limit: int = Query(20), cursor: str = Query("0"), mode: str = Query("offset")):
     valid = ["twitter", "reddit", "instagram", "eventbrite", "nammasuttu"]
     if platform not in valid:
         return {"error": "Unsupported platform"}
 
+    # mode=keyset: page through the whole reports table with an opaque (timestamp, id) cursor
+    if platform == "nammasuttu" and mode == "keyset":
+        try:
+            events, next_cursor = await store.get_reports_page(limit, cursor)
+        except InvalidCursor as e:
+            return {"error": str(e)}
+        return {
+            "reports": events,
+            "paging": {"next": next_cursor}
+        }
+
     # Convert cursor to int if possible, else default to 0
     try:
         cursor_int = int(cursor)
     except (ValueError, TypeError):
         cursor_int = 0
 
-    events, next_cursor = store.get_platform_view(platform, limit, cursor_int)
+    # Pages only change when the snapshot is refreshed, so each (platform, version,
+    # cursor, limit) page is assembled from the snapshot's pre-encoded events and
+    # compressed once, then served with a strong ETag and a max-age that runs
+    # until the next refresh.
+    snapshot = await store.get_snapshot(platform)
+    page = page_cache.get_or_build(
+        (platform, snapshot.version, cursor_int, limit),
+        lambda: assemble_page(platform, *store.page_fragments(platform, snapshot, limit, cursor_int), cursor_int, limit),
+    )
+    return page_response(request, page, store.seconds_until_refresh(platform))
+
+@app.get("/api/{platform}/stream")
+async def stream_platform(request: Request, platform: str, cursor: str = Query(None), fmt: str = Query(None, alias="format"),
+                          heartbeat: float = Query(15)):
+    """
+    Push new events for `platform` as snapshots change, as Server-Sent Events
+    (format=sse or Accept: text/event-stream) or NDJSON (default). Every event
+    carries a cursor; reconnect with ?cursor=... or Last-Event-ID to resume.
+    `heartbeat` is the idle keep-alive interval in seconds.
+    """
+    log = store.change_log(platform)
+    if log is None:
+        return {"error": "Unsupported platform"}
+    if fmt is None:
+        fmt = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    cursor = cursor or request.headers.get("last-event-id")
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_events(request, log, cursor, fmt, max(1.0, min(heartbeat, 60.0))),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def assemble_page(platform, fragments, next_cursor, cursor_int, limit):
+    """The page body as bytes: the platform's envelope around already-encoded events."""
+    envelope = build_envelope(platform, PAGE_ITEMS, next_cursor, cursor_int, limit, count=len(fragments))
+    return splice_items(envelope, fragments)
 
+def build_envelope(platform, events, next_cursor, cursor_int, limit, count=None):
+    """Wrap formatted events in the platform's native response shape."""
     if platform == "nammasuttu":
         return {
             "reports": events,
@@ -54,7 +205,7 @@ def get_events(platform: str, limit: int = Query(20), cursor: str = Query("0")):
         return {
             "data": events, # 'events' here is already the list of formatted tweets
             "meta": {
-                "result_count": len(events),
+                "result_count": len(events) if count is None else count,
                 "next_token": str(next_cursor) if next_cursor else None
             }
         }
@@ -0,0 +1,294 @@
+import time
+import asyncio
+from datetime import datetime
+from contextlib import asynccontextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from core_event_store import RECENT_REPORTS_SQL, REPORTS_FIRST_PAGE_SQL, REPORTS_AFTER_KEY_SQL, NOTIFY_CHANNEL
+from core_event_store import fetch_reports_from_db as _fetch_reports_from_db
+from core_event_store import fetch_reports_page as _fetch_reports_page
+from data_store import EventStoreBase, SyncedEventStore, PlatformSnapshot
+from data_store import PLATFORMS, NAMMASUTTU_LISTEN, NOTIFY_DEBOUNCE
+from shared_snapshots import SNAPSHOT_SHARE_POLL
+from db_pool import POSTGRES_CONFIG, PG_POOL_MIN, PG_POOL_MAX, PG_POOL_TIMEOUT, PG_CONNECT_FACTORY
+from db_pool import PoolStats, get_pool
+from common.metrics import get_registry
+
+METRICS = get_registry("social_media_")
+span = METRICS.span
+
+
+def _asyncpg_config():
+    config = dict(POSTGRES_CONFIG)
+    config['database'] = config.pop('dbname')
+    return config
+
+
+def _parse_timestamp(value):
+    # asyncpg binds parameters by type, so the cursor's ISO string must become a datetime
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class AsyncSyncedEventStore(EventStoreBase):
+    """
+    asyncio variant of SyncedEventStore for the async FastAPI endpoints.
+
+    Reads go through asyncpg (statement cache on, pool sized by PG_POOL_MIN /
+    PG_POOL_MAX); if asyncpg is not installed or PG_CONNECT_FACTORY selects a
+    stand-in, DB calls fall back to the shared psycopg2 pool in the threadpool.
+    Either way no request blocks the event loop. Periodic refresh and the
+    NOTIFY listener run as asyncio tasks started by start().
+    """
+
+    def __init__(self):
+        self._init_snapshots()
+        self._inflight = {}  # platform -> task building its next snapshot (single-flight)
+        self._tasks = []
+        self._db = None
+        self.pool_stats = PoolStats()
+
+    async def start(self):
+        if asyncpg is not None and not PG_CONNECT_FACTORY:
+            try:
+                self._db = await asyncpg.create_pool(
+                    min_size=PG_POOL_MIN, max_size=PG_POOL_MAX, **_asyncpg_config())
+            except Exception as e:
+                print(f"Error creating asyncpg pool, falling back to the threaded pool: {e}")
+        if self._share is not None and not self._share.try_lead():
+            await run_in_threadpool(self._wait_for_shared)
+        if self._share is not None and not self._share.leading:
+            self._tasks.append(asyncio.create_task(self._follow()))
+        else:
+            await self._start_refreshing()
+
+    async def _start_refreshing(self):
+        await run_in_threadpool(self._ensure_reports_schema)
+        await self.refresh_events() # Initial refresh
+        self._tasks.append(asyncio.create_task(self._periodic_refresh()))
+        if NAMMASUTTU_LISTEN:
+            self._tasks.append(asyncio.create_task(self._listen_for_reports()))
+
+    async def _follow(self):
+        # Map the leader's new snapshots until its lock frees up, then take over
+        while not self._share.try_lead():
+            await asyncio.sleep(SNAPSHOT_SHARE_POLL)
+            try:
+                await run_in_threadpool(self._adopt_shared)
+            except Exception as e:
+                print(f"Error adopting shared snapshots: {e}")
+        await self._start_refreshing()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def refresh_events(self, platform=None):
+        platforms = [platform] if platform else PLATFORMS
+        for plat in platforms:
+            await self._refresh(plat)
+
+    def _refresh(self, plat):
+        # Concurrent callers share one build; shield so a cancelled request
+        # does not cancel the build everyone else is waiting on
+        task = self._inflight.get(plat)
+        if task is None:
+            task = asyncio.ensure_future(self._build_and_publish(plat))
+            self._inflight[plat] = task
+
+            def done(t, plat=plat):
+                if self._inflight.get(plat) is t:
+                    del self._inflight[plat]
+            task.add_done_callback(done)
+        return asyncio.shield(task)
+
+    async def _build_and_publish(self, plat):
+        rows = await self.fetch_reports_from_db(50) if plat == "nammasuttu" else None
+        # Packing, fragment encoding, synthetic chunk loading and the spatial grid
+        # rebuild are all CPU (or disk) bound: keep them off the event loop
+        snapshot = await run_in_threadpool(self._build_and_publish_sync, plat, rows)
+        if snapshot is None:
+            return self._snapshots[plat]  # DB error: keep serving the last good reports
+        if self._share is not None:
+            await run_in_threadpool(self._share_snapshot, snapshot)
+        return snapshot
+
+    def _build_and_publish_sync(self, plat, rows):
+        with span("build_snapshot"):
+            if plat == "nammasuttu":
+                snapshot = self._reports_snapshot(rows)
+            else:
+                snapshot = self._build_mock_snapshot(plat)
+        if snapshot is not None:
+            self._publish(snapshot)  # ChangeLog wakes subscribers with call_soon_threadsafe
+        return snapshot
+
+    async def get_snapshot(self, platform):
+        """Current snapshot for `platform`, building it (once, for all waiters) on a miss."""
+        snapshot = self._snapshots.get(platform)
+        if self._is_usable(snapshot):
+            return snapshot
+        if snapshot is not None and self._following():
+            return snapshot  # the leader retries empty snapshots, not every worker
+        if platform not in PLATFORMS:
+            return PlatformSnapshot(platform, (), 0, int(time.time()))
+        return await self._refresh(platform)
+
+    async def get_platform_view(self, platform, limit=20, cursor=0, snapshot=None):
+        return self.page_snapshot(platform, snapshot or await self.get_snapshot(platform), limit, cursor)
+
+    @asynccontextmanager
+    async def _acquire(self):
+        start = time.monotonic()
+        conn = await self._db.acquire(timeout=PG_POOL_TIMEOUT)
+        acquired = time.monotonic()
+        self.pool_stats.incr("checkouts")
+        if acquired - start > 0.001:
+            self.pool_stats.record_wait(acquired - start)
+        try:
+            yield conn
+        finally:
+            await self._db.release(conn)
+            self.pool_stats.record_checkout(time.monotonic() - acquired)
+
+    async def _fetch(self, sql, *args):
+        async with self._acquire() as conn:
+            return [dict(r) for r in await conn.fetch(sql, *args)]
+
+    async def fetch_reports_from_db(self, batch_size=50):
+        """Latest reports, or None if the DB could not be read."""
+        try:
+            with span("fetch_reports_from_db"):
+                if self._db is None:
+                    return await run_in_threadpool(_fetch_reports_from_db, batch_size)
+                return await self._fetch(RECENT_REPORTS_SQL, batch_size)
+        except Exception as e:
+            print(f"Error fetching from database: {e}")
+            return None
+
+    async def get_reports_page(self, limit=20, cursor=None):
+        """Async counterpart of SyncedEventStore.get_reports_page."""
+        limit, after = self._keyset_bounds(limit, cursor)
+        try:
+            with span("fetch_reports_page"):
+                if self._db is None:
+                    rows = await run_in_threadpool(_fetch_reports_page, limit + 1, after)
+                elif after is None:
+                    rows = await self._fetch(REPORTS_FIRST_PAGE_SQL, limit + 1)
+                else:
+                    timestamp, report_id = after
+                    rows = await self._fetch(REPORTS_AFTER_KEY_SQL, _parse_timestamp(timestamp), report_id, limit + 1)
+        except Exception as e:
+            print(f"Error fetching report page from database: {e}")
+            return [], None
+        return self._keyset_page(rows, limit)
+
+    def db_pool_stats(self):
+        if self._db is None:
+            return get_pool().stats.snapshot()
+        stats = self.pool_stats.snapshot()
+        stats.update(size=self._db.get_size(), idle=self._db.get_idle_size())
+        return stats
+
+    async def _periodic_refresh(self):
+        # Each platform refreshes on its own interval (REFRESH_INTERVAL_<PLATFORM>)
+        while True:
+            now = time.time()
+            for plat, when in self._due_times().items():
+                if when <= now:
+                    try:
+                        await self.refresh_events(plat)
+                    except Exception as e:
+                        print(f"Error refreshing {plat}: {e}")
+            await asyncio.sleep(max(1, min(self._due_times().values()) - time.time()))
+
+    async def _listen_for_reports(self):
+        if asyncpg is None or PG_CONNECT_FACTORY:
+            print("NAMMASUTTU_LISTEN needs asyncpg and a real Postgres; report listener disabled.")
+            return
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**_asyncpg_config())
+                notified = asyncio.Event()
+                await conn.add_listener(NOTIFY_CHANNEL, lambda *_args: notified.set())
+                backoff = 1
+                print(f"Listening for new reports on channel '{NOTIFY_CHANNEL}'")
+                while True:
+                    try:
+                        await asyncio.wait_for(notified.wait(), 60)
+                    except asyncio.TimeoutError:
+                        if conn.is_closed():
+                            raise ConnectionError("listener connection closed")
+                        continue
+                    # Let a burst of inserts settle, then refresh once for all of them
+                    await asyncio.sleep(NOTIFY_DEBOUNCE)
+                    notified.clear()
+                    await self.refresh_events("nammasuttu")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Report listener error, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+
+class ThreadpoolEventStore:
+    """
+    The same async interface over the thread-based SyncedEventStore, with every
+    blocking call dispatched to the threadpool (EVENT_STORE_MODE=sync). Kept as
+    the baseline for benchmarks/bench_async.py.
+    """
+
+    def __init__(self):
+        self._store = None
+
+    async def start(self):
+        self._store = await run_in_threadpool(SyncedEventStore)
+
+    async def stop(self):
+        pass
+
+    async def get_snapshot(self, platform):
+        return await run_in_threadpool(self._store.get_snapshot, platform)
+
+    async def get_platform_view(self, platform, limit=20, cursor=0, snapshot=None):
+        return await run_in_threadpool(self._store.get_platform_view, platform, limit, cursor, snapshot)
+
+    async def get_reports_page(self, limit=20, cursor=None):
+        return await run_in_threadpool(self._store.get_reports_page, limit, cursor)
+
+    def page_snapshot(self, platform, snapshot, limit, cursor):
+        return self._store.page_snapshot(platform, snapshot, limit, cursor)
+
+    def page_fragments(self, platform, snapshot, limit, cursor):
+        return self._store.page_fragments(platform, snapshot, limit, cursor)
+
+    def seconds_until_refresh(self, platform):
+        return self._store.seconds_until_refresh(platform)
+
+    def events_near(self, lat, lon, radius_m, limit=50, platforms=None):
+        return self._store.events_near(lat, lon, radius_m, limit, platforms)
+
+    def events_in_bbox(self, min_lat, min_lon, max_lat, max_lon, limit=50, platforms=None):
+        return self._store.events_in_bbox(min_lat, min_lon, max_lat, max_lon, limit, platforms)
+
+    def change_log(self, platform):
+        return self._store.change_log(platform)
+
+    def db_pool_stats(self):
+        return get_pool().stats.snapshot()
@@ -0,0 +1,257 @@
+"""
+Load and latency benchmark of the /api/{platform} endpoints.
+
+For every cache size in --events (MOCK_EVENT_COUNT mock events per platform)
+starts `uvicorn app:app` against the SQLite stand-in (pg_standin) and drives
+each platform in --platforms with every --limits x --concurrency combination
+for --duration seconds, reporting requests/s and p50/p95/p99 latency.
+--cursors random spreads requests over the whole snapshot so pages are built
+rather than served from the page cache (size it with --page-cache).
+
+Then profiles, in-process on the same data, SyncedEventStore.get_platform_view
+and EventStoreBase._format_event separately (per-call p50/p95/p99;
+--cprofile adds the top functions).
+
+Results go to --json with the commit they were measured at; --compare
+old.json prints the change per matching case and exits 1 when a p95 or
+throughput regressed by more than --threshold.
+
+    cd social_media && python benchmarks/bench_api.py --events 50,10000 --json after.json --compare before.json
+
+Needs httpx in addition to the service requirements.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import cProfile
+import pstats
+import argparse
+import subprocess
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_async import REPO_DIR, _free_port, percentile, service_env  # noqa: E402
+
+
+def stand_in_env(args, events):
+    return service_env(
+        EVENT_STORE_MODE=args.mode,
+        PG_CONNECT_FACTORY="pg_standin:connect",
+        PG_STANDIN_SEED=str(args.rows),
+        PG_STANDIN_LATENCY_MS=str(args.db_latency_ms),
+        MOCK_EVENT_COUNT=str(events),
+        PAGE_CACHE_SIZE=str(args.page_cache),
+    )
+
+
+def start_server(env):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120  # large MOCK_EVENT_COUNT takes a while to generate
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + "/").status_code == 200:
+                return proc, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def latency_summary(latencies):
+    latencies.sort()
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def drive(base_url, platform, limit, cursors, concurrency, duration):
+    latencies = []
+    errors = 0
+    rng = random.Random(0)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop_at:
+                params = {"limit": limit, "cursor": rng.choice(cursors)}
+                start = time.perf_counter()
+                try:
+                    response = await client.get(f"/api/{platform}", params=params)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return dict(requests=len(latencies), errors=errors, rps=len(latencies) / elapsed, **latency_summary(latencies))
+
+
+def page_cursors(args, events, limit):
+    if args.cursors == "first":
+        return [0]
+    return list(range(0, max(events - limit, 0) + 1, limit)) or [0]
+
+
+def run_load(args, events):
+    results = []
+    proc, base_url = start_server(stand_in_env(args, events))
+    try:
+        for platform in args.platforms.split(","):
+            for limit in (int(v) for v in args.limits.split(",")):
+                cursors = page_cursors(args, events if platform != "nammasuttu" else 50, limit)
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    result = asyncio.run(drive(base_url, platform, limit, cursors, concurrency, args.duration))
+                    result.update(kind="load", events=events, platform=platform, limit=limit, concurrency=concurrency)
+                    results.append(result)
+                    print(f"events={events:<8} {platform:<10} limit={limit:<4} c={concurrency:<4} "
+                          f"{result['rps']:9.1f} req/s  p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+                          f"p99 {result['p99_ms']:7.2f} ms  errors {result['errors']}")
+    finally:
+        proc.terminate()
+        proc.wait()
+    return results
+
+
+def time_calls(fn, calls):
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        fn(*call)
+        latencies.append(time.perf_counter() - start)
+    summary = latency_summary(latencies)
+    return {k.replace("_ms", "_us"): v * 1000 for k, v in summary.items()}
+
+
+def run_profile(args, events):
+    """Per-call cost of get_platform_view and _format_event, in this process."""
+    os.environ.update(stand_in_env(args, events))
+    sys.path[:0] = [SERVICE_DIR, REPO_DIR]
+    import data_store
+    data_store.MOCK_EVENT_COUNT = events  # the module may already be imported with another count
+    store = data_store.SyncedEventStore()
+    results = []
+    profiler = cProfile.Profile() if args.cprofile else None
+    for platform in args.platforms.split(","):
+        snapshot = store.get_snapshot(platform)
+        for limit in (int(v) for v in args.limits.split(",")):
+            cursors = page_cursors(args, len(snapshot.events), limit)
+            calls = [(platform, limit, random.choice(cursors)) for _ in range(args.profile_calls)]
+            view = time_calls(store.get_platform_view, calls)
+            if profiler:
+                # A separate pass, so the profiler's overhead stays out of the timings
+                profiler.runcall(time_calls, store.get_platform_view, calls)
+            view.update(kind="get_platform_view", events=events, platform=platform, limit=limit)
+            results.append(view)
+        sample = [(platform, e) for e in snapshot.events[:args.profile_calls]]
+        fmt = time_calls(store._format_event, sample * max(1, args.profile_calls // max(len(sample), 1)))
+        fmt.update(kind="_format_event", events=events, platform=platform)
+        results.append(fmt)
+        print(f"events={events:<8} {platform:<10} _format_event p50 {fmt['p50_us']:7.1f} us  "
+              f"get_platform_view(limit={results[-2]['limit']}) p50 {results[-2]['p50_us']:8.1f} us  "
+              f"p99 {results[-2]['p99_us']:8.1f} us")
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+    return results
+
+
+def case_key(result):
+    return tuple(result.get(k) for k in ("kind", "events", "platform", "limit", "concurrency"))
+
+
+def compare(results, baseline_path, threshold):
+    """Print the change against a previous --json file; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None:
+            continue
+        if result["kind"] == "load":
+            checks = [("rps", -1), ("p95_ms", 1)]
+        else:
+            checks = [("p95_us", 1)]
+        changes = []
+        for metric, direction in checks:
+            if not old[metric]:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            regressed = change * direction > threshold
+            regressions += regressed
+            changes.append(f"{metric} {change:+.1%}{' REGRESSION' if regressed else ''}")
+        print(" ".join(str(v) for v in case_key(result) if v is not None), "->", ", ".join(changes))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--platforms", default="twitter,reddit,instagram,eventbrite,nammasuttu")
+    parser.add_argument("--events", default="50,10000", help="MOCK_EVENT_COUNT values (cache sizes)")
+    parser.add_argument("--limits", default="20,100")
+    parser.add_argument("--concurrency", default="10,50")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--cursors", choices=("first", "random"), default="random")
+    parser.add_argument("--page-cache", type=int, default=1024, help="PAGE_CACHE_SIZE of the server")
+    parser.add_argument("--mode", default="async", help="EVENT_STORE_MODE of the server")
+    parser.add_argument("--rows", type=int, default=10000, help="stand-in reports rows")
+    parser.add_argument("--db-latency-ms", type=float, default=1)
+    parser.add_argument("--profile-calls", type=int, default=2000)
+    parser.add_argument("--cprofile", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-profile", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous --json file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = []
+    for events in (int(v) for v in args.events.split(",")):
+        if not args.skip_load:
+            results.extend(run_load(args, events))
+        if not args.skip_profile:
+            results.extend(run_profile(args, events))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": git_commit(), "measured_at": int(time.time()), "args": vars(args),
+                       "results": results}, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Sync vs async throughput of the social_media API.
+
+Starts `uvicorn app:app` once per EVENT_STORE_MODE (sync, async) and drives it
+with N concurrent clients (default 100, 250, 500, 1000) for a fixed duration,
+reporting requests/s and p50/p99 latency per mode and concurrency.
+
+By default the app runs against the SQLite stand-in (pg_standin) with
+PG_STANDIN_LATENCY_MS of simulated Postgres round trip; note the stand-in has
+no async driver, so async mode then reaches it through the threadpool too.
+Pass --postgres to use POSTGRES_* from the environment (asyncpg in async mode).
+
+    cd social_media && python benchmarks/bench_async.py --path "/api/nammasuttu?mode=keyset&limit=20"
+
+Needs httpx in addition to the service requirements.
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVICE_DIR)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def service_env(**overrides):
+    """os.environ plus overrides, with the repo root on PYTHONPATH for common/."""
+    path = os.pathsep.join(p for p in (REPO_DIR, os.environ.get("PYTHONPATH")) if p)
+    return dict(os.environ, PYTHONPATH=path, **overrides)
+
+
+def start_server(mode, args):
+    port = _free_port()
+    env = service_env(EVENT_STORE_MODE=mode)
+    if not args.postgres:
+        env.update(
+            PG_CONNECT_FACTORY="pg_standin:connect",
+            PG_STANDIN_SEED=str(args.rows),
+            PG_STANDIN_LATENCY_MS=str(args.db_latency_ms),
+        )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + "/").status_code == 200:
+                return proc, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def drive(base_url, path, concurrency, duration):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop_at:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/nammasuttu?mode=keyset&limit=20")
+    parser.add_argument("--concurrency", default="100,250,500,1000")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--rows", type=int, default=10000, help="stand-in reports rows")
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--postgres", action="store_true", help="use the real Postgres from POSTGRES_*")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes.split(","):
+        proc, base_url = start_server(mode, args)
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                result = asyncio.run(drive(base_url, args.path, concurrency, args.duration))
+                result["mode"] = mode
+                results.append(result)
+                print(f"{mode:>5} c={concurrency:<5} {result['rps']:9.1f} req/s  "
+                      f"p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                      f"errors {result['errors']}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"path": args.path, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
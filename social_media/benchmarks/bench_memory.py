@@ -0,0 +1,98 @@
+"""
+Memory per cached event: tuple of dicts vs EventTable (compact_events.py).
+
+Generates --events synthetic events per size (synthetic_events.py, spread over
+30 days like the load-test chunks) and measures, with tracemalloc, what each
+snapshot layout keeps alive, how long packing takes, and the cost of building
+one formatted page (page_snapshot) from each layout.
+
+    cd social_media && python benchmarks/bench_memory.py --events 10000,100000,500000
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]  # the service's modules and common/
+
+from compact_events import EventTable  # noqa: E402
+from data_store import EventStoreBase, PlatformSnapshot  # noqa: E402
+from media_index import classify_events  # noqa: E402
+from synthetic_events import SyntheticEventGenerator  # noqa: E402
+
+
+def generate(args, count):
+    events = SyntheticEventGenerator(args.seed, start=int(time.time()) - 30 * 86400, span=30 * 86400).generate(count)
+    if args.platform == "instagram":
+        classify_events(events)
+    return events
+
+
+def traced(build):
+    """(result, bytes it keeps alive) for build()."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def page_time_us(store, platform, events, limit, pages):
+    snapshot = PlatformSnapshot(platform, events, 1, int(time.time()))
+    step = max(1, (len(events) - limit) // pages)
+    started = time.perf_counter()
+    for cursor in range(0, step * pages, step):
+        store.page_snapshot(platform, snapshot, limit, cursor)
+    return (time.perf_counter() - started) / pages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", default="10000,100000")
+    parser.add_argument("--platform", default="instagram")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    store = EventStoreBase()
+    results = []
+    for count in (int(v) for v in args.events.split(",")):
+        dicts, dict_bytes = traced(lambda: tuple(generate(args, count)))
+        del dicts
+
+        def packed():
+            started = time.perf_counter()
+            table = EventTable(generate(args, count))  # the dicts are garbage once packed
+            return table, time.perf_counter() - started
+        (table, pack_s), table_bytes = traced(packed)
+
+        dicts = tuple(generate(args, count))
+        result = {
+            "events": count,
+            "dict_bytes_per_event": dict_bytes / count,
+            "table_bytes_per_event": table_bytes / count,
+            "saving": 1 - table_bytes / dict_bytes,
+            "generate_and_pack_s": pack_s,
+            "dict_page_us": page_time_us(store, args.platform, dicts, args.limit, args.pages),
+            "table_page_us": page_time_us(store, args.platform, table, args.limit, args.pages),
+        }
+        del dicts, table
+        results.append(result)
+        print(f"{count:>8} events: dicts {result['dict_bytes_per_event']:6.0f} B/event, "
+              f"table {result['table_bytes_per_event']:6.0f} B/event ({result['saving']:.0%} less); "
+              f"page of {args.limit}: {result['dict_page_us']:.0f} us vs {result['table_page_us']:.0f} us")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"platform": args.platform, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Build time and query latency of the spatial index (spatial_index.py).
+
+Indexes --events events (default 1M) spread uniformly over the Bangalore
+bounding box used by the mock generator, split across the five platforms,
+then times random /api/events/near and /api/events/bbox lookups (index only,
+without formatting or HTTP).
+
+    cd social_media && python benchmarks/bench_spatial.py --events 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]  # the service's modules and common/
+
+from data_store import PlatformSnapshot, PLATFORMS  # noqa: E402
+from spatial_index import SpatialIndex  # noqa: E402
+
+LAT_RANGE = (12.9, 13.1)
+LON_RANGE = (77.5, 77.7)
+
+
+def percentile(sorted_values, pct):
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def time_queries(fn, queries):
+    latencies = []
+    results = 0
+    for q in queries:
+        start = time.perf_counter()
+        results += len(fn(*q))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "avg_results": results / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    index = SpatialIndex()
+    per_platform = args.events // len(PLATFORMS)
+    build_s = 0.0
+    for version, platform in enumerate(PLATFORMS, 1):
+        lats = rng.uniform(*LAT_RANGE, per_platform).round(6).tolist()
+        lons = rng.uniform(*LON_RANGE, per_platform).round(6).tolist()
+        events = tuple({"id": i, "latitude": la, "longitude": lo} for i, (la, lo) in enumerate(zip(lats, lons)))
+        snapshot = PlatformSnapshot(platform, events, version, int(time.time()))
+        start = time.perf_counter()
+        index.update(snapshot)
+        build_s += time.perf_counter() - start
+
+    points = np.column_stack((rng.uniform(*LAT_RANGE, args.queries), rng.uniform(*LON_RANGE, args.queries)))
+    results = {"events": per_platform * len(PLATFORMS), "build_s": build_s, "queries": {}}
+    print(f"Indexed {results['events']} events in {build_s:.2f}s")
+    for radius in (250, 500, 1000):
+        name = f"near r={radius}m"
+        results["queries"][name] = time_queries(
+            lambda la, lo: index.near(la, lo, radius, args.limit), points.tolist())
+    for half in (0.0025, 0.005):
+        name = f"bbox {half * 2:.3f}deg"
+        results["queries"][name] = time_queries(
+            lambda la, lo: index.bbox(la - half, lo - half, la + half, lo + half, args.limit), points.tolist())
+    for name, r in results["queries"].items():
+        print(f"{name:<18} p50 {r['p50_ms']:7.3f} ms  p99 {r['p99_ms']:7.3f} ms  results {r['avg_results']:.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# "columnar" (default): snapshots hold an EventTable; "dicts": the original tuple of dicts
+EVENT_STORE_LAYOUT = os.environ.get("EVENT_STORE_LAYOUT", "columnar")
+# A text column is dictionary-encoded when it has at most this share of distinct values
+DICTIONARY_MAX_RATIO = 0.5
+NO_CODE = -1
+NO_TIME = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+
+
+class _FloatColumn:
+    __slots__ = ("values", "has_missing")
+
+    def __init__(self, values):
+        self.values = np.array([math.nan if v is None else v for v in values], dtype=np.float64)
+        self.has_missing = bool(np.isnan(self.values).any())
+
+    def take(self, rows):
+        values = self.values[rows].tolist()
+        return [None if v != v else v for v in values] if self.has_missing else values
+
+
+class _DictionaryColumn:
+    """Repeated strings (location, category, media_url...) stored once plus an int32 code per row."""
+    __slots__ = ("vocabulary", "codes")
+
+    def __init__(self, values):
+        index = {}
+        self.codes = np.fromiter((NO_CODE if v is None else index.setdefault(v, len(index)) for v in values),
+                                 dtype=np.int32, count=len(values))
+        self.vocabulary = [*index, None]  # NO_CODE (-1) reads the trailing None
+
+    def take(self, rows):
+        vocabulary = self.vocabulary
+        return [vocabulary[c] for c in self.codes[rows].tolist()]
+
+
+class _TimestampColumn:
+    """
+    Naive ISO timestamps (strings or datetimes) as int64 microseconds, read back
+    as the same ISO strings. Values that would not come back identical (time
+    zones, other formats) are kept as they were in `exact`.
+    """
+    __slots__ = ("micros", "exact")
+
+    def __init__(self, values):
+        self.micros = np.full(len(values), NO_TIME, dtype=np.int64)
+        self.exact = {}
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            try:
+                text = v.isoformat() if isinstance(v, datetime) else v
+                parsed = datetime.fromisoformat(text)
+                if parsed.tzinfo is None and parsed.isoformat() == text:
+                    self.micros[i] = (parsed - _EPOCH) // timedelta(microseconds=1)
+                    continue
+            except (TypeError, ValueError, AttributeError):
+                pass
+            self.exact[i] = v
+
+    def take(self, rows):
+        micros = self.micros[rows]
+        # NO_TIME is NaT, which tolist() turns into None
+        text = [None if d is None else d.isoformat() for d in micros.astype("datetime64[us]").tolist()]
+        if self.exact:
+            positions = np.arange(len(self.micros))[rows]
+            for j in np.flatnonzero(micros == NO_TIME).tolist():
+                text[j] = self.exact.get(int(positions[j]))
+        return text
+
+
+class _ListColumn:
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def take(self, rows):
+        return self.values[rows]
+
+
+def _encode_column(key, values):
+    present = [v for v in values if v is not None]
+    if present and all(type(v) is float for v in present):
+        return _FloatColumn(values)
+    if present and all(type(v) is str for v in present) and \
+            len(set(present)) <= DICTIONARY_MAX_RATIO * len(values):
+        return _DictionaryColumn(values)  # also timestamps that repeat, e.g. one refresh time
+    if key == "timestamp":
+        return _TimestampColumn(values)
+    return _ListColumn(values)
+
+
+class EventTable:
+    """
+    Immutable, columnar stand-in for a tuple of event dicts.
+
+    One column per key: float64 arrays for coordinates, int64 microseconds for
+    timestamps, dictionary-encoded strings for low-cardinality text (location,
+    category, media_url) and plain lists for the rest (ids, titles,
+    descriptions). Indexing and slicing materialize dicts only for the rows
+    asked for, so a page costs its own rows, not the snapshot's. A key missing
+    from some rows reads back as None, which every reader treats the same
+    (they all use .get).
+    """
+
+    __slots__ = ("keys", "columns", "_length")
+
+    def __init__(self, events):
+        events = list(events)
+        keys = {}
+        for e in events:
+            for key in e:
+                keys.setdefault(key, None)
+        self.keys = tuple(keys)
+        self.columns = tuple(_encode_column(key, [e.get(key) for e in events]) for key in self.keys)
+        self._length = len(events)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._rows(slice(*index.indices(self._length)))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("EventTable index out of range")
+        return self._rows(slice(index, index + 1))[0]
+
+    def __iter__(self):
+        for start in range(0, self._length, 1024):
+            yield from self._rows(slice(start, min(start + 1024, self._length)))
+
+    def _rows(self, rows):
+        # Column by column (vectorized), then zipped into one dict per row
+        keys = self.keys
+        return [dict(zip(keys, values)) for values in zip(*(column.take(rows) for column in self.columns))]
+
+    def column(self, key):
+        """Column object for `key`, or None."""
+        try:
+            return self.columns[self.keys.index(key)]
+        except ValueError:
+            return None
+
+    def coordinates(self):
+        """(latitude, longitude) float64 arrays with NaN where missing, or None if not stored as floats."""
+        lat, lon = self.column("latitude"), self.column("longitude")
+        if isinstance(lat, _FloatColumn) and isinstance(lon, _FloatColumn):
+            return lat.values, lon.values
+        return None
+
+    def ids(self):
+        everything = slice(0, self._length)
+        event_id, row_id = self.column("event_id"), self.column("id")
+        event_ids = event_id.take(everything) if event_id else [None] * self._length
+        if row_id is None:
+            return event_ids
+        return [a or b for a, b in zip(event_ids, row_id.take(everything))]
+
+
+def pack_events(events):
+    """Snapshot storage for a list of event dicts, per EVENT_STORE_LAYOUT."""
+    if isinstance(events, (EventTable, tuple)):
+        return events
+    if EVENT_STORE_LAYOUT == "dicts":
+        return tuple(events)
+    return EventTable(events)
+
+
+def event_ids(events):
+    """Ids of every event (event_id or id), without materializing an EventTable."""
+    if hasattr(events, "ids"):  # EventTable, or a shared snapshot's MappedEvents
+        return events.ids()
+    return [e.get('event_id') or e.get('id') for e in events]
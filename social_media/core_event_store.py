@@ -1,11 +1,8 @@
-from faker import Faker
 import uuid
 import random
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
-fake = Faker()
+from db_pool import get_pool
 
 # Simple, layman-friendly event titles and descriptions
 simple_titles = [
@@ -30,13 +27,45 @@ bangalore_places = [
     "MG Road", "Indiranagar", "Koramangala", "Whitefield", "Jayanagar", "Malleshwaram", "HSR Layout", "BTM Layout", "Electronic City", "Hebbal", "Banashankari", "Rajajinagar", "Basavanagudi", "Ulsoor", "Yelahanka", "Frazer Town", "Vijayanagar", "Richmond Town", "Shivajinagar", "Marathahalli", "KR Puram"
 ]
 
-POSTGRES_CONFIG = {
-    'host': '35.200.252.72',
-    'user': 'postgres',
-    'password': 'er*Zx2p2Q3sm^{=[',
-    'dbname': 'postgres',
-    'port': 5432
-}
+event_categories = ["Event", "Traffic", "Weather", "Food", "Safety", "Culture"]
+
+# Statements run through the shared pool as server-side prepared statements
+ALL_REPORTS_SQL = (
+    "SELECT id, title, description, location, latitude, longitude, timestamp, category "
+    "FROM reports"
+)
+RECENT_REPORTS_SQL = (
+    "SELECT id, title, description, location, latitude, longitude, timestamp, category "
+    "FROM reports ORDER BY timestamp DESC, id DESC LIMIT $1"
+)
+# Keyset pagination over (timestamp, id). The row-value predicate lets Postgres
+# seek straight into reports_timestamp_id_idx, so page N costs the same as page 1.
+REPORTS_FIRST_PAGE_SQL = (
+    "SELECT id, title, description, location, latitude, longitude, timestamp, category "
+    "FROM reports ORDER BY timestamp DESC, id DESC LIMIT $1"
+)
+REPORTS_AFTER_KEY_SQL = (
+    "SELECT id, title, description, location, latitude, longitude, timestamp, category "
+    "FROM reports WHERE (timestamp, id) < ($1, $2) "
+    "ORDER BY timestamp DESC, id DESC LIMIT $3"
+)
+# Statement-level trigger so a bulk insert produces one notification, not one per row
+NOTIFY_CHANNEL = "reports_inserted"
+REPORTS_NOTIFY_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_reports_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS reports_inserted_notify ON reports;
+CREATE TRIGGER reports_inserted_notify AFTER INSERT ON reports
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reports_inserted();
+"""
+REPORTS_KEYSET_INDEX_SQL = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS reports_timestamp_id_idx "
+    "ON reports (timestamp DESC, id DESC)"
+)
 
 def generate_core_event():
     idx = random.randint(0, len(simple_titles) - 1)
@@ -55,76 +84,62 @@ def generate_core_event():
         "latitude": latitude,
         "longitude": longitude,
         "timestamp": datetime.utcnow().isoformat(),
-        "category": random.choice([
-            "Event", "Traffic", "Weather", "Food", "Safety", "Culture"
-        ])
+        "category": random.choice(event_categories)
     }
 
-def generate_shared_events(count=50):
-    # Ensure unique events by (title, location, category) and UUID, and also within the requested count
-    used_keys = set()
-    used_uuids = set()
-    events = []
-    tries = 0
-    while len(events) < count and tries < count * 50:
-        event = generate_core_event()
-        suffix = str(uuid.uuid4())[:8]
-        event['title'] = f"{event['title']} {suffix}"
-        event['description'] = f"{event['description']} (ref: {suffix})"
-        key = (event['title'], event['location'], event['category'])
-        # Ensure no duplicate event_id or key in the current batch
-        if event['event_id'] not in used_uuids and key not in used_keys:
-            used_uuids.add(event['event_id'])
-            used_keys.add(key)
-            events.append(event)
-        tries += 1
-    # Final deduplication in case of any accidental duplicates
-    unique_events = []
-    seen_ids = set()
-    for e in events:
-        if e['event_id'] not in seen_ids:
-            unique_events.append(e)
-            seen_ids.add(e['event_id'])
-    return unique_events[:count]
+def generate_shared_events(count=50, seed=None):
+    """
+    `count` unique events. Deterministic for a given `seed` (any int or string);
+    draws from a private NumPy generator, never from the global random module.
+    """
+    from synthetic_events import SyntheticEventGenerator  # it imports the tables above
+    return SyntheticEventGenerator(seed if seed is not None else uuid.uuid4().int).generate(count)
 
 # NOTE: fetch_reports_from_postgres is not used by SyncedEventStore
 # It's kept here if you have other uses for it.
 def fetch_reports_from_postgres():
-    conn = psycopg2.connect(
-        host=POSTGRES_CONFIG['host'],
-        user=POSTGRES_CONFIG['user'],
-        password=POSTGRES_CONFIG['password'],
-        dbname=POSTGRES_CONFIG['dbname'],
-        port=POSTGRES_CONFIG['port']
-    )
-    cur = conn.cursor()
-    # This query must match your actual 'reports' table schema
-    cur.execute("SELECT id, title, description, location, timestamp, category FROM reports")
-    rows = cur.fetchall()
+    rows = get_pool().execute("all_reports", ALL_REPORTS_SQL)
     events = []
     for row in rows:
+        timestamp = row["timestamp"]
         events.append({
-            "event_id": row[0],
-            "title": row[1],
-            "description": row[2],
-            "location": row[3],
-            "latitude": float(row[4]),
-            "longitude": float(row[5]),
-            "timestamp": row[6].isoformat() if hasattr(row[6], 'isoformat') else str(row[6]),
-            "category": row[7]
+            "event_id": row["id"],
+            "title": row["title"],
+            "description": row["description"],
+            "location": row["location"],
+            "latitude": float(row["latitude"]),
+            "longitude": float(row["longitude"]),
+            "timestamp": timestamp.isoformat() if hasattr(timestamp, 'isoformat') else str(timestamp),
+            "category": row["category"]
         })
-    cur.close()
-    conn.close()
     return events
 
 # NOTE: fetch_reports_from_db is the one used by SyncedEventStore for 'nammasuttu'
-# This is the function that needs the 'latitude' and 'longitude' columns in 'reports' table.
+# Connections come from the shared pool in db_pool, so repeated refreshes reuse
+# an open session and its prepared statement instead of reconnecting.
 def fetch_reports_from_db(batch_size=50):
-    conn = psycopg2.connect(**POSTGRES_CONFIG)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    # This SELECT statement assumes 'latitude' and 'longitude' columns exist in 'reports'
-    cur.execute(f"SELECT id, title, description, location, timestamp, category FROM reports ORDER BY timestamp DESC LIMIT %s", (batch_size,))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
\ No newline at end of file
+    return get_pool().execute("recent_reports", RECENT_REPORTS_SQL, (batch_size,))
+
+
+def fetch_reports_page(limit, after=None):
+    """
+    Return up to `limit` reports newest first, starting strictly after the
+    (timestamp, id) key `after`, or from the newest report when it is None.
+    """
+    if after is None:
+        return get_pool().execute("reports_first_page", REPORTS_FIRST_PAGE_SQL, (limit,))
+    timestamp, report_id = after
+    return get_pool().execute("reports_after_key", REPORTS_AFTER_KEY_SQL, (timestamp, report_id, limit))
+
+def ensure_reports_keyset_index():
+    # CONCURRENTLY cannot run inside a transaction; pool connections are autocommit
+    with get_pool().connection() as pc:
+        cur = pc.conn.cursor()
+        cur.execute(REPORTS_KEYSET_INDEX_SQL)
+        cur.close()
+
+def ensure_reports_notify_trigger():
+    with get_pool().connection() as pc:
+        cur = pc.conn.cursor()
+        cur.execute(REPORTS_NOTIFY_TRIGGER_SQL)
+        cur.close()
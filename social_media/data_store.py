@@ -1,72 +1,247 @@
+import os
+import json
 import time
-import random
+import base64
+import zlib
 import uuid # Needed for event_id generation if not explicitly imported
 from datetime import datetime # Needed for timestamp handling
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from decimal import Decimal
+import select
 import threading
+import itertools
+from collections import namedtuple
 from fastapi import APIRouter
 
 # Assuming core_event_store.py is in the same directory
-from core_event_store import generate_shared_events as _generate_shared_events_mock
-from core_event_store import POSTGRES_CONFIG # Import POSTGRES_CONFIG
+from core_event_store import fetch_reports_from_db as _fetch_reports_from_db
+from core_event_store import fetch_reports_page as _fetch_reports_page
+from core_event_store import ensure_reports_keyset_index, ensure_reports_notify_trigger
+from core_event_store import NOTIFY_CHANNEL
+from db_pool import get_pool
+from media_index import classify_events, get_media_url
+from event_stream import ChangeLog
+from spatial_index import SpatialIndex, MAX_SPATIAL_RESULTS
+from synthetic_events import SyntheticEventGenerator, load_chunks
+from common.metrics import get_registry
+from compact_events import pack_events
+from event_fragments import EventFragments, encode_json
+from shared_snapshots import SnapshotShare, SNAPSHOT_SHARE_DIR, SNAPSHOT_SHARE_POLL, SNAPSHOT_SHARE_WAIT
 
-class SyncedEventStore:
-    def __init__(self):
-        self.platform_events = {}  # Cache events per platform
-        self.last_generated = {}   # Cache last generated time per platform
-        self.lock = threading.Lock()
-        self.refresh_events() # Initial refresh
-        self._start_periodic_refresh()
+METRICS = get_registry("social_media_")
+span = METRICS.span
 
-    def refresh_events(self, platform=None):
-        with self.lock:
-            platforms = [platform] if platform else ["twitter", "reddit", "instagram", "eventbrite", "nammasuttu"]
-            for plat in platforms:
-                if plat == "nammasuttu":
-                    self.platform_events[plat] = self.fetch_reports_from_db(50)
-                else:
-                    # Generate a stable set of mock events for each platform
-                    # Use a platform-specific seed to ensure consistency for that platform
-                    # We can use a combination of the platform name and a daily "epoch" for fresh data daily
-                    current_day_seed = datetime.utcnow().day
-                    random.seed(plat + str(current_day_seed))
-                    self.platform_events[plat] = _generate_shared_events_mock(50)
-                    random.seed()  # Reset seed to avoid affecting other random operations
-                self.last_generated[plat] = int(time.time())
+PLATFORMS = ["twitter", "reddit", "instagram", "eventbrite", "nammasuttu"]
 
-    def _start_periodic_refresh(self):
-        def periodic():
-            while True:
-                # Refresh events periodically (e.g., every 5 minutes to get fresh mock data)
-                time.sleep(300) # Refresh every 5 minutes
-                self.refresh_events()
-        t = threading.Thread(target=periodic, daemon=True)
-        t.start()
+# Seconds between periodic refreshes of a platform's cached events; override per
+# platform with e.g. REFRESH_INTERVAL_NAMMASUTTU=60
+REFRESH_INTERVAL = int(os.environ.get("REFRESH_INTERVAL", 300))
+REFRESH_INTERVALS = {
+    plat: int(os.environ.get(f"REFRESH_INTERVAL_{plat.upper()}", REFRESH_INTERVAL))
+    for plat in PLATFORMS
+}
+# An empty snapshot (e.g. the DB was down) is rebuilt on demand at most this often,
+# and a failed nammasuttu fetch is retried this long after, keeping the old snapshot
+EMPTY_SNAPSHOT_RETRY = 5
 
-    def fetch_reports_from_db(self, batch_size=50):
-        try:
-            conn = psycopg2.connect(**POSTGRES_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            # This SELECT statement needs 'latitude' and 'longitude' columns in 'reports' table.
-            cur.execute(f"SELECT id, title, description, location, timestamp, category FROM reports ORDER BY timestamp DESC LIMIT %s", (batch_size,))
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            return rows
-        except Exception as e:
-            print(f"Error fetching from database: {e}")
-            return []
+# NAMMASUTTU_LISTEN=1 refreshes nammasuttu on Postgres NOTIFY from new inserts
+NAMMASUTTU_LISTEN = os.environ.get("NAMMASUTTU_LISTEN") == "1"
+NOTIFY_DEBOUNCE = 0.5
+
+# Mock events per platform and refresh; SYNTHETIC_EVENTS_DIR=<dir> serves the
+# chunks `python synthetic_events.py --out <dir>` wrote under <dir>/<platform> instead
+MOCK_EVENT_COUNT = int(os.environ.get("MOCK_EVENT_COUNT", 50))
+SYNTHETIC_EVENTS_DIR = os.environ.get("SYNTHETIC_EVENTS_DIR")
+
+# Largest page a keyset request may ask for, since those pages hit the DB directly
+MAX_KEYSET_PAGE_SIZE = int(os.environ.get("MAX_KEYSET_PAGE_SIZE", 100))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_keyset_cursor(timestamp, report_id):
+    """Opaque, URL-safe cursor for the (timestamp, id) key of the last row on a page."""
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = json.dumps([timestamp, report_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_keyset_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, report_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return timestamp, report_id
+
+
+class PlatformSnapshot(namedtuple("PlatformSnapshot", "platform events version generated_at fragments",
+                                  defaults=(None,))):
+    """
+    Immutable view of one platform's cached events. Snapshots are built off to
+    the side and published by swapping a reference, so readers never lock and
+    never see a half-built list. `events` is an EventTable (compact_events.py)
+    or, with EVENT_STORE_LAYOUT=dicts, a tuple of dicts; both index, slice and
+    iterate as dicts, which must not be mutated. `fragments` holds the same
+    events formatted and JSON-encoded for pages (event_fragments.py).
+    """
+    __slots__ = ()
+
+
+class EventStoreBase:
+    """
+    Snapshot bookkeeping, paging and formatting shared by SyncedEventStore
+    (threads + psycopg2 pool) and AsyncSyncedEventStore (asyncio).
+    """
+
+    def _init_snapshots(self):
+        # platform -> PlatformSnapshot. The dict itself is copy-on-write: writers
+        # publish a new dict, readers grab whatever reference is current.
+        self._snapshots = {}
+        self._version_counter = itertools.count(1)
+        self._publish_lock = threading.Lock()  # serializes writers only
+        # New events per platform, for the /api/{platform}/stream subscribers
+        self._change_logs = {plat: ChangeLog(plat) for plat in PLATFORMS}
+        # Latitude/longitude grid over every cached event, for /api/events/near and /bbox
+        self._spatial = SpatialIndex()
+        self._synthetic_events = {}  # platform -> events loaded from SYNTHETIC_EVENTS_DIR
+        self._retry_at = {}  # platform -> earliest retry after its source failed
+        # SNAPSHOT_SHARE_DIR: one worker refreshes, the others map its snapshots
+        self._share = SnapshotShare(SNAPSHOT_SHARE_DIR) if SNAPSHOT_SHARE_DIR else None
+
+    def _ensure_reports_schema(self):
+        if os.environ.get("ENSURE_REPORTS_INDEX") == "1":
+            try:
+                ensure_reports_keyset_index()
+            except Exception as e:
+                print(f"Error creating reports keyset index: {e}")
+        if os.environ.get("ENSURE_REPORTS_TRIGGER") == "1":
+            try:
+                ensure_reports_notify_trigger()
+            except Exception as e:
+                print(f"Error creating reports notify trigger: {e}")
+
+    def _make_snapshot(self, plat, events):
+        events = pack_events(events)
+        fragments = EventFragments(events, lambda e: self._format_event(plat, e))
+        return PlatformSnapshot(plat, events, next(self._version_counter), int(time.time()), fragments)
+
+    def _reports_snapshot(self, rows):
+        """
+        nammasuttu snapshot from freshly fetched `rows`, or None to keep serving the
+        current one: rows is None when the DB could not be read, and a transient
+        error must not replace good reports with an empty list.
+        """
+        if rows is None:
+            self._retry_at["nammasuttu"] = time.time() + EMPTY_SNAPSHOT_RETRY
+            if "nammasuttu" in self._snapshots:
+                return None
+            rows = []  # nothing to keep yet; the empty snapshot is retried on demand
+        return self._make_snapshot("nammasuttu", rows)
+
+    def _build_mock_snapshot(self, plat):
+        # Generate a stable set of mock events for each platform
+        # Use a platform-specific seed to ensure consistency for that platform
+        # We can use a combination of the platform name and a daily "epoch" for fresh data daily
+        # Seed and timestamps both come from the UTC day, so every build that day is
+        # identical; the seed is the whole date (not the day of the month), so the
+        # ids are new every day and never come back as already forwarded
+        day_start = int(time.time()) // 86400 * 86400
+        events = self._load_synthetic_events(plat)
+        if events is None:
+            # Private RNG per build: safe to run concurrently for several platforms
+            events = SyntheticEventGenerator(plat + str(day_start), start=day_start,
+                                             span=86400).generate(MOCK_EVENT_COUNT)
+            if plat == "instagram":
+                classify_events(events)  # media_url resolved once per refresh
+        return self._make_snapshot(plat, events)
+
+    def _load_synthetic_events(self, plat):
+        directory = os.path.join(SYNTHETIC_EVENTS_DIR, plat) if SYNTHETIC_EVENTS_DIR else None
+        if not directory or not os.path.isdir(directory):
+            return None
+        # Chunks are static load-test data: parse and pack them once, reuse on every refresh
+        cached = self._synthetic_events.get(plat)
+        if cached is None:
+            started = time.time()
+            events = load_chunks(directory)
+            if plat == "instagram":
+                classify_events(events)
+            cached = self._synthetic_events[plat] = pack_events(events)
+            print(f"Loaded {len(cached)} synthetic {plat} events from {directory} in {time.time() - started:.1f}s")
+        return cached
+
+    @span("publish_snapshot")
+    def _publish(self, snapshot):
+        with self._publish_lock:
+            previous = self._snapshots.get(snapshot.platform)
+            snapshots = dict(self._snapshots)
+            snapshots[snapshot.platform] = snapshot
+            self._snapshots = snapshots  # atomic reference swap
+        self._spatial.update(snapshot)  # only this platform's grid is rebuilt
+        # Readers already see the new snapshot; now wake stream subscribers
+        self._change_logs[snapshot.platform].record(previous, snapshot, self._format_event)
+
+    def change_log(self, platform):
+        return self._change_logs.get(platform)
+
+    def _following(self):
+        """True while another worker refreshes the snapshots and this one maps them."""
+        return self._share is not None and not self._share.leading
+
+    def _share_snapshot(self, snapshot):
+        # Leader only: write the snapshot for the other workers; may take a while for big ones
+        if self._share is not None and self._share.leading:
+            try:
+                self._share.write(snapshot)
+            except (OSError, ValueError) as e:
+                print(f"Error sharing {snapshot.platform} snapshot: {e}")
+
+    def _adopt_shared(self):
+        """Publish the snapshots the leader wrote since the last call."""
+        for shared in self._share.poll(PLATFORMS):
+            self._publish(PlatformSnapshot(shared.platform, shared.events, next(self._version_counter),
+                                           shared.generated_at, shared.fragments))
+
+    def _wait_for_shared(self, timeout=SNAPSHOT_SHARE_WAIT):
+        # A follower starting with (or before) the leader waits for its first snapshots
+        # rather than building its own; blocks, so run it off the event loop
+        deadline = time.monotonic() + timeout
+        while True:
+            self._adopt_shared()
+            missing = [plat for plat in PLATFORMS if plat not in self._snapshots]
+            if not missing or self._share.try_lead():
+                return
+            if time.monotonic() > deadline:
+                print(f"No shared snapshots for {', '.join(missing)} after {timeout}s; they will be built here")
+                return
+            time.sleep(SNAPSHOT_SHARE_POLL)
+
+    def _is_usable(self, snapshot):
+        return snapshot is not None and (
+            snapshot.events or time.time() - snapshot.generated_at < EMPTY_SNAPSHOT_RETRY)
+
+    def _due_times(self):
+        """When each platform is next due for a scheduled refresh."""
+        snapshots = self._snapshots
+        return {
+            plat: max((snapshots[plat].generated_at if plat in snapshots else 0) + REFRESH_INTERVALS[plat],
+                      self._retry_at.get(plat, 0))
+            for plat in PLATFORMS
+        }
 
-    def get_platform_view(self, platform, limit=20, cursor=0):
-        with self.lock:
-            # Retrieve from cache for mock data, or fetch from DB for nammasuttu
-            core_events = self.platform_events.get(platform, [])
+    def seconds_until_refresh(self, platform):
+        """How long the current snapshot of `platform` stays valid (used for Cache-Control)."""
+        snapshot = self._snapshots.get(platform)
+        if snapshot is None:
+            return 0
+        return max(0, snapshot.generated_at + REFRESH_INTERVALS[platform] - int(time.time()))
 
-        if not core_events:
-            # If cache is empty for some reason, try to refresh immediately (shouldn't happen often)
-            self.refresh_events(platform)
-            core_events = self.platform_events.get(platform, [])
+    def page_snapshot(self, platform, snapshot, limit, cursor):
+        """Format one offset page of `snapshot`; pure CPU, never touches the DB."""
+        core_events = snapshot.events
 
         # Apply pagination
         start_index = cursor
@@ -75,37 +250,58 @@ class SyncedEventStore:
         paginated_events = core_events[start_index:end_index]
         next_cursor = end_index if end_index < len(core_events) else None
 
-        formatted = [self._format_event(platform, e) for e in paginated_events]
+        with span("format_events"):
+            formatted = [self._format_event(platform, e) for e in paginated_events]
         # Filter out any None or empty dicts if _format_event returns them
         filtered = [f for f in formatted if f]
         return filtered, next_cursor
 
-    def _format_event(self, platform, e):
-        # Helper: choose media_url based on description/category
-        def get_media_url(event):
-            desc = (event.get('description', '') + ' ' + event.get('title', '') + ' ' + event.get('category', '')).lower()
-            # Mapping of keywords to media URLs
-            keyword_media = [
-                (['traffic', 'jam', 'roadblock'], "https://media.wired.com/photos/593256b42a990b06268a9e21/3:2/w_2240,c_limit/traffic-jam-getty.jpg"),
-                (['flood', 'waterlogging', 'rain'], "https://cms.accuweather.com/wp-content/uploads/2023/07/Flood_Agnostic-2.png?w=632"),
-                (['band', 'music', 'concert', 'live', 'performance'], "https://images.unsplash.com/photo-1511671782779-c97d3d27a1d4?auto=format&fit=crop&w=800&q=80"),
-                (['festival', 'celebration', 'parade'], "https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=800&q=80"),
-                (['emergency', 'alert', 'evacuate'], "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80"),
-                (['meetup', 'gathering', 'networking'], "https://images.unsplash.com/photo-1504384308090-c894fdcc538d?auto=format&fit=crop&w=800&q=80"),
-                (['protest', 'strike', 'march'], "https://images.unsplash.com/photo-1468421870903-4df1664ac249?auto=format&fit=crop&w=800&q=80"),
-                (['sports', 'sport', 'match', 'game', 'tournament'], "https://7esl.com/wp-content/uploads/2022/08/team-sports.jpg.webp"),
-                (['fire', 'blaze', 'burn'], "https://images.unsplash.com/photo-1509228468518-180dd4864904?auto=format&fit=crop&w=800&q=80"),
-                (['accident', 'crash', 'collision'], "https://akm-img-a-in.tosshub.com/indiatoday/images/story/202503/a-car-collides-with-water-tanker-in-hyderabad-07060782-16x9_0.jpeg?VersionId=GQ.4sE3YKdCGT102yLLRgc2uBFRBTdZ5&size=690:388"),
-                (['weather', 'storm', 'cyclone', 'wind'], "https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=800&q=80"),
-                (['food', 'cuisine', 'restaurant', 'dining'], "https://images.unsplash.com/photo-1504674900247-0877df9cc836?auto=format&fit=crop&w=800&q=80"),
-                (['art', 'exhibition', 'gallery'], "https://images.unsplash.com/photo-1465101046530-73398c7f28ca?auto=format&fit=crop&w=800&q=80"),
-                (['theatre', 'play', 'drama'], "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80"),
-            ]
-            for keywords, url in keyword_media:
-                if any(word in desc for word in keywords):
-                    return url
-            return "https://placehold.co/300"
+    def page_fragments(self, platform, snapshot, limit, cursor):
+        """page_snapshot as already-encoded JSON bytes per event, for splice_items."""
+        end_index = min(cursor + limit, len(snapshot.events))
+        next_cursor = end_index if end_index < len(snapshot.events) else None
+        if snapshot.fragments is None:
+            formatted, next_cursor = self.page_snapshot(platform, snapshot, limit, cursor)
+            return [encode_json(f) for f in formatted], next_cursor
+        return [f for f in snapshot.fragments.slice(cursor, end_index) if f], next_cursor
+
+    def events_near(self, lat, lon, radius_m, limit=50, platforms=None):
+        """Cached events of every platform within radius_m of (lat, lon), nearest first; pure CPU."""
+        limit = max(1, min(limit, MAX_SPATIAL_RESULTS))
+        return self._format_spatial(self._spatial.near(lat, lon, radius_m, limit, platforms))
+
+    def events_in_bbox(self, min_lat, min_lon, max_lat, max_lon, limit=50, platforms=None):
+        """Cached events of every platform inside the box, nearest its centre first; pure CPU."""
+        limit = max(1, min(limit, MAX_SPATIAL_RESULTS))
+        return self._format_spatial(self._spatial.bbox(min_lat, min_lon, max_lat, max_lon, limit, platforms))
+
+    def _format_spatial(self, matches):
+        results = []
+        for platform, e, distance in matches:
+            formatted = self._format_event(platform, e)
+            if formatted:
+                results.append({"platform": platform, "distance_m": round(distance, 1), "event": formatted})
+        return results
+
+    def _keyset_bounds(self, limit, cursor):
+        """Clamp the page size and decode the cursor; raises InvalidCursor."""
+        limit = max(1, min(limit, MAX_KEYSET_PAGE_SIZE))
+        after = decode_keyset_cursor(cursor) if cursor and cursor != "0" else None
+        return limit, after
 
+    def _keyset_page(self, rows, limit):
+        # `rows` holds up to limit + 1 rows; the extra one tells us another page exists
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_keyset_cursor(last['timestamp'], last['id'])
+
+        with span("format_events"):
+            formatted = [self._format_event("nammasuttu", r) for r in rows]
+        return [f for f in formatted if f], next_cursor
+
+    def _format_event(self, platform, e):
         # Use both DB and generated keys for compatibility
         event_id = e.get('event_id') or e.get('id')
         title = e.get('title')
@@ -125,6 +321,11 @@ class SyncedEventStore:
         # Handle cases where timestamp might be a datetime object from DB
         if isinstance(timestamp, datetime):
             timestamp = timestamp.isoformat()
+        # NUMERIC coordinate columns come back as Decimal, which JSON would encode as a string
+        if isinstance(latitude, Decimal):
+            latitude = float(latitude)
+        if isinstance(longitude, Decimal):
+            longitude = float(longitude)
 
         # format each core event differently
         if platform == "twitter":
@@ -141,7 +342,7 @@ class SyncedEventStore:
                 },
                 "user": {
                     "id": f"user_{str(event_id)[-4:]}",
-                    "username": f"user{random.randint(1000,9999)}"
+                    "username": f"user{1000 + zlib.crc32(str(event_id).encode()) % 9000}"
                 }
             }
         elif platform == "reddit":
@@ -150,7 +351,7 @@ class SyncedEventStore:
                     "id": event_id,
                     "title": title,
                     "selftext": description,
-                    "created_utc": int(time.time()), # Using current time for Reddit as per original
+                    "created_utc": int(time.time()), # Time the event was formatted, i.e. the snapshot build
                     "subreddit": "bangalore",
                     "author": f"user_{str(event_id)[-3:]}",
                     "geo": {
@@ -163,7 +364,7 @@ class SyncedEventStore:
             return {
                 "id": event_id,
                 "caption": f"{title} #{category.lower() if category else ''}",
-                "media_url": get_media_url(e),
+                "media_url": get_media_url(e),  # precomputed by classify_events on refresh
                 "timestamp": timestamp,
                 "location": {
                     "name": location,
@@ -220,6 +421,168 @@ class SyncedEventStore:
                 return None  # Skip events missing required fields
         return None # Return None if platform is not recognized or event cannot be formatted
 
+
+class SyncedEventStore(EventStoreBase):
+    def __init__(self):
+        self._init_snapshots()
+        # Single-flight: at most one build per platform at a time
+        self._refresh_locks = {plat: threading.Lock() for plat in PLATFORMS}
+        if self._share is not None and not self._share.try_lead():
+            self._start_following()
+        else:
+            self._start_refreshing()
+
+    def _start_refreshing(self):
+        self._ensure_reports_schema()
+        self.refresh_events() # Initial refresh
+        self._start_periodic_refresh()
+        if NAMMASUTTU_LISTEN:
+            self._start_report_listener()
+
+    def _start_following(self):
+        self._wait_for_shared()
+        if self._share.leading:
+            return self._start_refreshing()  # the leader went away while we waited
+
+        def follow():
+            # Map the leader's new snapshots until its lock frees up, then take over
+            while not self._share.try_lead():
+                time.sleep(SNAPSHOT_SHARE_POLL)
+                try:
+                    self._adopt_shared()
+                except Exception as e:
+                    print(f"Error adopting shared snapshots: {e}")
+            self._start_refreshing()
+        t = threading.Thread(target=follow, daemon=True)
+        t.start()
+
+    def refresh_events(self, platform=None):
+        platforms = [platform] if platform else PLATFORMS
+        for plat in platforms:
+            with self._refresh_locks[plat]:
+                snapshot = self._build_snapshot(plat)
+                if snapshot is None:
+                    continue  # source failed; the current snapshot stays
+                self._publish(snapshot)
+                self._share_snapshot(snapshot)
+
+    @span("build_snapshot")
+    def _build_snapshot(self, plat):
+        # Runs without any lock readers care about; may block on the DB.
+        # None means the DB failed and the current snapshot should stay.
+        if plat == "nammasuttu":
+            return self._reports_snapshot(self.fetch_reports_from_db(50))
+        return self._build_mock_snapshot(plat)
+
+    def get_snapshot(self, platform):
+        """Current snapshot for `platform`, building it (once, for all waiters) on a miss."""
+        snapshot = self._snapshots.get(platform)
+        if self._is_usable(snapshot):
+            return snapshot
+        if snapshot is not None and self._following():
+            return snapshot  # the leader retries empty snapshots, not every worker
+        lock = self._refresh_locks.get(platform)
+        if lock is None:
+            return PlatformSnapshot(platform, (), 0, int(time.time()))
+        with lock:
+            # Whoever held the lock before us may already have rebuilt it
+            current = self._snapshots.get(platform)
+            if current is not None and current is not snapshot:
+                return current
+            fresh = self._build_snapshot(platform)
+            if fresh is None:
+                return snapshot
+            self._publish(fresh)
+            self._share_snapshot(fresh)
+            return fresh
+
+    def _start_periodic_refresh(self):
+        def periodic():
+            # Each platform refreshes on its own interval (REFRESH_INTERVAL_<PLATFORM>)
+            while True:
+                now = time.time()
+                due_at = self._due_times()
+                for plat, when in due_at.items():
+                    if when <= now:
+                        try:
+                            self.refresh_events(plat)
+                        except Exception as e:
+                            print(f"Error refreshing {plat}: {e}")
+                time.sleep(max(1, min(self._due_times().values()) - time.time()))
+        t = threading.Thread(target=periodic, daemon=True)
+        t.start()
+
+    def _start_report_listener(self):
+        """
+        LISTEN on NOTIFY_CHANNEL and refresh nammasuttu as soon as new reports are
+        inserted (see core_event_store.REPORTS_NOTIFY_TRIGGER_SQL), instead of
+        waiting for the next scheduled refresh.
+        """
+        def listen():
+            backoff = 1
+            while True:
+                conn = None
+                try:
+                    conn = get_pool().connect_dedicated()
+                    cur = conn.cursor()
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    cur.close()
+                    backoff = 1
+                    print(f"Listening for new reports on channel '{NOTIFY_CHANNEL}'")
+                    while True:
+                        if not select.select([conn], [], [], 60)[0]:
+                            continue
+                        conn.poll()
+                        if not conn.notifies:
+                            continue
+                        # Let a burst of inserts settle, then refresh once for all of them
+                        time.sleep(NOTIFY_DEBOUNCE)
+                        conn.poll()
+                        del conn.notifies[:]
+                        self.refresh_events("nammasuttu")
+                except Exception as e:
+                    print(f"Report listener error, reconnecting in {backoff}s: {e}")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                finally:
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+        t = threading.Thread(target=listen, daemon=True)
+        t.start()
+
+    def fetch_reports_from_db(self, batch_size=50):
+        """Latest reports, or None if the DB could not be read."""
+        try:
+            # Uses a pooled connection and prepared statement (see db_pool.py)
+            with span("fetch_reports_from_db"):
+                return _fetch_reports_from_db(batch_size)
+        except Exception as e:
+            print(f"Error fetching from database: {e}")
+            return None
+
+    def get_reports_page(self, limit=20, cursor=None):
+        """
+        Keyset-paginated nammasuttu page read straight from the DB (no cache cap).
+        `cursor` is the opaque token from a previous page, or None/"0" for the first page.
+        Raises InvalidCursor for a malformed token.
+        """
+        limit, after = self._keyset_bounds(limit, cursor)
+        try:
+            with span("fetch_reports_page"):
+                rows = _fetch_reports_page(limit + 1, after)
+        except Exception as e:
+            print(f"Error fetching report page from database: {e}")
+            return [], None
+        return self._keyset_page(rows, limit)
+
+    def get_platform_view(self, platform, limit=20, cursor=0, snapshot=None):
+        # Lock-free read of the published snapshot; pass `snapshot` to page a
+        # specific version consistently (e.g. the one an ETag was computed for)
+        return self.page_snapshot(platform, snapshot or self.get_snapshot(platform), limit, cursor)
+
 # APIRouter is typically imported and used if you want to split your FastAPI app into modules.
 # For a single file app.py, it's not strictly necessary unless you plan to expand.
 # router = APIRouter() # Uncomment if you want to use this for modularization
\ No newline at end of file
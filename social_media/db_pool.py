@@ -0,0 +1,301 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from importlib import import_module
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+# Connection settings for the reports database. Every value can be overridden
+# from the environment so the service can be pointed at a local Postgres.
+POSTGRES_CONFIG = {
+    'host': os.environ.get('POSTGRES_HOST', '35.200.252.72'),
+    'user': os.environ.get('POSTGRES_USER', 'postgres'),
+    'password': os.environ.get('POSTGRES_PASSWORD', 'er*Zx2p2Q3sm^{=['),
+    'dbname': os.environ.get('POSTGRES_DB', 'postgres'),
+    'port': int(os.environ.get('POSTGRES_PORT', 5432))
+}
+
+# Pool sizing and behaviour (see PostgresPool for what each one does)
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", 5))
+PG_POOL_TIMEOUT = float(os.environ.get("PG_POOL_TIMEOUT", 10))
+PG_HEALTH_CHECK_INTERVAL = float(os.environ.get("PG_HEALTH_CHECK_INTERVAL", 30))
+# Optional "module:callable" used instead of psycopg2.connect, e.g.
+# "pg_standin:connect" to run against the in-process SQLite stand-in.
+PG_CONNECT_FACTORY = os.environ.get("PG_CONNECT_FACTORY")
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class PoolStats:
+    """Counters for pool wait time and checkout latency, in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waited_checkouts = 0
+        self.timeouts = 0
+        self.connections_created = 0
+        self.connections_discarded = 0
+        self.health_check_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.waited_checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_checkout(self, seconds):
+        # Time from getconn() to putconn(), i.e. how long a caller held a connection
+        with self._lock:
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            checkouts = self.checkouts or 1
+            return {
+                "checkouts": self.checkouts,
+                "waited_checkouts": self.waited_checkouts,
+                "timeouts": self.timeouts,
+                "connections_created": self.connections_created,
+                "connections_discarded": self.connections_discarded,
+                "health_check_failures": self.health_check_failures,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": self.wait_seconds_total / checkouts,
+                "checkout_seconds_total": self.checkout_seconds_total,
+                "checkout_seconds_max": self.checkout_seconds_max,
+                "checkout_seconds_avg": self.checkout_seconds_total / checkouts,
+            }
+
+
+class PooledConnection:
+    """A raw connection plus the bookkeeping the pool keeps for it."""
+
+    __slots__ = ("conn", "prepared", "last_used", "checked_out_at")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.prepared = set()  # names of server-side prepared statements on this session
+        self.last_used = time.monotonic()
+        self.checked_out_at = None
+
+
+class PostgresPool:
+    """
+    Bounded, thread-safe Postgres connection pool.
+
+    - At most `maxconn` connections are open; callers beyond that wait up to
+      `timeout` seconds and then get PoolTimeout instead of opening a new one.
+    - `minconn` connections are opened up front and idle connections are reused
+      most-recently-used first, so the hot ones stay warm.
+    - Connections idle for longer than `health_check_interval` are pinged with
+      `SELECT 1` before being handed out; dead ones are replaced transparently.
+    - `execute()` runs named statements through PREPARE/EXECUTE so each session
+      parses and plans a query once.
+    """
+
+    def __init__(self, config=None, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX,
+                 timeout=PG_POOL_TIMEOUT, health_check_interval=PG_HEALTH_CHECK_INTERVAL,
+                 connect=None):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.config = dict(config or POSTGRES_CONFIG)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect_fn = connect or _resolve_connect_factory()
+        self._idle = []   # LIFO stack of PooledConnection
+        self._size = 0    # open connections, idle + checked out
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = PoolStats()
+
+        try:
+            for _ in range(minconn):
+                pc = self._open()
+                with self._cond:
+                    self._idle.append(pc)
+                    self._size += 1
+        except Exception as e:
+            print(f"Error pre-opening Postgres pool connections: {e}")
+
+    def _open(self):
+        conn = self._connect_fn(**self.config)
+        # Pool connections only run standalone statements; autocommit keeps them
+        # out of idle-in-transaction and keeps prepared statements per session.
+        conn.autocommit = True
+        self.stats.incr("connections_created")
+        return PooledConnection(conn)
+
+    def _is_healthy(self, pc):
+        if getattr(pc.conn, "closed", 0):
+            return False
+        if time.monotonic() - pc.last_used < self.health_check_interval:
+            return True
+        try:
+            cur = pc.conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            self.stats.incr("health_check_failures")
+            return False
+
+    def _close_quietly(self, pc):
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+
+    def connect_dedicated(self):
+        """
+        Open an autocommit connection outside the pool (not counted against
+        maxconn), for session-bound work such as LISTEN.
+        """
+        conn = self._connect_fn(**self.config)
+        conn.autocommit = True
+        return conn
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            pc = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Postgres pool is closed")
+                    if self._idle:
+                        pc = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        # Reserve the slot now and open the connection outside the lock
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats.incr("timeouts")
+                        raise PoolTimeout(
+                            f"No Postgres connection available after {self.timeout}s "
+                            f"(max={self.maxconn})")
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if pc is None:
+                try:
+                    pc = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(pc):
+                self._discard(pc)
+                continue
+
+            if waited:
+                self.stats.record_wait(time.monotonic() - start)
+            self.stats.incr("checkouts")
+            pc.checked_out_at = time.monotonic()
+            return pc
+
+    def _discard(self, pc):
+        self._close_quietly(pc)
+        self.stats.incr("connections_discarded")
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def putconn(self, pc, discard=False):
+        now = time.monotonic()
+        if pc.checked_out_at is not None:
+            self.stats.record_checkout(now - pc.checked_out_at)
+            pc.checked_out_at = None
+        if discard or self._closed or getattr(pc.conn, "closed", 0):
+            self._discard(pc)
+            return
+        pc.last_used = now
+        with self._cond:
+            self._idle.append(pc)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a PooledConnection; it is discarded if the block raises a DB error."""
+        pc = self.getconn()
+        try:
+            yield pc
+        except psycopg2.Error:
+            self.putconn(pc, discard=True)
+            raise
+        except BaseException:
+            self.putconn(pc)
+            raise
+        else:
+            self.putconn(pc)
+
+    def execute(self, name, sql, params=()):
+        """
+        Run `sql` (written with $1, $2... placeholders) as the named prepared
+        statement `name` and return all rows as dicts.
+        """
+        with self.connection() as pc:
+            cur = pc.conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                if name not in pc.prepared:
+                    cur.execute(f"PREPARE {name} AS {sql}")
+                    pc.prepared.add(name)
+                if params:
+                    placeholders = ", ".join(["%s"] * len(params))
+                    cur.execute(f"EXECUTE {name} ({placeholders})", tuple(params))
+                else:
+                    cur.execute(f"EXECUTE {name}")
+                return cur.fetchall()
+            finally:
+                cur.close()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pc in idle:
+            self._discard(pc)
+
+
+def _resolve_connect_factory():
+    if not PG_CONNECT_FACTORY:
+        return psycopg2.connect
+    module_name, _, attr = PG_CONNECT_FACTORY.partition(":")
+    return getattr(import_module(module_name), attr or "connect")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool shared by every DB path in social_media."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PostgresPool()
+    return _pool
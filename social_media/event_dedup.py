@@ -0,0 +1,306 @@
+import os
+import re
+import time
+import heapq
+import hashlib
+import itertools
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Geohash precision of the spatial cells (6 -> ~1.2 km x 0.6 km); an event is
+# compared with open clusters in its own cell and the eight around it
+DEDUP_GEOHASH_PRECISION = int(os.environ.get("DEDUP_GEOHASH_PRECISION", 6))
+# Seconds a cluster stays open for duplicates after its first event arrived
+DEDUP_WINDOW = float(os.environ.get("DEDUP_WINDOW", 300))
+# Largest SimHash Hamming distance (of 64 bits) between the title + description
+# texts of one incident, and between just their titles: some platforms (instagram
+# captions) carry only the headline, which would never be close to a full text
+DEDUP_SIMHASH_DISTANCE = int(os.environ.get("DEDUP_SIMHASH_DISTANCE", 10))
+DEDUP_TITLE_DISTANCE = int(os.environ.get("DEDUP_TITLE_DISTANCE", 6))
+# When both sides have a description, their SimHashes must also be this close:
+# the same headline at two places ("... at MG Road" / "... at Ulsoor") is two incidents
+DEDUP_DESCRIPTION_DISTANCE = int(os.environ.get("DEDUP_DESCRIPTION_DISTANCE", 3))
+# Open clusters kept at most; the oldest are closed early beyond this
+DEDUP_MAX_OPEN = int(os.environ.get("DEDUP_MAX_OPEN", 50000))
+DEDUP_MAX_MEMBERS = 1000  # member ids reported per cluster
+TOKEN_CACHE_SIZE = 100000
+
+# Which copy of an incident is forwarded: the most structured source first
+CANONICAL_PRIORITY = {"nammasuttu": 0, "eventbrite": 1, "twitter": 2, "instagram": 3, "reddit": 4}
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+HASHTAG_RE = re.compile(r"#\w*")
+TOKEN_RE = re.compile(r"\b[a-z]{2,}\b")  # whole words only: ids like "(ref: 1a2b3c4d)" don't count
+NO_GEO = "nogeo"
+
+
+def event_fields(platform, item):
+    """(id, latitude, longitude, time, title, description) of one item as /api/{platform} returns it."""
+    if platform == "reddit":
+        data = item.get("data", {})
+        geo = data.get("geo") or {}
+        return (data.get("id"), geo.get("lat"), geo.get("lng"), data.get("created_utc"),
+                data.get("title") or "", data.get("selftext") or "")
+    if platform == "twitter":
+        coords = (item.get("geo") or {}).get("coordinates") or {}
+        title, _, description = (item.get("text") or "").partition(": ")
+        return (item.get("id"), coords.get("latitude"), coords.get("longitude"), item.get("created_at"),
+                title, description)
+    if platform == "instagram":
+        location = item.get("location") or {}
+        return (item.get("id"), location.get("latitude"), location.get("longitude"), item.get("timestamp"),
+                HASHTAG_RE.sub("", item.get("caption") or ""), "")
+    if platform == "eventbrite":
+        address = (item.get("venue") or {}).get("address") or {}
+        return (item.get("id"), address.get("latitude"), address.get("longitude"),
+                (item.get("start") or {}).get("local"),
+                (item.get("name") or {}).get("text") or "", (item.get("description") or {}).get("text") or "")
+    return (item.get("id"), item.get("latitude"), item.get("longitude"), item.get("timestamp"),
+            item.get("title") or "", item.get("description") or "")
+
+
+def _unix_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)  # the store emits naive UTC timestamps
+        return parsed.timestamp()
+    return None
+
+
+def geohash_cell(lat, lon, precision=DEDUP_GEOHASH_PRECISION):
+    """Integer (lat, lon) index of the geohash cell containing the point."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    lat_idx = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lon_idx = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return lat_idx, lon_idx
+
+
+def geohash_string(cell, precision=DEDUP_GEOHASH_PRECISION):
+    """Standard base32 geohash of a cell from geohash_cell."""
+    lat_idx, lon_idx = cell
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    value = 0
+    # Bits interleave longitude first, most significant first
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lon_bits -= 1
+            value = (value << 1) | ((lon_idx >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((lat_idx >> lat_bits) & 1)
+    return "".join(GEOHASH_ALPHABET[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def _neighbourhood(cell, precision):
+    if cell == NO_GEO:
+        return (NO_GEO,)
+    lat_idx, lon_idx = cell
+    lon_cells = 1 << ((5 * precision + 1) // 2)
+    return [(lat_idx + dy, (lon_idx + dx) % lon_cells) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+
+def _simhash(hashes):
+    if not len(hashes):
+        return 0
+    # Per bit position: set in the fingerprint if set in most token hashes
+    votes = np.unpackbits(hashes.view(np.uint8)).reshape(len(hashes), 64).sum(axis=0, dtype=np.int32)
+    return int.from_bytes(np.packbits(votes * 2 > len(hashes)).tobytes(), "big")
+
+
+class _Cluster:
+    __slots__ = ("id", "cell", "text_hash", "title_hash", "description_hash", "first_ts", "last_ts", "posted",
+                 "members", "size", "canonical_platform", "canonical_item")
+
+    def __init__(self, cluster_id, cell, text_hash, title_hash, description_hash, ts, posted, platform, member_id,
+                 item):
+        self.id = cluster_id
+        self.cell = cell
+        self.text_hash = text_hash
+        self.title_hash = title_hash
+        self.description_hash = description_hash  # None until a member with a description joins
+        self.first_ts = self.last_ts = ts  # arrival times
+        self.posted = posted  # the canonical item's own time, or None
+        self.members = [(platform, member_id)]
+        self.size = 1
+        self.canonical_platform = platform
+        self.canonical_item = item
+
+
+class EventDeduplicator:
+    """
+    Streaming grouping of the same incident reported on several platforms.
+
+    Every event is matched against the open clusters in its geohash cell and
+    the neighbouring cells: it joins one if it arrived within `window` seconds
+    of the cluster's first event and the 64-bit SimHashes of title + description differ in
+    at most `max_distance` bits (or those of the titles alone in at most
+    `title_distance`), and, when both have a description, the SimHashes of the
+    descriptions differ in at most `description_distance`; otherwise it opens a
+    new cluster. A cluster
+    closes `window` seconds after its first event arrived and is then emitted
+    as one canonical event plus its member ids.
+
+    Windows use arrival time (`now`), not the posts' own times: those come from
+    different clocks (eventbrite's is the event's future start, reddit's the
+    snapshot build), so one post would otherwise close every open cluster at
+    once. Post times only break ties between equally close clusters.
+
+    Memory is bounded by `max_open` open clusters (the oldest close early) and
+    DEDUP_MAX_MEMBERS ids per cluster. An item that is already a member of an
+    open cluster (fetched again before its cluster was forwarded) is ignored.
+    Not thread-safe; callers serialise access.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, max_distance=DEDUP_SIMHASH_DISTANCE,
+                 title_distance=DEDUP_TITLE_DISTANCE, description_distance=DEDUP_DESCRIPTION_DISTANCE,
+                 precision=DEDUP_GEOHASH_PRECISION, max_open=DEDUP_MAX_OPEN):
+        self.window = window
+        self.max_distance = max_distance
+        self.title_distance = title_distance
+        self.description_distance = description_distance
+        self.precision = precision
+        self.max_open = max_open
+        self._cells = {}  # cell -> list of open clusters
+        self._expiry = []  # heap of (close_at, cluster id, cluster)
+        self._open = 0
+        self._ids = itertools.count()
+        self._token_hashes = {}
+        self._members = set()  # (platform, id) of every member of an open cluster
+        self.watermark = 0.0  # latest arrival time seen
+        self.stats = {"events": 0, "duplicates": 0, "clusters": 0, "emitted": 0, "forced_closes": 0,
+                      "replays": 0, "ambiguous": 0}
+
+    def _token_hash_array(self, text):
+        cache = self._token_hashes
+        if len(cache) > TOKEN_CACHE_SIZE:
+            cache.clear()
+        tokens = TOKEN_RE.findall(text.lower())
+        hashes = np.empty(len(tokens), dtype=np.uint64)
+        for i, token in enumerate(tokens):
+            h = cache.get(token)
+            if h is None:
+                h = cache[token] = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            hashes[i] = h
+        return hashes
+
+    def simhash(self, text):
+        """64-bit SimHash of the words in `text`."""
+        return _simhash(self._token_hash_array(text))
+
+    def add(self, platform, item, now=None):
+        """Feed one item that arrived at `now` (default: now); returns the clusters this closed (see expire)."""
+        member_id, lat, lon, ts, title, description = event_fields(platform, item)
+        if member_id is not None and (platform, member_id) in self._members:
+            self.stats["replays"] += 1
+            return []
+        posted = _unix_time(ts)
+        ts = time.time() if now is None else now
+        self.stats["events"] += 1
+        try:
+            cell = geohash_cell(float(lat), float(lon), self.precision)
+        except (TypeError, ValueError):
+            cell = NO_GEO
+        title_hashes = self._token_hash_array(title)
+        description_hashes = self._token_hash_array(description)
+        title_hash = _simhash(title_hashes)
+        text_hash = _simhash(np.concatenate((title_hashes, description_hashes)))
+        description_hash = _simhash(description_hashes) if len(description_hashes) else None
+
+        match = self._match(cell, text_hash, title_hash, description_hash, ts, posted)
+        if match is not None:
+            self.stats["duplicates"] += 1
+            match.size += 1
+            match.last_ts = max(match.last_ts, ts)
+            if match.description_hash is None:
+                match.description_hash = description_hash
+            if len(match.members) < DEDUP_MAX_MEMBERS:
+                match.members.append((platform, member_id))
+                self._members.add((platform, member_id))
+            if CANONICAL_PRIORITY.get(platform, 99) < CANONICAL_PRIORITY.get(match.canonical_platform, 99):
+                match.canonical_platform, match.canonical_item, match.posted = platform, item, posted
+        else:
+            cluster = _Cluster(next(self._ids), cell, text_hash, title_hash, description_hash, ts, posted, platform,
+                               member_id, item)
+            self._members.add((platform, member_id))
+            self._cells.setdefault(cell, []).append(cluster)
+            heapq.heappush(self._expiry, (ts + self.window, cluster.id, cluster))
+            self._open += 1
+            self.stats["clusters"] += 1
+
+        if ts > self.watermark:
+            self.watermark = ts
+        emitted = self.expire(self.watermark)
+        while self._open > self.max_open:
+            self.stats["forced_closes"] += 1
+            emitted.append(self._close(heapq.heappop(self._expiry)[2]))
+        return emitted
+
+    def _match(self, cell, text_hash, title_hash, description_hash, ts, posted):
+        best, best_key = None, None
+        descriptions = set()  # described incidents a caption-only item could belong to
+        for neighbour in _neighbourhood(cell, self.precision):
+            for cluster in self._cells.get(neighbour, ()):
+                if abs(ts - cluster.first_ts) > self.window:
+                    continue
+                if description_hash is not None and cluster.description_hash is not None and \
+                        bin(cluster.description_hash ^ description_hash).count("1") > self.description_distance:
+                    continue
+                distance = bin(cluster.text_hash ^ text_hash).count("1")
+                if distance > self.max_distance and \
+                        bin(cluster.title_hash ^ title_hash).count("1") > self.title_distance:
+                    continue
+                if cluster.description_hash is not None:
+                    descriptions.add(cluster.description_hash)
+                # Closest text first; between equals, the closest post time
+                gap = abs(posted - cluster.posted) if posted is not None and cluster.posted is not None \
+                    else float("inf")
+                if best_key is None or (distance, gap) < best_key:
+                    best, best_key = cluster, (distance, gap)
+        if description_hash is None and len(descriptions) > 1:
+            # A bare headline matching several distinct incidents: forward it on its own
+            # rather than guess and make one of them impure
+            self.stats["ambiguous"] += 1
+            return None
+        return best
+
+    def expire(self, now):
+        """Close and return every cluster whose window ended by `now` (arrival time, i.e. the wall clock)."""
+        emitted = []
+        while self._expiry and self._expiry[0][0] <= now:
+            emitted.append(self._close(heapq.heappop(self._expiry)[2]))
+        return emitted
+
+    def flush(self):
+        """Close everything still open (shutdown)."""
+        return self.expire(float("inf"))
+
+    def _close(self, cluster):
+        bucket = self._cells[cluster.cell]
+        bucket.remove(cluster)
+        if not bucket:
+            del self._cells[cluster.cell]
+        self._open -= 1
+        self._members.difference_update(cluster.members)
+        self.stats["emitted"] += 1
+        return {
+            "platform": cluster.canonical_platform,
+            "item": cluster.canonical_item,
+            "members": [{"platform": p, "id": i} for p, i in cluster.members],
+            "size": cluster.size,
+            "geohash": geohash_string(cluster.cell, self.precision) if cluster.cell != NO_GEO else None,
+            "first_seen": cluster.first_ts,
+            "last_seen": cluster.last_ts,
+            "posted": cluster.posted,
+        }
+
+    def open_clusters(self):
+        return self._open
@@ -0,0 +1,79 @@
+import os
+import json
+import threading
+
+# Events of a new snapshot encoded up front, while it is built off the request path;
+# the rest (large synthetic snapshots) are encoded a block at a time on first read
+FRAGMENT_PREENCODE = int(os.environ.get("FRAGMENT_PREENCODE", 10000))
+# Encoded events kept per snapshot; blocks past this are encoded per read and dropped
+FRAGMENT_MAX_EVENTS = int(os.environ.get("FRAGMENT_MAX_EVENTS", 200000))
+FRAGMENT_BLOCK = 256
+
+# Stands in for the item list in an envelope until the fragments are spliced in
+PAGE_ITEMS = "\x00page-items\x00"
+_PAGE_ITEMS_JSON = json.dumps(PAGE_ITEMS).encode()
+
+
+def encode_json(value):
+    """Compact JSON bytes, as every cached page and stream entry is encoded."""
+    return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+class EventFragments:
+    """
+    Every event of one snapshot as its formatted, JSON-encoded bytes (None for
+    events the formatter skips), so a page of any cursor/limit is a join of
+    ready-made fragments rather than format + encode per request. Each event
+    is encoded at most once per snapshot, whichever reader gets to it first.
+    """
+
+    __slots__ = ("events", "format_event", "_blocks", "_kept", "_lock")
+
+    def __init__(self, events, format_event, preencode=FRAGMENT_PREENCODE):
+        self.events = events
+        self.format_event = format_event
+        self._blocks = [None] * -(-len(events) // FRAGMENT_BLOCK)
+        self._kept = 0
+        self._lock = threading.Lock()
+        for b in range(-(-min(preencode, len(events)) // FRAGMENT_BLOCK)):
+            self._block(b)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.events)
+        return self._block(index // FRAGMENT_BLOCK)[index % FRAGMENT_BLOCK]
+
+    def slice(self, start, stop):
+        """Fragments of events[start:stop], same slicing rules as the events."""
+        start, stop, _ = slice(start, stop).indices(len(self.events))
+        out = []
+        for b in range(start // FRAGMENT_BLOCK, -(-stop // FRAGMENT_BLOCK)):
+            base = b * FRAGMENT_BLOCK
+            out.extend(self._block(b)[max(start - base, 0):stop - base])
+        return out
+
+    def _block(self, b):
+        block = self._blocks[b]
+        if block is not None:
+            return block
+        events = self.events[b * FRAGMENT_BLOCK:(b + 1) * FRAGMENT_BLOCK]
+        block = tuple(self._encode(e) for e in events)
+        # Two readers racing on a block both encode it; the bytes are identical
+        with self._lock:
+            if self._kept + len(block) <= FRAGMENT_MAX_EVENTS and self._blocks[b] is None:
+                self._blocks[b] = block
+                self._kept += len(block)
+        return block
+
+    def _encode(self, e):
+        formatted = self.format_event(e)
+        return encode_json(formatted) if formatted else None
+
+
+def splice_items(envelope, fragments):
+    """Encode `envelope` (holding PAGE_ITEMS where the items go) with the fragments joined in."""
+    items = b"[" + b",".join(fragments) + b"]"
+    return encode_json(envelope).replace(_PAGE_ITEMS_JSON, items, 1)
@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+import threading
+import itertools
+from collections import deque
+
+from compact_events import event_ids
+from event_fragments import encode_json
+
+# Events kept per platform for streaming subscribers to catch up from. A
+# subscriber that falls further behind than this gets a "gap" notice and
+# resumes at the oldest retained event instead of the server buffering for it.
+STREAM_LOG_SIZE = int(os.environ.get("STREAM_LOG_SIZE", 10000))
+STREAM_MAX_BATCH = 100    # events written per chunk
+STREAM_HEARTBEAT = 15     # seconds of silence before a keep-alive is sent
+
+# Cursors are only meaningful within one process; the epoch tells a resumed
+# client apart from one whose cursor came from a previous run or another worker.
+STREAM_EPOCH = format(int(time.time() * 1000), "x")
+
+
+def format_stream_cursor(seq):
+    return f"{STREAM_EPOCH}-{seq}"
+
+
+def parse_stream_cursor(cursor):
+    """Sequence number to resume after; 0 (replay everything retained) if the cursor is unusable."""
+    if not cursor:
+        return 0
+    epoch, _, seq = cursor.rpartition("-")
+    if epoch != STREAM_EPOCH or not seq.isdigit():
+        return 0
+    return int(seq)
+
+
+class ChangeLog:
+    """
+    Bounded, append-only log of the events each new snapshot of a platform
+    added (events whose id was not in the previous snapshot), stored as
+    pre-encoded JSON. Written from whichever thread publishes snapshots,
+    awaited by any number of asyncio subscribers.
+    """
+
+    def __init__(self, platform, maxlen=STREAM_LOG_SIZE):
+        self.platform = platform
+        self._entries = deque(maxlen=maxlen)  # (seq, encoded event)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._waiters = set()  # (loop, asyncio.Event)
+
+    def record(self, previous, snapshot, format_event):
+        old_ids = set(event_ids(previous.events)) if previous else set()
+        new = [i for i, event_id in enumerate(event_ids(snapshot.events)) if event_id not in old_ids]
+        # Entries that would fall straight out of the log are counted, not encoded
+        skipped = max(0, len(new) - self._entries.maxlen)
+        encoded = []
+        for i in new[skipped:]:
+            if snapshot.fragments is not None:
+                body = snapshot.fragments[i]  # shared with the page endpoints
+                body = bytes(body) if body else None  # a memoryview for shared snapshots
+            else:
+                formatted = format_event(self.platform, snapshot.events[i])
+                body = encode_json(formatted) if formatted else None
+            if body:
+                encoded.append(body)
+        if not encoded and not skipped:
+            return
+        with self._lock:
+            self._seq += skipped  # so subscribers behind them still see the gap
+            for body in encoded:
+                self._seq += 1
+                self._entries.append((self._seq, body))
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def read(self, after, limit):
+        """Up to `limit` entries with seq > after, and whether entries were lost in between."""
+        with self._lock:
+            if not self._entries:
+                return [], False
+            first = self._entries[0][0]
+            start = max(after + 1, first)
+            offset = start - first
+            entries = list(itertools.islice(self._entries, offset, offset + limit))
+            # A fresh subscriber (after == 0) starts at the oldest retained entry; no gap
+            return entries, 0 < after and after + 1 < first
+
+    async def wait(self, after, timeout):
+        """Wait until an entry past `after` exists; False on timeout."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self._seq > after:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def _sse_frame(platform, seq, body):
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (format_stream_cursor(seq).encode(), platform.encode(), body)
+
+
+def _ndjson_frame(platform, seq, body):
+    return b'{"cursor":"%s","platform":"%s","event":%s}\n' % (
+        format_stream_cursor(seq).encode(), platform.encode(), body)
+
+
+async def stream_events(request, log, cursor, fmt, heartbeat=STREAM_HEARTBEAT):
+    """
+    Async generator of SSE or NDJSON chunks for `log`, starting after `cursor`.
+
+    It only produces the next chunk once the previous one has been handed to
+    the transport, so a slow client stalls its own generator (TCP backpressure)
+    and costs at most one batch of memory; if it falls behind the retained log
+    it is told about the gap rather than having the server queue for it.
+    """
+    frame = _sse_frame if fmt == "sse" else _ndjson_frame
+    after = parse_stream_cursor(cursor)
+    while not await request.is_disconnected():
+        entries, gap = log.read(after, STREAM_MAX_BATCH)
+        if gap:
+            resumed = format_stream_cursor(entries[0][0] - 1 if entries else after)
+            if fmt == "sse":
+                yield b'event: gap\ndata: {"resumed_after":"%s"}\n\n' % resumed.encode()
+            else:
+                yield b'{"gap":true,"resumed_after":"%s"}\n' % resumed.encode()
+        if entries:
+            after = entries[-1][0]
+            yield b"".join(frame(log.platform, seq, body) for seq, body in entries)
+            continue
+        if not await log.wait(after, heartbeat):
+            yield b": keep-alive\n\n" if fmt == "sse" else b"\n"
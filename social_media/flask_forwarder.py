@@ -1,17 +1,251 @@
 import os
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify
 import threading
 import time
+import asyncio
 import requests
 
+from forwarder_scheduler import ForwarderScheduler, next_cursor_for, extract_items, wrap_items, cluster_envelopes
+from forwarder_scheduler import FORWARDER_DEDUP, FORWARDED_ITEMS, backoff_delay, mark_forwarded
+from event_dedup import EventDeduplicator
+from common.metrics import Counter, get_registry, render, CONTENT_TYPE
+from common.checkpoint_store import get_checkpoints
+from spool_log import SpoolLog, SpoolCorrupt, FORWARDER_SPOOL_DIR
+
+METRICS = get_registry("social_media_")
+span = METRICS.span
+
 app = Flask(__name__) # Corrected: Use __name__
 
 # List of platform names
 platforms = ["instagram", "reddit", "twitter", "eventbrite", "nammasuttu"]
 rotation_index = 0
 
-# Cursors for each platform, initialized to "0" (as expected by FastAPI)
-platform_cursors = {platform: "0" for platform in platforms}
+# Cursors and forwarded ids are checkpointed to FORWARDER_STATE_PATH, so a
+# restart resumes each walk instead of starting again from "0" (FastAPI's first
+# page). A walk that had finished starts over; the seen ids keep its items from
+# being forwarded again. Both only move once /agent (or the spool) accepted the
+# items, so a failed POST is retried rather than skipped.
+checkpoints = get_checkpoints()
+platform_cursors = {platform: checkpoints.cursor(f"rotate:{platform}") or "0" for platform in platforms}
+
+FASTAPI_URL = os.environ.get("FASTAPI_URL", "http://127.0.0.1:8000")
+AGENT_URL = os.environ.get("AGENT_URL", "http://localhost:8085/agent")
+# "poll" (default): concurrent asyncio polling (forwarder_scheduler.py);
+# "stream": one consume_stream thread per platform reading /api/{platform}/stream;
+# "rotate": the original sequential rotate_requests loop.
+FORWARDER_MODE = os.environ.get("FORWARDER_MODE", "poll")
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 20))
+STREAM_FLUSH_SECONDS = float(os.environ.get("STREAM_FLUSH_SECONDS", 2))
+# With FORWARDER_SPOOL_DIR set, pages are appended to the spool (spool_log.py) and
+# drain_spool POSTs them: up to SPOOL_DRAIN_BATCH records per read, merged into
+# POSTs of at most SPOOL_POST_ITEMS items per platform
+SPOOL_DRAIN_BATCH = int(os.environ.get("SPOOL_DRAIN_BATCH", 50))
+SPOOL_POST_ITEMS = int(os.environ.get("SPOOL_POST_ITEMS", 100))
+SPOOL_CONSUMER = "agent"
+SPOOL_SKIPPED = Counter("social_media_spool_skipped_records_total",
+                        "Spool records the drain gave up on instead of retrying", ("reason",), registry=METRICS)
+
+# Stream cursors are separate from the polling cursors: they are opaque tokens
+stream_cursors = {platform: checkpoints.cursor(f"stream:{platform}", None) for platform in platforms}
+# FORWARDER_DEDUP=1: one deduplicator shared by all stream consumer threads
+stream_dedup = EventDeduplicator() if FORWARDER_DEDUP else None
+stream_dedup_lock = threading.Lock()
+
+spool = SpoolLog(FORWARDER_SPOOL_DIR) if FORWARDER_SPOOL_DIR else None
+
+def send_to_agent(platform, envelope):
+    """POST an envelope to /agent (raising on an error status), or append it to the spool."""
+    if spool is not None:
+        spool.append_json({"platform": platform, "body": envelope})
+        return
+    with span("forwarder_post"):
+        requests.post(AGENT_URL, json=envelope).raise_for_status()
+
+def forward(platform, envelope):
+    """send_to_agent, then mark what it carried (dedup members included) as forwarded."""
+    send_to_agent(platform, envelope)
+    mark_forwarded(checkpoints, platform, envelope)
+
+def spooled_envelopes(records):
+    """
+    (platform, envelope, records) for a batch of spool records: whole records merged
+    per platform until an envelope holds SPOOL_POST_ITEMS items. Records that do
+    not parse are skipped here, since no retry will fix them.
+    """
+    by_platform = {}
+    for record in records:
+        try:
+            entry = json.loads(record.payload)
+            items = extract_items(entry["platform"], entry["body"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            skip_spooled([record], "unparseable", e)
+            continue
+        by_platform.setdefault(entry["platform"], []).append((record, items))
+    for platform, entries in by_platform.items():
+        batch, items = [], []
+        for record, record_items in entries:
+            batch.append(record)
+            items.extend(record_items)
+            if len(items) >= SPOOL_POST_ITEMS:
+                yield platform, wrap_items(platform, items), batch
+                batch, items = [], []
+        if batch:
+            yield platform, wrap_items(platform, items), batch
+
+def skip_spooled(records, reason, error):
+    # The records stay on disk until retention, so `spool_log.py dump` can still recover them
+    SPOOL_SKIPPED.labels(reason).inc(len(records))
+    print(f"Skipping spool records {records[0].offset}..{records[-1].offset} ({reason}): {error}")
+
+def is_retryable(error):
+    """Transport errors, 429 and 5xx may pass later; any other 4xx will fail the same way again."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return isinstance(error, requests.exceptions.RequestException)
+    return response.status_code == 429 or response.status_code >= 500
+
+def post_spooled(platform, envelope, records):
+    """
+    POST one merged envelope. If /agent rejects it with a non-retryable status,
+    its records are sent one by one so only the offending ones are skipped.
+    """
+    try:
+        with span("forwarder_post"):
+            requests.post(AGENT_URL, json=envelope, timeout=60).raise_for_status()
+        return
+    except requests.exceptions.HTTPError as e:
+        if is_retryable(e):
+            raise
+        if len(records) == 1:
+            skip_spooled(records, f"rejected {e.response.status_code}", e)
+            return
+    for record in records:
+        entry = json.loads(record.payload)
+        post_spooled(platform, wrap_items(platform, extract_items(platform, entry["body"])), [record])
+
+def drain_spool():
+    """
+    Reads the spool in batches and POSTs them to /agent, committing the offset
+    only after the whole batch was accepted. Transport errors, 429 and 5xx
+    (including 503 from a full agent queue) are retried with backoff, and a batch
+    that failed halfway is sent again in full, so /agent may see some items
+    twice. Records that cannot succeed (unparseable, corrupt on disk, or
+    rejected with another 4xx) are skipped rather than blocking the spool.
+    """
+    offset = spool.committed(SPOOL_CONSUMER)
+    failures = 0
+    while True:
+        try:
+            records = spool.read(offset, SPOOL_DRAIN_BATCH)
+        except SpoolCorrupt as e:
+            # Lengths after a bad checksum cannot be trusted: resume at the next segment
+            resume = spool.next_segment_offset(offset)
+            SPOOL_SKIPPED.labels("corrupt").inc(resume - offset)
+            print(f"Skipping spool records {offset}..{resume - 1} (corrupt): {e}")
+            offset = resume
+            spool.commit(SPOOL_CONSUMER, offset)
+            continue
+        try:
+            if not records:
+                if not spool.wait(offset, 5):
+                    spool.enforce_retention()
+                continue
+            for platform, envelope, batch in spooled_envelopes(records):
+                post_spooled(platform, envelope, batch)
+        except Exception as e:
+            failures += 1
+            delay = backoff_delay(failures)
+            print(f"Error draining spool at offset {offset} (attempt {failures}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            continue
+        failures = 0
+        offset = records[-1].offset + 1
+        spool.commit(SPOOL_CONSUMER, offset)
+
+def forward_stream_batch(platform, items):
+    """
+    POST a streamed batch to /agent, through the dedup stage when it is enabled.
+    Raises if a POST fails; with dedup, items only count as forwarded once the
+    cluster they joined was posted.
+    """
+    items = checkpoints.unseen(platform, items)
+    if not items:
+        return
+    FORWARDED_ITEMS.labels(platform).inc(len(items))
+    if stream_dedup is None:
+        forward(platform, wrap_items(platform, items))
+        return
+    with stream_dedup_lock:
+        emitted = []
+        for item in items:
+            emitted.extend(stream_dedup.add(platform, item))
+    for canonical_platform, envelope in cluster_envelopes(emitted):
+        forward(canonical_platform, envelope)
+
+def expire_stream_dedup():
+    # Close incident windows even while the streams are quiet
+    while True:
+        time.sleep(1)
+        with stream_dedup_lock:
+            emitted = stream_dedup.expire(time.time())
+        for canonical_platform, envelope in cluster_envelopes(emitted):
+            try:
+                forward(canonical_platform, envelope)
+            except requests.exceptions.RequestException as e:
+                # Not marked seen: the checkpoint holds their pages back for a restart to re-read
+                print(f"Error forwarding deduplicated {canonical_platform} events: {e}")
+
+def consume_stream(platform):
+    """
+    Reads the NDJSON push stream for one platform and forwards events to /agent
+    in batches of up to STREAM_BATCH_SIZE, or whatever arrived within
+    STREAM_FLUSH_SECONDS. Reconnects with backoff and resumes from the last
+    cursor it forwarded.
+    """
+    backoff = 1
+    while True:
+        try:
+            # Ask for keep-alives often enough to flush partial batches on time
+            params = {"format": "ndjson", "heartbeat": STREAM_FLUSH_SECONDS}
+            if stream_cursors[platform]:
+                params["cursor"] = stream_cursors[platform]
+            print(f"Opening stream {FASTAPI_URL}/api/{platform}/stream with params: {params}")
+            with requests.get(f"{FASTAPI_URL}/api/{platform}/stream", params=params,
+                              stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                backoff = 1
+                batch, batch_cursor, batch_started = [], None, time.monotonic()
+                # The server sends a blank keep-alive line when idle, so this loop
+                # wakes up regularly even without events and can flush on age
+                for line in response.iter_lines():
+                    if line:
+                        message = json.loads(line)
+                        if message.get("gap"):
+                            print(f"Stream for {platform} skipped events; resumed after {message.get('resumed_after')}")
+                        else:
+                            if not batch:
+                                batch_started = time.monotonic()
+                            batch.append(message["event"])
+                            batch_cursor = message["cursor"]
+                    if batch and (len(batch) >= STREAM_BATCH_SIZE or
+                                  time.monotonic() - batch_started >= STREAM_FLUSH_SECONDS):
+                        # The checkpoint reaches batch_cursor once /agent accepted the batch
+                        # (for dedup, once every cluster it joined was posted)
+                        checkpoints.advance(f"stream:{platform}", platform, stream_cursors[platform],
+                                            batch_cursor, batch)
+                        forward_stream_batch(platform, batch)
+                        print(f"Forwarded {len(batch)} streamed {platform} events to /agent.")
+                        # Only advance once the batch is through, so a reconnect resends it
+                        stream_cursors[platform] = batch_cursor
+                        batch = []
+        except requests.exceptions.RequestException as e:
+            print(f"Stream error for {platform}, reconnecting in {backoff}s: {e}")
+        except Exception as e:
+            print(f"Error while consuming {platform} stream, reconnecting in {backoff}s: {e}")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
 
 def rotate_requests():
     """
@@ -39,33 +273,25 @@ def rotate_requests():
                     print(f"Successfully received data from {platform}. Top-level keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
                     
                     # Extract the next cursor based on the platform's response structure
-                    next_cursor = None
-                    if platform == "reddit":
-                        next_cursor = data.get("data", {}).get("after")
-                    elif platform == "instagram" or platform == "nammasuttu": # Both use 'paging' -> 'next'
-                        next_cursor = data.get("paging", {}).get("next")
-                    elif platform == "twitter":
-                        next_cursor = data.get("meta", {}).get("next_token")
-                    elif platform == "eventbrite":
-                        pagination = data.get("pagination", {})
-                        current_cursor_val = int(cursor) # cursor represents the start index
-                        limit_val = 2 # Hardcoded limit for rotate_requests
-                        has_more = pagination.get("has_more_items", False)
-                        
-                        if has_more:
-                            next_cursor = str(current_cursor_val + limit_val)
-                        else:
-                            next_cursor = None
+                    next_cursor = next_cursor_for(platform, data, cursor, 2) # Hardcoded limit for rotate_requests
                     
                     print(f"Next cursor for {platform}: {next_cursor}")
                     
-                    # Update cursor for the next request for this platform
+                    # Send the response data to /agent, minus items it already got
+                    items = extract_items(platform, data)
+                    fresh = checkpoints.unseen(platform, items)
+                    if items and not fresh:
+                        print(f"Skipping POST to /agent from {platform}: all {len(items)} items already forwarded.")
+                    else:
+                        if len(fresh) < len(items):
+                            data = wrap_items(platform, fresh)
+                        print(f"POSTing data to {AGENT_URL} from {platform}...")
+                        forward(platform, data)
+                        print(f"POST to /agent from {platform} complete.")
+
+                    # Only now move on: a failed POST raises above and this page is fetched again
                     platform_cursors[platform] = next_cursor
-                    
-                    # Send the full response data to /agent
-                    print(f"POSTing data to http://localhost:8085/agent from {platform}...")
-                    requests.post("http://localhost:8085/agent", json=data)
-                    print(f"POST to /agent from {platform} complete.")
+                    checkpoints.set_cursor(f"rotate:{platform}", next_cursor)
                 else:
                     print(f"Failed to GET /api/{platform}. Status: {response.status_code}, Response: {response.text}")
 
@@ -116,6 +342,11 @@ def get_platform_data(platform):
         return jsonify({"error": f"Failed to fetch data from backend: {e}"}), 500
     
     
+@app.route('/metrics')
+def metrics():
+    # Prometheus text: forwarder_fetch / forwarder_post spans and items per platform
+    return Response(render(), content_type=CONTENT_TYPE)
+
 # /agent POST receiver
 @app.route('/agent', methods=["POST"])
 def agent():
@@ -156,9 +387,27 @@ if __name__ == '__main__':
     server_thread.start()
     time.sleep(1) # Give the server a moment to start
 
-    # Start the data rotation in a separate daemon thread to run continuously
-    rotation_thread = threading.Thread(target=rotate_requests, daemon=True)
-    rotation_thread.start()
+    if spool is not None:
+        # Every mode below appends to the spool; this thread feeds /agent from it
+        threading.Thread(target=drain_spool, daemon=True).start()
+
+    if FORWARDER_MODE == "stream":
+        # One push-stream consumer per platform instead of limit=2 polling
+        for platform in platforms:
+            threading.Thread(target=consume_stream, args=(platform,), daemon=True).start()
+        if stream_dedup is not None:
+            threading.Thread(target=expire_stream_dedup, daemon=True).start()
+    elif FORWARDER_MODE == "rotate":
+        # Start the data rotation in a separate daemon thread to run continuously
+        rotation_thread = threading.Thread(target=rotate_requests, daemon=True)
+        rotation_thread.start()
+    else:
+        # Independent polling loop per platform on one keep-alive client
+        scheduler = ForwarderScheduler(platforms, FASTAPI_URL, AGENT_URL,
+                                       dedup=EventDeduplicator() if FORWARDER_DEDUP else None,
+                                       checkpoints=checkpoints, spool=spool)
+        rotation_thread = threading.Thread(target=lambda: asyncio.run(scheduler.run()), daemon=True)
+        rotation_thread.start()
     
     # Keep the main thread alive indefinitely so daemon threads can continue running
     try:
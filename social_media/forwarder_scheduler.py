@@ -0,0 +1,359 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime
+
+import httpx
+
+from common.metrics import Counter, get_registry
+
+# Seconds between polls of one platform; override per platform with e.g.
+# FORWARDER_POLL_INTERVAL_NAMMASUTTU=1
+FORWARDER_POLL_INTERVAL = float(os.environ.get("FORWARDER_POLL_INTERVAL", 2))
+FORWARDER_PAGE_LIMIT = int(os.environ.get("FORWARDER_PAGE_LIMIT", 20))
+# Upper bound on concurrent POSTs to /agent across all platforms
+FORWARDER_MAX_INFLIGHT_POSTS = int(os.environ.get("FORWARDER_MAX_INFLIGHT_POSTS", 8))
+# How long to wait before walking an exhausted platform again from cursor "0"
+FORWARDER_EXHAUSTED_REPOLL = float(os.environ.get("FORWARDER_EXHAUSTED_REPOLL", 60))
+FORWARDER_STATS_INTERVAL = float(os.environ.get("FORWARDER_STATS_INTERVAL", 30))
+# Collapse cross-platform copies of one incident before they reach /agent
+# (event_dedup.py); delays forwarding by up to DEDUP_WINDOW seconds
+FORWARDER_DEDUP = os.environ.get("FORWARDER_DEDUP", "0") == "1"
+DEDUP_EXPIRE_INTERVAL = 1
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+METRICS = get_registry("social_media_")
+span = METRICS.span
+FORWARDED_ITEMS = Counter("social_media_forwarder_items_total", "Items fetched for /agent", ("platform",),
+                          registry=METRICS)
+
+
+def extract_items(platform, data):
+    """The list of platform items inside an /api/{platform} response."""
+    if platform == "nammasuttu":
+        return data.get("reports", [])
+    elif platform == "reddit":
+        return data.get("data", {}).get("children", [])
+    elif platform == "eventbrite":
+        return data.get("events", [])
+    items = data.get("data", [])  # instagram, twitter
+    return items if isinstance(items, list) else []
+
+
+def wrap_items(platform, items):
+    """Wrap a list of platform items in the same envelope /api/{platform} returns."""
+    if platform == "nammasuttu":
+        return {"reports": items, "paging": {"next": None}}
+    elif platform == "reddit":
+        return {"data": {"children": items, "after": None}}
+    elif platform == "instagram":
+        return {"data": items, "paging": {"next": None}}
+    elif platform == "eventbrite":
+        return {"events": items, "pagination": {"has_more_items": False}}
+    elif platform == "twitter":
+        return {"data": items, "meta": {"result_count": len(items), "next_token": None}}
+    return {"data": items}
+
+
+def cluster_envelopes(clusters):
+    """
+    (platform, envelope) pairs for clusters emitted by EventDeduplicator: each
+    canonical item carries a "dedup" entry listing the copies it stands for.
+    """
+    by_platform = {}
+    for cluster in clusters:
+        item = dict(cluster["item"])
+        item["dedup"] = {
+            "members": cluster["members"],
+            "size": cluster["size"],
+            "geohash": cluster["geohash"],
+        }
+        by_platform.setdefault(cluster["platform"], []).append(item)
+    return [(platform, wrap_items(platform, items)) for platform, items in by_platform.items()]
+
+
+def mark_forwarded(checkpoints, platform, envelope):
+    """
+    After /agent accepted `envelope`: mark its items seen, and for dedup
+    clusters every member the canonical item stands for, on its own platform.
+    """
+    by_platform = {}
+    for item in extract_items(platform, envelope):
+        dedup = item.get("dedup") if isinstance(item, dict) else None
+        if dedup:
+            for member in dedup["members"]:
+                by_platform.setdefault(member["platform"], []).append(member)
+        else:
+            by_platform.setdefault(platform, []).append(item)
+    for member_platform, items in by_platform.items():
+        checkpoints.mark_seen(member_platform, items)
+
+
+def next_cursor_for(platform, data, cursor, limit):
+    """Next cursor from an /api/{platform} response, or None when the platform is exhausted."""
+    if platform == "reddit":
+        return data.get("data", {}).get("after")
+    elif platform == "instagram" or platform == "nammasuttu": # Both use 'paging' -> 'next'
+        return data.get("paging", {}).get("next")
+    elif platform == "twitter":
+        return data.get("meta", {}).get("next_token")
+    elif platform == "eventbrite":
+        # Eventbrite reports has_more_items; the cursor is the start index
+        if data.get("pagination", {}).get("has_more_items", False):
+            return str(int(cursor) + limit)
+        return None
+    return None
+
+
+def _event_time(platform, item):
+    if platform == "reddit":
+        return item.get("data", {}).get("created_utc")
+    if platform == "eventbrite":
+        value = item.get("start", {}).get("local")
+    elif platform == "twitter":
+        value = item.get("created_at")
+    else:
+        value = item.get("timestamp")
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(failures):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** failures))
+
+
+class PlatformStats:
+    __slots__ = ("pages", "not_modified", "items", "errors", "posts", "post_errors",
+                 "started", "last_success", "event_lag")
+
+    def __init__(self):
+        self.pages = self.not_modified = self.items = self.errors = 0
+        self.posts = self.post_errors = 0
+        self.started = time.monotonic()
+        self.last_success = None
+        self.event_lag = None  # seconds between the newest forwarded event and its fetch
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "pages": self.pages,
+            "not_modified": self.not_modified,
+            "items": self.items,
+            "items_per_s": self.items / elapsed,
+            "errors": self.errors,
+            "posts": self.posts,
+            "post_errors": self.post_errors,
+            "since_last_success_s": time.monotonic() - self.last_success if self.last_success else None,
+            "event_lag_s": self.event_lag,
+        }
+
+
+class ForwarderScheduler:
+    """
+    Polls every platform concurrently, each in its own asyncio loop over one
+    shared keep-alive HTTP client, and forwards pages to /agent.
+
+    - Each platform polls at its own interval (with +-20% jitter), so a slow
+      platform no longer stalls the others.
+    - Failures back off exponentially with full jitter, per platform.
+    - An exhausted platform (cursor None) is walked again from "0" after
+      FORWARDER_EXHAUSTED_REPOLL seconds instead of being dropped forever.
+    - Pages are fetched with If-None-Match, so unchanged pages come back as 304,
+      are not forwarded twice, and the walk skips ahead to the known next cursor.
+      A page's ETag is only remembered once all of it was delivered (/agent
+      answered 2xx, or it is in the spool), so a failed POST is fetched and
+      sent again rather than answered with 304.
+    - At most FORWARDER_MAX_INFLIGHT_POSTS POSTs to /agent run at once; when
+      they are all busy the pollers wait instead of queueing without bound.
+    - With a `dedup` EventDeduplicator, items are grouped across platforms and
+      one canonical item per incident is forwarded when its window closes.
+    - With `checkpoints` (common/checkpoint_store.py), cursors survive restarts and
+      items already forwarded are dropped before they reach /agent again. Items
+      count as forwarded once /agent answered 2xx for them (or for the cluster
+      they joined), and the checkpointed cursor waits for that too.
+    - With a `spool` (spool_log.py), pages are appended to it instead of
+      POSTed, and flask_forwarder.drain_spool delivers them.
+    """
+
+    def __init__(self, platforms, fastapi_url, agent_url, limit=FORWARDER_PAGE_LIMIT,
+                 max_inflight_posts=FORWARDER_MAX_INFLIGHT_POSTS, dedup=None, checkpoints=None,
+                 spool=None):
+        self.platforms = list(platforms)
+        self.fastapi_url = fastapi_url
+        self.agent_url = agent_url
+        self.limit = limit
+        self.max_inflight_posts = max_inflight_posts
+        self.dedup = dedup
+        self.checkpoints = checkpoints
+        self.spool = spool
+        self.intervals = {
+            p: float(os.environ.get(f"FORWARDER_POLL_INTERVAL_{p.upper()}", FORWARDER_POLL_INTERVAL))
+            for p in self.platforms
+        }
+        self.cursors = {p: checkpoints.cursor(f"poll:{p}") if checkpoints else "0" for p in self.platforms}
+        self.stats = {p: PlatformStats() for p in self.platforms}
+        # cursor -> (ETag, next cursor) of the page last delivered in full from it
+        self._seen_pages = {p: {} for p in self.platforms}
+        self._client = None
+        self._post_slots = None
+        self._posts = set()
+
+    async def run(self):
+        self._post_slots = asyncio.Semaphore(self.max_inflight_posts)
+        limits = httpx.Limits(max_connections=len(self.platforms) + self.max_inflight_posts)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            self._client = client
+            tasks = [self._report_stats(), *(self._poll_platform(p) for p in self.platforms)]
+            if self.dedup is not None:
+                tasks.append(self._expire_dedup())
+            await asyncio.gather(*tasks)
+
+    async def _poll_platform(self, platform):
+        stats = self.stats[platform]
+        failures = 0
+        url = f"{self.fastapi_url}/api/{platform}"
+        while True:
+            cursor = self.cursors[platform]
+            headers = {}
+            seen = self._seen_pages[platform].get(cursor)
+            if seen:
+                headers["If-None-Match"] = seen[0]
+            try:
+                with span("forwarder_fetch"):
+                    response = await self._client.get(url, params={"limit": self.limit, "cursor": cursor},
+                                                      headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    data = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                failures += 1
+                stats.errors += 1
+                delay = backoff_delay(failures)
+                print(f"Error polling {platform} (attempt {failures}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            stats.last_success = time.monotonic()
+
+            if response.status_code == 304:
+                # Already forwarded this exact page; move on without re-sending it
+                stats.not_modified += 1
+                next_cursor = seen[1]
+                self._advance(platform, cursor, next_cursor, [])
+            else:
+                stats.pages += 1
+                next_cursor = next_cursor_for(platform, data, cursor, self.limit)
+                items = extract_items(platform, data)
+                # Remembered once the whole page is delivered; not for pages
+                # cut down to their unseen items, or merged into dedup clusters
+                page = (cursor, response.headers.get("etag"), next_cursor)
+                if items and self.checkpoints is not None:
+                    fresh = self.checkpoints.unseen(platform, items)
+                    if len(fresh) < len(items):
+                        items, data = fresh, wrap_items(platform, fresh)
+                        page = None
+                # Before posting: a fast POST may be accepted before this would run
+                self._advance(platform, cursor, next_cursor, items)
+                if items:
+                    stats.items += len(items)
+                    FORWARDED_ITEMS.labels(platform).inc(len(items))
+                    times = [t for t in (_event_time(platform, i) for i in items) if t]
+                    if times:
+                        stats.event_lag = time.time() - max(times)
+                    if self.dedup is not None:
+                        emitted = []
+                        for item in items:
+                            emitted.extend(self.dedup.add(platform, item))
+                        await self._post_clusters(emitted)
+                    else:
+                        await self._post(platform, data, page)
+                elif page is not None:
+                    self._remember_page(platform, page)
+
+            if next_cursor is None:
+                print(f"--- No more data for {platform}; re-polling from the start in {FORWARDER_EXHAUSTED_REPOLL:.0f}s. ---")
+                self.cursors[platform] = "0"
+                await asyncio.sleep(FORWARDER_EXHAUSTED_REPOLL)
+            else:
+                self.cursors[platform] = next_cursor
+                await asyncio.sleep(self._jittered(platform))
+
+    def _advance(self, platform, cursor, next_cursor, items):
+        # The checkpoint follows once /agent has the items (see CheckpointStore.advance)
+        if self.checkpoints is not None:
+            self.checkpoints.advance(f"poll:{platform}", platform, cursor,
+                                     "0" if next_cursor is None else next_cursor, items)
+
+    def _remember_page(self, platform, page):
+        cursor, etag, next_cursor = page
+        if not etag:
+            return
+        pages = self._seen_pages[platform]
+        if len(pages) > 1024:
+            pages.clear()
+        pages[cursor] = (etag, next_cursor)
+
+    def _jittered(self, platform):
+        return self.intervals[platform] * random.uniform(0.8, 1.2)
+
+    async def _post(self, platform, data, page=None):
+        if self.spool is not None:
+            self.spool.append_json({"platform": platform, "body": data})
+            self.stats[platform].posts += 1
+            if self.checkpoints is not None:
+                mark_forwarded(self.checkpoints, platform, data)  # durable in the spool
+            if page is not None:
+                self._remember_page(platform, page)
+            return
+        # Waits here while max_inflight_posts POSTs are already running
+        await self._post_slots.acquire()
+        task = asyncio.create_task(self._send(platform, data, page))
+        self._posts.add(task)
+        task.add_done_callback(self._posts.discard)
+
+    async def _post_clusters(self, clusters):
+        for platform, envelope in cluster_envelopes(clusters):
+            await self._post(platform, envelope)
+
+    async def _expire_dedup(self):
+        # Close incident windows even while no new items arrive
+        while True:
+            await asyncio.sleep(DEDUP_EXPIRE_INTERVAL)
+            await self._post_clusters(self.dedup.expire(time.time()))
+
+    async def _send(self, platform, data, page=None):
+        stats = self.stats[platform]
+        try:
+            with span("forwarder_post"):
+                response = await self._client.post(self.agent_url, json=data)
+            response.raise_for_status()
+            stats.posts += 1
+            if self.checkpoints is not None:
+                mark_forwarded(self.checkpoints, platform, data)
+            if page is not None:
+                self._remember_page(platform, page)
+        except httpx.HTTPError as e:
+            stats.post_errors += 1
+            if page is not None:
+                # The next poll fetches the page in full and sends it again
+                self._seen_pages[platform].pop(page[0], None)
+            print(f"Error POSTing {platform} page to /agent: {e}")
+        finally:
+            self._post_slots.release()
+
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(FORWARDER_STATS_INTERVAL)
+            for platform in self.platforms:
+                s = self.stats[platform].snapshot()
+                lag = f"{s['event_lag_s']:.1f}s" if s['event_lag_s'] is not None else "n/a"
+                print(f"[forwarder] {platform}: {s['items']} items ({s['items_per_s']:.2f}/s), "
+                      f"{s['pages']} pages, {s['not_modified']} not modified, {s['errors']} errors, "
+                      f"{s['post_errors']} failed posts, event lag {lag}")
+            if self.dedup is not None:
+                print(f"[forwarder] dedup: {self.dedup.stats}, {self.dedup.open_clusters()} open clusters")
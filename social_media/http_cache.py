@@ -0,0 +1,109 @@
+import os
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 1024))  # (platform, version, cursor, limit) pages kept in memory
+MIN_COMPRESS_BYTES = 256  # smaller bodies are not worth compressing
+
+
+class CachedPage:
+    """One serialized page (a payload, or its already-encoded bytes): identity body,
+    precompressed variants and its strong ETag."""
+
+    __slots__ = ("etag", "bodies")
+
+    def __init__(self, payload):
+        if isinstance(payload, bytes):
+            body = payload
+        else:
+            body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = digest
+        self.bodies = {None: body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=5)
+
+    def etag_for(self, encoding):
+        # Each content-coding is a different representation, so it gets its own strong ETag
+        return f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+
+
+class PageCache:
+    """Small LRU of CachedPage objects. Keys include the snapshot version, so a
+    refresh makes old pages unreachable and they age out of the LRU."""
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                return page
+        # Build outside the lock; two concurrent misses just both build the same page
+        page = CachedPage(build())
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick br, then gzip, if the client accepts it and we have it precompressed."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for coding in ("br", "gzip"):
+        if coding in available and (coding in accepted or "*" in accepted):
+            return coding
+    return None
+
+
+def _etag_matches(if_none_match, page):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Weak comparison (RFC 9110 13.1.2): any coding of the same page matches
+        if tag.strip('"').split("-")[0] == page.etag:
+            return True
+    return False
+
+
+def page_response(request, page, max_age):
+    """Serve a CachedPage honouring If-None-Match and Accept-Encoding."""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), page.bodies)
+    headers = {
+        "ETag": page.etag_for(encoding),
+        "Cache-Control": f"public, max-age={max(0, int(max_age))}",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), page):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=page.bodies[encoding], media_type="application/json", headers=headers)
@@ -0,0 +1,67 @@
+import re
+
+# Keyword groups in priority order: the first group with any keyword occurring
+# anywhere in the event text decides the media URL (plain substring match).
+KEYWORD_MEDIA = [
+    (['traffic', 'jam', 'roadblock'], "https://media.wired.com/photos/593256b42a990b06268a9e21/3:2/w_2240,c_limit/traffic-jam-getty.jpg"),
+    (['flood', 'waterlogging', 'rain'], "https://cms.accuweather.com/wp-content/uploads/2023/07/Flood_Agnostic-2.png?w=632"),
+    (['band', 'music', 'concert', 'live', 'performance'], "https://images.unsplash.com/photo-1511671782779-c97d3d27a1d4?auto=format&fit=crop&w=800&q=80"),
+    (['festival', 'celebration', 'parade'], "https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=800&q=80"),
+    (['emergency', 'alert', 'evacuate'], "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80"),
+    (['meetup', 'gathering', 'networking'], "https://images.unsplash.com/photo-1504384308090-c894fdcc538d?auto=format&fit=crop&w=800&q=80"),
+    (['protest', 'strike', 'march'], "https://images.unsplash.com/photo-1468421870903-4df1664ac249?auto=format&fit=crop&w=800&q=80"),
+    (['sports', 'sport', 'match', 'game', 'tournament'], "https://7esl.com/wp-content/uploads/2022/08/team-sports.jpg.webp"),
+    (['fire', 'blaze', 'burn'], "https://images.unsplash.com/photo-1509228468518-180dd4864904?auto=format&fit=crop&w=800&q=80"),
+    (['accident', 'crash', 'collision'], "https://akm-img-a-in.tosshub.com/indiatoday/images/story/202503/a-car-collides-with-water-tanker-in-hyderabad-07060782-16x9_0.jpeg?VersionId=GQ.4sE3YKdCGT102yLLRgc2uBFRBTdZ5&size=690:388"),
+    (['weather', 'storm', 'cyclone', 'wind'], "https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=800&q=80"),
+    (['food', 'cuisine', 'restaurant', 'dining'], "https://images.unsplash.com/photo-1504674900247-0877df9cc836?auto=format&fit=crop&w=800&q=80"),
+    (['art', 'exhibition', 'gallery'], "https://images.unsplash.com/photo-1465101046530-73398c7f28ca?auto=format&fit=crop&w=800&q=80"),
+    (['theatre', 'play', 'drama'], "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80"),
+]
+DEFAULT_MEDIA_URL = "https://placehold.co/300"
+
+# keyword -> index of its group (first group wins if a keyword were repeated)
+_KEYWORD_PRIORITY = {}
+for _priority, (_keywords, _url) in enumerate(KEYWORD_MEDIA):
+    for _word in _keywords:
+        _KEYWORD_PRIORITY.setdefault(_word, _priority)
+
+# One alternation for every keyword, ordered by group priority, inside a lookahead.
+# The zero-width lookahead reports a match at every position where some keyword
+# starts (overlapping matches included), and alternation order makes that the
+# highest-priority keyword starting there. The minimum over all positions is
+# then exactly the first group whose keywords occur in the text.
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(w) for w in sorted(_KEYWORD_PRIORITY, key=_KEYWORD_PRIORITY.get)) + "))"
+)
+
+
+def media_text(event):
+    return ((event.get('description') or '') + ' ' + (event.get('title') or '') + ' ' + (event.get('category') or '')).lower()
+
+
+def match_media_url(text):
+    """Media URL for already-lowercased `text`, in one pass over the text."""
+    best = len(KEYWORD_MEDIA)
+    for m in _KEYWORD_RE.finditer(text):
+        priority = _KEYWORD_PRIORITY[m.group(1)]
+        if priority < best:
+            best = priority
+            if best == 0:
+                break
+    return KEYWORD_MEDIA[best][1] if best < len(KEYWORD_MEDIA) else DEFAULT_MEDIA_URL
+
+
+def get_media_url(event):
+    """Media URL for one event, reusing the value classify_events() stored on it."""
+    return event.get('media_url') or match_media_url(media_text(event))
+
+
+def classify_events(events):
+    """
+    Resolve and store `media_url` on every event of a page or snapshot, so the
+    keyword scan is paid once per refresh instead of once per request.
+    """
+    for event in events:
+        event['media_url'] = match_media_url(media_text(event))
+    return events
@@ -0,0 +1,143 @@
+"""
+In-process stand-in for the reports Postgres database, backed by SQLite.
+
+It implements just enough of the psycopg2 connection/cursor surface used in
+social_media (autocommit, cursor_factory, PREPARE/EXECUTE, %s placeholders) to
+run the service and its DB paths without a network database:
+
+    PG_CONNECT_FACTORY=pg_standin:connect uvicorn app:app
+
+Call seed_reports() first to fill the shared `reports` table, or set
+PG_STANDIN_SEED=<rows> to seed it on first connect (useful when the stand-in
+runs inside a uvicorn worker). PG_STANDIN_LATENCY_MS adds a fixed delay to
+every statement to mimic the round trip to a remote Postgres.
+"""
+import os
+import re
+import time
+import random
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+# One named in-memory database shared by every connection in the process
+STANDIN_URI = "file:pg_standin?mode=memory&cache=shared"
+
+_PREPARE_RE = re.compile(r"^\s*PREPARE\s+(\w+)\s+AS\s+(.*)$", re.IGNORECASE | re.DOTALL)
+_EXECUTE_RE = re.compile(r"^\s*EXECUTE\s+(\w+)", re.IGNORECASE)
+_DOLLAR_PARAM_RE = re.compile(r"\$(\d+)")
+
+PG_STANDIN_SEED = int(os.environ.get("PG_STANDIN_SEED", 0))
+PG_STANDIN_LATENCY_MS = float(os.environ.get("PG_STANDIN_LATENCY_MS", 0))
+
+# Keeps the shared in-memory database alive while the process runs
+_keeper = None
+_keeper_lock = threading.Lock()
+
+
+class StandinCursor:
+    def __init__(self, connection, as_dict):
+        self._connection = connection
+        self._cur = connection._db.cursor()
+        self._as_dict = as_dict
+
+    def execute(self, sql, params=()):
+        if PG_STANDIN_LATENCY_MS:
+            time.sleep(PG_STANDIN_LATENCY_MS / 1000)
+        prepare = _PREPARE_RE.match(sql)
+        if prepare:
+            name, body = prepare.groups()
+            self._connection._prepared[name] = _DOLLAR_PARAM_RE.sub(r"?\1", body)
+            return
+        execute = _EXECUTE_RE.match(sql)
+        if execute:
+            sql = self._connection._prepared[execute.group(1)]
+        else:
+            sql = sql.replace("%s", "?")
+        self._cur.execute(sql, tuple(params or ()))
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return self._row(row) if row is not None else None
+
+    def _row(self, row):
+        if not self._as_dict:
+            return row
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def close(self):
+        self._cur.close()
+
+
+class StandinConnection:
+    def __init__(self):
+        self._db = sqlite3.connect(STANDIN_URI, uri=True, check_same_thread=False)
+        self._prepared = {}
+        self.autocommit = False
+        self.closed = 0
+
+    def cursor(self, cursor_factory=None):
+        return StandinCursor(self, as_dict=cursor_factory is not None)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def close(self):
+        self._db.close()
+        self.closed = 1
+
+
+def connect(**_config):
+    """psycopg2.connect replacement; connection settings are ignored."""
+    _ensure_schema()
+    return StandinConnection()
+
+
+def _ensure_schema():
+    global _keeper
+    with _keeper_lock:
+        if _keeper is not None:
+            return
+        _keeper = sqlite3.connect(STANDIN_URI, uri=True, check_same_thread=False)
+        _keeper.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " id INTEGER PRIMARY KEY, title TEXT, description TEXT, location TEXT,"
+            " timestamp TEXT, category TEXT, latitude REAL, longitude REAL, source_post_id TEXT)")
+        _keeper.execute(
+            "CREATE INDEX IF NOT EXISTS reports_timestamp_id_idx ON reports (timestamp DESC, id DESC)")
+        _keeper.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS reports_source_post_id_key ON reports (source_post_id)")
+        _keeper.commit()
+    if PG_STANDIN_SEED:
+        seed_reports(PG_STANDIN_SEED)
+
+
+def seed_reports(count=1000, seed=0):
+    """Fill `reports` with `count` deterministic rows spread over the last 30 days."""
+    _ensure_schema()
+    rng = random.Random(seed)
+    categories = ["Event", "Traffic", "Weather", "Food", "Safety", "Culture"]
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        ts = now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        rows.append((
+            f"Report {i}",
+            f"Stand-in report number {i}.",
+            "Koramangala, Bangalore",
+            ts.isoformat(),
+            rng.choice(categories),
+            round(rng.uniform(12.9, 13.1), 6),
+            round(rng.uniform(77.5, 77.7), 6),
+        ))
+    with _keeper_lock:
+        _keeper.executemany(
+            "INSERT INTO reports (title, description, location, timestamp, category, latitude, longitude)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        _keeper.commit()
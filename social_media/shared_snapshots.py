@@ -0,0 +1,270 @@
+"""
+One refresher for every uvicorn worker on a host.
+
+With SNAPSHOT_SHARE_DIR set (a tmpfs such as /dev/shm/social_media), the
+worker holding an flock on DIR/leader.lock refreshes snapshots as usual and
+writes each one to DIR as a new, versioned file; the other workers skip their
+own refreshes and database reads and instead map the newest file of every
+platform read-only, every SNAPSHOT_SHARE_POLL seconds. Pages are served
+straight from the mapped, pre-encoded fragments (event_fragments.py), so the
+events live once in the page cache however many workers there are. When the
+leader exits its lock is released and the next worker to poll takes over.
+
+A file is written under a temporary name and renamed into place, so a worker
+sees either the previous version or the complete new one. Layout:
+
+    MAGIC, <u64 header length>, header JSON (platform, generated_at, count and
+    the [offset, length] of every section), then 8-byte aligned sections:
+    fragment_index / fragments   formatted page JSON per event (int64 offsets + bytes)
+    event_index / events         the raw event dicts as JSON, for the spatial endpoints
+    latitude / longitude         float64, NaN where missing
+    ids                          JSON list of event ids, for the stream change log
+"""
+import os
+import json
+import mmap
+import time
+import struct
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    print("WARNING: fcntl is not available; every worker will refresh its own snapshots.")
+
+from compact_events import event_ids
+
+SNAPSHOT_SHARE_DIR = os.environ.get("SNAPSHOT_SHARE_DIR")
+SNAPSHOT_SHARE_POLL = float(os.environ.get("SNAPSHOT_SHARE_POLL", 1.0))
+# Seconds a starting follower waits for the leader's first snapshots before building its own
+SNAPSHOT_SHARE_WAIT = float(os.environ.get("SNAPSHOT_SHARE_WAIT", 120))
+# Files kept per platform; workers may still be serving from the one before the newest
+SNAPSHOT_SHARE_KEEP = 3
+
+MAGIC = b"SMSNAP1\n"
+LENGTH = struct.Struct("<Q")
+SNAPSHOT_SUFFIX = ".snap"
+
+
+def _json_default(value):
+    # Same strings the formatter produces, so pages built from these events match the leader's
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _encode_event(event):
+    return json.dumps(event, separators=(",", ":"), default=_json_default).encode()
+
+
+def _coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _pack_blobs(blobs):
+    """(int64 offsets with a leading 0, joined bytes)."""
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum(np.array([len(b) for b in blobs], dtype=np.int64), out=offsets[1:])
+    return offsets.tobytes(), b"".join(blobs)
+
+
+def write_snapshot_file(path, snapshot):
+    """Serialize `snapshot` (its events and fragments) into a new snapshot file at `path`."""
+    events = snapshot.events
+    count = len(events)
+    if snapshot.fragments is not None:
+        fragments = [f or b"" for f in snapshot.fragments.slice(0, count)]
+    else:
+        fragments = [b""] * count
+    coordinates = events.coordinates() if hasattr(events, "coordinates") else None
+    if coordinates is None:
+        coordinates = (np.array([_coordinate(e.get('latitude')) for e in events], dtype=np.float64),
+                       np.array([_coordinate(e.get('longitude')) for e in events], dtype=np.float64))
+    fragment_index, fragment_blob = _pack_blobs(fragments)
+    event_index, event_blob = _pack_blobs([_encode_event(e) for e in events])
+    sections = [
+        ("fragment_index", fragment_index),
+        ("fragments", fragment_blob),
+        ("event_index", event_index),
+        ("events", event_blob),
+        ("latitude", np.ascontiguousarray(coordinates[0], dtype=np.float64).tobytes()),
+        ("longitude", np.ascontiguousarray(coordinates[1], dtype=np.float64).tobytes()),
+        ("ids", json.dumps(event_ids(events), default=str).encode()),
+    ]
+    # Section offsets depend on the header length, which depends on the offsets:
+    # reserve a generous fixed-size header instead of iterating
+    meta = {"platform": snapshot.platform, "generated_at": snapshot.generated_at, "count": count}
+    header_size = len(json.dumps(meta)) + 96 * len(sections) + 64
+    header_size += -header_size % 8
+    position = len(MAGIC) + LENGTH.size + header_size
+    layout = {}
+    for name, data in sections:
+        layout[name] = [position, len(data)]
+        position += len(data) + (-len(data) % 8)
+    header = json.dumps(dict(meta, sections=layout)).encode()
+    if len(header) > header_size:
+        raise ValueError(f"snapshot header of {len(header)} bytes does not fit {header_size}")
+    header = header.ljust(header_size)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + LENGTH.pack(header_size) + header)
+        for name, data in sections:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+    os.replace(tmp, path)
+
+
+class MappedFragments:
+    """EventFragments over a mapped snapshot file: fragments are memoryviews into the map."""
+
+    __slots__ = ("_view", "_index", "_base")
+
+    def __init__(self, view, index, base):
+        self._view = view
+        self._index = index
+        self._base = base
+
+    def __len__(self):
+        return len(self._index) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        start, end = self._index[index:index + 2].tolist()
+        return self._view[self._base + start:self._base + end]
+
+    def slice(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return []
+        bounds = self._index[start:stop + 1].tolist()
+        view, base = self._view, self._base
+        return [view[base + a:base + b] for a, b in zip(bounds, bounds[1:])]
+
+
+class MappedEvents:
+    """
+    The events of a mapped snapshot file: index, slice and iterate as dicts
+    (decoded per access, like an EventTable materializes rows), with
+    coordinates() and ids() read from their own sections.
+    """
+
+    __slots__ = ("_events", "_latitude", "_longitude", "_ids_bytes")
+
+    def __init__(self, events, latitude, longitude, ids_bytes):
+        self._events = events
+        self._latitude = latitude
+        self._longitude = longitude
+        self._ids_bytes = ids_bytes
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [json.loads(bytes(raw)) for raw in self._events.slice(index.start, index.stop)]
+        return json.loads(bytes(self._events[index]))
+
+    def __iter__(self):
+        for start in range(0, len(self), 1024):
+            yield from self[start:start + 1024]
+
+    def coordinates(self):
+        return self._latitude, self._longitude
+
+    def ids(self):
+        return json.loads(bytes(self._ids_bytes))
+
+
+class SharedSnapshot:
+    """One mapped snapshot file: platform, generated_at, events (MappedEvents) and fragments."""
+
+    __slots__ = ("platform", "generated_at", "events", "fragments", "path")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # Not closed explicitly: pages and memoryviews handed out keep it alive
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        header_size = LENGTH.unpack_from(data, len(MAGIC))[0]
+        start = len(MAGIC) + LENGTH.size
+        header = json.loads(data[start:start + header_size])
+        sections = header["sections"]
+        view = memoryview(data)
+
+        def array(name, dtype):
+            offset, length = sections[name]
+            return np.frombuffer(data, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+        def raw(name):
+            offset, length = sections[name]
+            return view[offset:offset + length]
+
+        self.platform = header["platform"]
+        self.generated_at = header["generated_at"]
+        self.fragments = MappedFragments(view, array("fragment_index", np.int64), sections["fragments"][0])
+        events = MappedFragments(view, array("event_index", np.int64), sections["events"][0])
+        self.events = MappedEvents(events, array("latitude", np.float64), array("longitude", np.float64), raw("ids"))
+
+
+class SnapshotShare:
+    """The leader lock and the snapshot files in one SNAPSHOT_SHARE_DIR."""
+
+    def __init__(self, directory=SNAPSHOT_SHARE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.leading = False
+        self._lock_file = open(os.path.join(directory, "leader.lock"), "a+")
+        self._adopted = {}  # platform -> file name last mapped
+
+    def try_lead(self):
+        """Take the leader lock if it is free; True if this process leads (now or already)."""
+        if self.leading:
+            return True
+        if fcntl is None:
+            self.leading = True
+            return True
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.leading = True
+        print(f"Worker {os.getpid()} now refreshes the snapshots shared in {self.directory}")
+        return True
+
+    def _files(self, platform):
+        prefix = platform + "."
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX))
+
+    def write(self, snapshot):
+        """Publish `snapshot` to the other workers (leader only)."""
+        name = f"{snapshot.platform}.{time.time_ns():020d}{SNAPSHOT_SUFFIX}"
+        write_snapshot_file(os.path.join(self.directory, name), snapshot)
+        # Workers that mapped an older file keep it alive until they move on
+        for old in self._files(snapshot.platform)[:-SNAPSHOT_SHARE_KEEP]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:
+                pass
+
+    def poll(self, platforms):
+        """SharedSnapshots of the platforms whose newest file changed since the last poll."""
+        fresh = []
+        for platform in platforms:
+            files = self._files(platform)
+            if not files or files[-1] == self._adopted.get(platform):
+                continue
+            try:
+                fresh.append(SharedSnapshot(os.path.join(self.directory, files[-1])))
+            except (OSError, ValueError) as e:
+                print(f"Error mapping shared {platform} snapshot {files[-1]}: {e}")
+                continue
+            self._adopted[platform] = files[-1]
+        return fresh
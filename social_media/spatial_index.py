@@ -0,0 +1,205 @@
+import os
+import math
+import threading
+
+import numpy as np
+
+
+# Grid cell edge in degrees (~1.1 km of latitude); queries only look at the
+# cells overlapping their circle or box
+SPATIAL_CELL_DEGREES = float(os.environ.get("SPATIAL_CELL_DEGREES", 0.01))
+MAX_SPATIAL_RESULTS = int(os.environ.get("MAX_SPATIAL_RESULTS", 500))
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+GRID_COLUMNS = int(round(360 / SPATIAL_CELL_DEGREES)) + 1
+
+
+def _cell_keys(lat, lon, cell):
+    rows = np.floor((lat + 90.0) / cell).astype(np.int64)
+    cols = np.floor((lon + 180.0) / cell).astype(np.int64)
+    return rows * GRID_COLUMNS + cols
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; vectorised over numpy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _candidates(keys, cell, min_lat, min_lon, max_lat, max_lon):
+    """Indices into sorted `keys` of the events in cells overlapping the box."""
+    if not len(keys):
+        return np.empty(0, dtype=np.int64)
+    row0, row1 = (int(math.floor((v + 90.0) / cell)) for v in (min_lat, max_lat))
+    col0, col1 = (int(math.floor((v + 180.0) / cell)) for v in (min_lon, max_lon))
+    starts = np.arange(row0, row1 + 1, dtype=np.int64) * GRID_COLUMNS
+    lo = np.searchsorted(keys, starts + col0, side="left")
+    hi = np.searchsorted(keys, starts + col1, side="right")
+    # lo[i]..hi[i] for every row as one array, without a Python loop over the rows
+    lengths = hi - lo
+    return np.arange(lengths.sum()) + np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+
+
+class PlatformGrid:
+    """
+    Immutable grid over one platform snapshot: event positions sorted by cell
+    key (row-major), so the cells of one grid row that a query overlaps form a
+    single contiguous slice found with two binary searches.
+    """
+
+    __slots__ = ("platform", "version", "events", "lat", "lon", "keys", "order", "cell")
+
+    def __init__(self, snapshot, cell=SPATIAL_CELL_DEGREES):
+        self.platform = snapshot.platform
+        self.version = snapshot.version
+        self.events = events = snapshot.events  # results come from the snapshot that was indexed
+        self.cell = cell
+        # EventTable, or the MappedEvents of a shared snapshot (shared_snapshots.py)
+        coordinates = events.coordinates() if hasattr(events, "coordinates") else None
+        if coordinates is not None:
+            lat, lon = coordinates  # already float64 columns, NaN where missing
+        else:
+            lat = np.fromiter((_coordinate(e.get('latitude')) for e in events), dtype=np.float64, count=len(events))
+            lon = np.fromiter((_coordinate(e.get('longitude')) for e in events), dtype=np.float64, count=len(events))
+        located = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        keys = _cell_keys(lat[located], lon[located], cell)
+        sort = np.argsort(keys, kind="stable")
+        self.order = located[sort]  # positions in snapshot.events
+        self.keys = keys[sort]
+        self.lat = lat[self.order]
+        self.lon = lon[self.order]
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Indices (into self.lat/lon/order) of events in cells overlapping the box."""
+        return _candidates(self.keys, self.cell, min_lat, min_lon, max_lat, max_lon)
+
+
+def _coordinate(value):
+    try:
+        return float(value) if value is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _MergedGrid:
+    """
+    Every platform's grid rows in one cell-sorted set of arrays, with a platform
+    code per row. Immutable: update() builds a new one.
+    """
+
+    __slots__ = ("platforms", "events", "versions", "keys", "lat", "lon", "order", "code", "cell")
+
+    def __init__(self, cell, platforms=(), events=(), versions=None, keys=None, lat=None, lon=None,
+                 order=None, code=None):
+        self.cell = cell
+        self.platforms = list(platforms)  # code -> platform
+        self.events = list(events)  # code -> the indexed snapshot's events
+        self.versions = dict(versions or {})
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.int64)
+        self.lat = lat if lat is not None else np.empty(0, dtype=np.float64)
+        self.lon = lon if lon is not None else np.empty(0, dtype=np.float64)
+        self.order = order if order is not None else np.empty(0, dtype=np.int64)
+        self.code = code if code is not None else np.empty(0, dtype=np.uint8)
+
+    def replace(self, grid):
+        """A merged grid with `grid`'s rows instead of its platform's old ones."""
+        platforms, events = list(self.platforms), list(self.events)
+        if grid.platform in platforms:
+            code = platforms.index(grid.platform)
+            events[code] = grid.events
+        else:
+            code = len(platforms)
+            platforms.append(grid.platform)
+            events.append(grid.events)
+        keep = self.code != code
+        # Both parts are already sorted by key, so the stable sort only merges two runs
+        keys = np.concatenate((self.keys[keep], grid.keys))
+        sort = np.argsort(keys, kind="stable")
+        return _MergedGrid(
+            self.cell, platforms, events, dict(self.versions, **{grid.platform: grid.version}), keys[sort],
+            np.concatenate((self.lat[keep], grid.lat))[sort], np.concatenate((self.lon[keep], grid.lon))[sort],
+            np.concatenate((self.order[keep], grid.order))[sort],
+            np.concatenate((self.code[keep], np.full(len(grid.keys), code, dtype=np.uint8)))[sort])
+
+
+class SpatialIndex:
+    """
+    One grid over the cached snapshots of every platform, so a query is one
+    set of array operations however many platforms there are. Publishing a
+    snapshot grids only that platform and merges it with the other platforms'
+    rows; readers use whichever merged grid is current (an atomic reference
+    swap, like EventStoreBase._snapshots).
+    """
+
+    def __init__(self, cell=SPATIAL_CELL_DEGREES):
+        self.cell = cell
+        self._merged = _MergedGrid(cell)
+        self._lock = threading.Lock()
+
+    def update(self, snapshot):
+        grid = PlatformGrid(snapshot, self.cell)
+        with self._lock:
+            current = self._merged
+            if current.versions.get(snapshot.platform, 0) > grid.version:
+                return  # a newer snapshot was indexed meanwhile
+            self._merged = current.replace(grid)
+
+    def near(self, lat, lon, radius_m, limit, platforms=None):
+        """[(platform, event, distance_m)] within radius_m, nearest first."""
+        merged = self._merged
+        # Start from a circle expected to hold about `limit` events (judged by the
+        # query's own cell) and double it until it does: the nearest `limit` inside a
+        # smaller circle are the nearest overall, and a wide radius in a dense area
+        # then costs about as much as a narrow one
+        radius = min(radius_m, self._expected_radius(merged, lat, lon, limit))
+        while True:
+            dlat = math.degrees(radius / EARTH_RADIUS_M)
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            found = self._nearest(merged, lat, lon, (lat - dlat, lon - dlon, lat + dlat, lon + dlon), radius, limit,
+                                  platforms)
+            if len(found) >= limit or radius >= radius_m:
+                return found
+            radius = min(radius_m, radius * 2)
+
+    @staticmethod
+    def _expected_radius(merged, lat, lon, limit):
+        key = int(_cell_keys(np.float64(lat), np.float64(lon), merged.cell))
+        count = int(np.searchsorted(merged.keys, key, side="right") - np.searchsorted(merged.keys, key, side="left"))
+        if not count:
+            return math.inf
+        cell_m2 = (merged.cell * METRES_PER_DEGREE) ** 2 * max(math.cos(math.radians(lat)), 1e-6)
+        return 1.5 * math.sqrt(limit * cell_m2 / (math.pi * count))
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon, limit, platforms=None):
+        """[(platform, event, distance_m)] inside the box, nearest its centre first."""
+        return self._nearest(self._merged, (min_lat + max_lat) / 2, (min_lon + max_lon) / 2,
+                             (min_lat, min_lon, max_lat, max_lon), None, limit, platforms)
+
+    def _nearest(self, merged, lat, lon, box, radius_m, limit, platforms):
+        min_lat, min_lon, max_lat, max_lon = box
+        idx = _candidates(merged.keys, merged.cell, min_lat, min_lon, max_lat, max_lon)
+        if platforms and len(idx):
+            allowed = np.zeros(len(merged.platforms), dtype=bool)
+            allowed[[code for code, p in enumerate(merged.platforms) if p in platforms]] = True
+            idx = idx[allowed[merged.code[idx]]]
+        if not len(idx) or limit <= 0:
+            return []
+        lats, lons = merged.lat[idx], merged.lon[idx]
+        # Ranked by squared distance on a flat projection around the query point,
+        # which orders points like the great-circle distance at city scale for a
+        # fraction of haversine's cost; only the returned rows get haversine
+        dy = (lats - lat) * METRES_PER_DEGREE
+        dx = (lons - lon) * (METRES_PER_DEGREE * math.cos(math.radians(lat)))
+        d2 = dy * dy + dx * dx
+        if radius_m is not None:
+            keep = np.flatnonzero(d2 <= radius_m * radius_m)
+        else:
+            keep = np.flatnonzero((lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon))
+        if len(keep) > limit:
+            keep = keep[np.argpartition(d2[keep], limit - 1)[:limit]]
+        keep = keep[np.argsort(d2[keep], kind="stable")]
+        rows = idx[keep]
+        distances = haversine_m(lat, lon, lats[keep], lons[keep])
+        return [(merged.platforms[c], merged.events[c][o], d) for c, o, d in
+                zip(merged.code[rows].tolist(), merged.order[rows].tolist(), distances.tolist())]
@@ -0,0 +1,399 @@
+"""
+Append-only, segmented spool between the forwarder and /agent.
+
+The forwarder appends each page it would have POSTed as one record and moves
+on; a drain thread reads records back in batches, POSTs them and commits its
+offset only once /agent accepted them. A slow or unavailable agent then only
+grows the spool on disk instead of losing pages or holding them in memory,
+and records stay on disk for SPOOL_RETENTION_SECONDS so a time range can be
+replayed after a fix (see `python spool_log.py DIR seek --since ...`).
+
+On disk: DIR/<base offset>.seg files of records
+
+    <u32 payload length> <u32 crc32(payload)> <i64 append time, us since epoch> <payload>
+
+rolled at SPOOL_SEGMENT_BYTES, plus DIR/offsets.json holding the committed
+offset of every consumer. Offsets number records from 0 across segments.
+Reads go through mmap; a torn record at the end of the last segment (a crash
+mid-append) is cut off when the spool is opened.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import bisect
+import struct
+import argparse
+import threading
+from datetime import datetime
+from collections import namedtuple, OrderedDict
+
+# Directory of the spool; unset, the forwarder POSTs straight to /agent
+FORWARDER_SPOOL_DIR = os.environ.get("FORWARDER_SPOOL_DIR")
+SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", 64 * 1024 * 1024))
+# Consumed segments are kept this long for replays...
+SPOOL_RETENTION_SECONDS = float(os.environ.get("SPOOL_RETENTION_SECONDS", 7 * 86400))
+# ...and the oldest are deleted, consumed or not, once the spool is bigger than this
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# Seconds between fsyncs of the active segment (0: every append); appends always
+# reach the OS, so only a machine crash can lose the last interval
+SPOOL_FSYNC_INTERVAL = float(os.environ.get("SPOOL_FSYNC_INTERVAL", 1.0))
+
+HEADER = struct.Struct("<IIq")
+SEGMENT_SUFFIX = ".seg"
+OFFSETS_FILE = "offsets.json"
+
+SpoolRecord = namedtuple("SpoolRecord", "offset timestamp payload")
+
+
+class SpoolCorrupt(Exception):
+    pass
+
+
+def _segment_name(base):
+    return f"{base:020d}{SEGMENT_SUFFIX}"
+
+
+def _now_us():
+    return int(time.time() * 1_000_000)
+
+
+class _Segment:
+    """One segment file, mapped read-only and remapped as the active segment grows."""
+
+    __slots__ = ("base", "path", "_map", "_mapped")
+
+    def __init__(self, base, path):
+        self.base = base
+        self.path = path
+        self._map = None
+        self._mapped = 0
+
+    def view(self, needed):
+        """A map covering at least `needed` bytes, or as much as the file holds."""
+        if self._map is None or self._mapped < needed:
+            size = os.path.getsize(self.path)
+            if size > self._mapped:
+                # The old map is not closed here: a reader may still be iterating
+                # over it, and it is released with the last reference
+                with open(self.path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                self._mapped = size
+        return self._map, self._mapped
+
+    def records(self, position, end=None):
+        """(byte position, timestamp, payload) from `position` to `end` (or the end of the file)."""
+        data, size = self.view(end or sys.maxsize)
+        end = size if end is None else min(end, size)
+        while position + HEADER.size <= end:
+            length, crc, timestamp = HEADER.unpack_from(data, position)
+            start = position + HEADER.size
+            if start + length > end:
+                return  # still being written, or torn
+            payload = data[start:start + length]
+            if zlib.crc32(payload) != crc:
+                raise SpoolCorrupt(f"{self.path}: bad checksum at byte {position}")
+            yield position, timestamp, payload
+            position = start + length
+
+    def skip(self, position, count):
+        """Byte position `count` records after `position`, hopping over payloads."""
+        data, size = self.view(sys.maxsize)
+        for _ in range(count):
+            if position + HEADER.size > size:
+                break
+            position += HEADER.size + HEADER.unpack_from(data, position)[0]
+        return position
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map, self._mapped = None, 0
+
+
+class SpoolLog:
+    """
+    The spool in one directory: thread-safe appends from the forwarder, batch
+    reads and committed offsets per named consumer, and retention. One writing
+    process per directory; readers may be threads of it, and other processes
+    may open it with readonly=True (which neither appends nor repairs).
+    """
+
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES, retention_seconds=SPOOL_RETENTION_SECONDS,
+                 max_bytes=SPOOL_MAX_BYTES, fsync_interval=SPOOL_FSYNC_INTERVAL, readonly=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.readonly = readonly
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._segments = [
+            _Segment(int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith(SEGMENT_SUFFIX)
+        ]
+        self._offsets = self._load_offsets()
+        # next offset -> (segment base, byte position), so sequential reads never rescan
+        self._positions = OrderedDict()
+        self._stats = {"appended": 0, "bytes_appended": 0, "segments_deleted": 0, "records_dropped": 0}
+        if not self._segments:
+            self._segments.append(_Segment(0, os.path.join(directory, _segment_name(0))))
+            open(self._segments[0].path, "ab").close()
+        self._end, size = self._recover(self._segments[-1])
+        self._file = None if readonly else open(self._segments[-1].path, "ab")
+        self._size = size
+        self._last_sync = time.monotonic()
+        print(f"Opened spool {directory}: offsets {self._segments[0].base}..{self._end}, "
+              f"{len(self._segments)} segments")
+
+    def _recover(self, segment):
+        """Count the last segment's records and cut off a torn tail; (end offset, valid size)."""
+        count, valid = 0, 0
+        try:
+            for position, _, payload in segment.records(0):
+                count += 1
+                valid = position + HEADER.size + len(payload)
+        except SpoolCorrupt as e:
+            print(f"Truncating spool segment after a bad record: {e}")
+        segment.close()
+        if not self.readonly and os.path.getsize(segment.path) != valid:
+            print(f"Dropping {os.path.getsize(segment.path) - valid} torn bytes at the end of {segment.path}")
+            with open(segment.path, "r+b") as f:
+                f.truncate(valid)
+        return segment.base + count, valid
+
+    # -- writing --
+
+    def append(self, payload):
+        """Append one record (bytes); returns its offset."""
+        if self.readonly:
+            raise ValueError("spool opened read-only")
+        record = HEADER.pack(len(payload), zlib.crc32(payload), _now_us()) + payload
+        with self._cond:
+            if self._size and self._size + len(record) > self.segment_bytes:
+                self._roll()
+            self._file.write(record)
+            self._file.flush()  # visible to mmap readers from here on
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+            self._size += len(record)
+            offset = self._end
+            self._end += 1
+            self._stats["appended"] += 1
+            self._stats["bytes_appended"] += len(record)
+            self._cond.notify_all()
+        return offset
+
+    def append_json(self, value):
+        return self.append(json.dumps(value, separators=(",", ":"), default=str).encode())
+
+    def _roll(self):
+        # Caller holds self._cond
+        os.fsync(self._file.fileno())
+        self._file.close()
+        segment = _Segment(self._end, os.path.join(self.directory, _segment_name(self._end)))
+        self._segments.append(segment)
+        self._file = open(segment.path, "ab")
+        self._size = 0
+        self._enforce_retention()
+
+    # -- reading --
+
+    def end_offset(self):
+        """Offset the next append will get."""
+        with self._cond:
+            return self._end
+
+    def start_offset(self):
+        with self._cond:
+            return self._segments[0].base
+
+    def read(self, offset, max_records=100):
+        """
+        Up to `max_records` records from `offset` on; skips ahead if it was deleted.
+        Raises SpoolCorrupt if the record at `offset` fails its checksum (records
+        before a bad one are returned first; see next_segment_offset).
+        """
+        with self._cond:
+            end = self._end
+            segments = list(self._segments)
+            cached = self._positions.get(offset)
+        offset = max(offset, segments[0].base)
+        records = []
+        i = bisect.bisect_right([s.base for s in segments], offset) - 1
+        if cached and cached[0] == segments[i].base:
+            position = cached[1]
+        else:
+            position = segments[i].skip(0, offset - segments[i].base)
+        while len(records) < max_records and offset < end and i < len(segments):
+            segment = segments[i]
+            try:
+                for position, timestamp, payload in segment.records(position):
+                    records.append(SpoolRecord(offset, timestamp, payload))
+                    position += HEADER.size + len(payload)
+                    offset += 1
+                    if len(records) >= max_records or offset >= end:
+                        break
+                else:
+                    if i + 1 < len(segments) and offset >= segments[i + 1].base:
+                        i, position = i + 1, 0
+                        continue
+                    break
+            except SpoolCorrupt:
+                if not records:
+                    raise
+            break
+        with self._cond:
+            self._positions[offset] = (segments[i].base if i < len(segments) else None, position)
+            while len(self._positions) > 64:
+                self._positions.popitem(last=False)
+        return records
+
+    def next_segment_offset(self, offset):
+        """First offset of the segment after the one holding `offset` (the end offset for the last)."""
+        with self._cond:
+            for segment in self._segments:
+                if segment.base > offset:
+                    return segment.base
+            return self._end
+
+    def wait(self, offset, timeout):
+        """Wait until a record at `offset` exists; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._end > offset, timeout)
+
+    def records_between(self, since=None, until=None):
+        """Records appended in [since, until) (datetimes or epoch seconds), oldest first."""
+        since_us = _epoch_us(since) if since is not None else None
+        until_us = _epoch_us(until) if until is not None else None
+        with self._cond:
+            segments = list(self._segments)
+            end = self._end
+        for i, segment in enumerate(segments):
+            # A segment last written before `since` holds nothing newer
+            if since_us is not None and os.path.getmtime(segment.path) * 1_000_000 < since_us:
+                continue
+            offset = segment.base
+            for _, timestamp, payload in segment.records(0):
+                if offset >= end or (until_us is not None and timestamp >= until_us):
+                    return
+                if since_us is None or timestamp >= since_us:
+                    yield SpoolRecord(offset, timestamp, payload)
+                offset += 1
+
+    # -- consumers --
+
+    def _load_offsets(self):
+        try:
+            with open(os.path.join(self.directory, OFFSETS_FILE)) as f:
+                return {name: int(offset) for name, offset in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def committed(self, consumer):
+        """Next offset `consumer` should read (0 for a new one)."""
+        with self._cond:
+            return self._offsets.get(consumer, 0)
+
+    def commit(self, consumer, offset):
+        """Record that `consumer` is done with everything before `offset`."""
+        with self._cond:
+            self._offsets[consumer] = offset
+            offsets = dict(self._offsets)
+        path = os.path.join(self.directory, OFFSETS_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(offsets, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    # -- retention --
+
+    def enforce_retention(self):
+        with self._cond:
+            self._enforce_retention()
+
+    def _enforce_retention(self):
+        # Caller holds self._cond. Closed segments only, oldest first. Without any
+        # consumer nothing counts as consumed: only max_bytes can delete records.
+        consumed_up_to = min(self._offsets.values(), default=self._segments[0].base)
+        total = sum(os.path.getsize(s.path) for s in self._segments)
+        while len(self._segments) > 1:
+            oldest, following = self._segments[0], self._segments[1]
+            consumed = following.base <= consumed_up_to
+            expired = time.time() - os.path.getmtime(oldest.path) > self.retention_seconds
+            if not (total > self.max_bytes or (consumed and expired)):
+                break
+            if not consumed:
+                dropped = following.base - max(oldest.base, consumed_up_to)
+                self._stats["records_dropped"] += dropped
+                print(f"Spool over {self.max_bytes} bytes: dropping {dropped} unconsumed records in {oldest.path}")
+            size = os.path.getsize(oldest.path)
+            oldest.close()
+            os.remove(oldest.path)
+            self._segments.pop(0)
+            self._stats["segments_deleted"] += 1
+            total -= size
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, start_offset=self._segments[0].base, end_offset=self._end,
+                        segments=len(self._segments),
+                        bytes=sum(os.path.getsize(s.path) for s in self._segments),
+                        consumers={name: {"offset": offset, "lag": self._end - offset}
+                                   for name, offset in self._offsets.items()})
+
+    def close(self):
+        with self._cond:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+            for segment in self._segments:
+                segment.close()
+
+
+def _epoch_us(value):
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return int(float(value) * 1_000_000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="offsets, size and consumer lag")
+    seek = commands.add_parser("seek", help="move a consumer back to the first record appended at or after --since "
+                                            "(stop the forwarder first; it commits its own offset)")
+    seek.add_argument("--since", required=True, help="ISO time, e.g. 2026-10-18T09:30")
+    seek.add_argument("--consumer", default="agent")
+    dump = commands.add_parser("dump", help="print records appended in [--since, --until) as NDJSON")
+    dump.add_argument("--since")
+    dump.add_argument("--until")
+    args = parser.parse_args()
+
+    spool = SpoolLog(args.directory, readonly=True)
+    try:
+        if args.command == "stats":
+            print(json.dumps(spool.stats(), indent=2))
+        elif args.command == "seek":
+            first = next(spool.records_between(datetime.fromisoformat(args.since)), None)
+            offset = first.offset if first else spool.end_offset()
+            spool.commit(args.consumer, offset)
+            print(f"{args.consumer} will resume at offset {offset}")
+        elif args.command == "dump":
+            since = datetime.fromisoformat(args.since) if args.since else None
+            until = datetime.fromisoformat(args.until) if args.until else None
+            for record in spool.records_between(since, until):
+                sys.stdout.write(record.payload.decode() + "\n")
+    finally:
+        spool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Vectorized synthetic events in the shape of core_event_store.generate_core_event.
+
+    cd social_media && python synthetic_events.py --out /tmp/events --events 1000000
+
+writes <out>/<platform>/chunk-00000.jsonl ... for every mock platform; point
+the service at it with SYNTHETIC_EVENTS_DIR=/tmp/events.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from typing import NamedTuple
+from datetime import datetime
+
+import numpy as np
+
+from core_event_store import simple_titles, simple_descriptions, bangalore_places, event_categories
+
+SYNTHETIC_BATCH_SIZE = int(os.environ.get("SYNTHETIC_BATCH_SIZE", 100000))
+LAT_RANGE = (12.9, 13.1)
+LON_RANGE = (77.5, 77.7)
+CITY = "Bangalore"
+# Odd multiplier: index -> suffix is a bijection on 32 bits, so suffixes never repeat
+SUFFIX_MULTIPLIER = 0x9E3779B1
+COLUMNS = ("title_idx", "place_idx", "category_idx", "latitude", "longitude", "timestamp")
+
+
+def seed_int(seed):
+    """64-bit integer seed for an int or any string (e.g. platform + day)."""
+    return int.from_bytes(hashlib.blake2b(str(seed).encode(), digest_size=8).digest(), "little")
+
+
+class EventBatch(NamedTuple):
+    """One columnar batch; row i is event number `start + i` of its generator."""
+    seed: int
+    start: int
+    title_idx: np.ndarray
+    place_idx: np.ndarray
+    category_idx: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    timestamp: np.ndarray  # unix seconds
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def suffixes(self):
+        index = np.arange(self.start, self.start + len(self), dtype=np.uint64)
+        return (index * np.uint64(SUFFIX_MULTIPLIER) ^ np.uint64(self.seed)) & np.uint64(0xFFFFFFFF)
+
+    def event_ids(self):
+        # UUID-shaped: seed in the high 64 bits, event number in the low 64
+        h = f"{self.seed:016x}"
+        prefix = f"{h[:8]}-{h[8:12]}-{h[12:]}-"
+        return [f"{prefix}{i >> 48:04x}-{i & 0xFFFFFFFFFFFF:012x}" for i in range(self.start, self.start + len(self))]
+
+    def to_events(self):
+        """Event dicts, as generate_shared_events returns them."""
+        timestamps = {t: datetime.utcfromtimestamp(t).isoformat() for t in np.unique(self.timestamp).tolist()}
+        events = []
+        for event_id, t, p, c, lat, lon, ts, suffix in zip(
+                self.event_ids(), self.title_idx.tolist(), self.place_idx.tolist(), self.category_idx.tolist(),
+                self.latitude.tolist(), self.longitude.tolist(), self.timestamp.tolist(), self.suffixes().tolist()):
+            suffix = f"{suffix:08x}"
+            place = bangalore_places[p]
+            events.append({
+                "event_id": event_id,
+                "title": f"{simple_titles[t]} {suffix}",
+                "description": f"{simple_descriptions[t]} This is happening at {place}, {CITY}. (ref: {suffix})",
+                "location": f"{place}, {CITY}",
+                "latitude": lat,
+                "longitude": lon,
+                "timestamp": timestamps[ts],
+                "category": event_categories[c],
+            })
+        return events
+
+
+class SyntheticEventGenerator:
+    """
+    Deterministic, unique events from a per-instance NumPy RNG.
+
+    Each column draws from its own child stream of `seed`, so event N is the
+    same however the events are split into batches. Events are unique by
+    construction (event id and title suffix derive from the event number), so
+    there is no retry loop. Timestamps are spread uniformly over
+    [start, start + span) seconds; start defaults to now, so pass a fixed
+    one when the same seed must give byte-identical events.
+    """
+
+    def __init__(self, seed=0, start=None, span=0):
+        self.seed = seed_int(seed)
+        self.start = int(start if start is not None else time.time())
+        self.span = int(span)
+        self._rngs = dict(zip(COLUMNS, (np.random.default_rng(s) for s in
+                                        np.random.SeedSequence(self.seed).spawn(len(COLUMNS)))))
+        self.generated = 0
+
+    def batch(self, n):
+        rngs = self._rngs
+        # int64 draws: one 64-bit value per draw, so consecutive batches continue the same stream
+        batch = EventBatch(
+            self.seed, self.generated,
+            rngs["title_idx"].integers(0, len(simple_titles), n, dtype=np.int64),
+            rngs["place_idx"].integers(0, len(bangalore_places), n, dtype=np.int64),
+            rngs["category_idx"].integers(0, len(event_categories), n, dtype=np.int64),
+            rngs["latitude"].uniform(*LAT_RANGE, n).round(6),
+            rngs["longitude"].uniform(*LON_RANGE, n).round(6),
+            self.start + rngs["timestamp"].integers(0, max(self.span, 1), n, dtype=np.int64),
+        )
+        self.generated += n
+        return batch
+
+    def batches(self, count, batch_size=SYNTHETIC_BATCH_SIZE):
+        while count > 0:
+            n = min(count, batch_size)
+            yield self.batch(n)
+            count -= n
+
+    def generate(self, count):
+        events = []
+        for batch in self.batches(count):
+            events.extend(batch.to_events())
+        return events
+
+
+def write_chunks(generator, out_dir, count, batch_size=SYNTHETIC_BATCH_SIZE, fmt="jsonl"):
+    """
+    Stream `count` events into one file per batch: JSON lines ("jsonl") or the
+    raw columns ("npz", loaded without any parsing). Returns the file paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for n, batch in enumerate(generator.batches(count, batch_size)):
+        path = os.path.join(out_dir, f"chunk-{n:05d}.{fmt}")
+        tmp = path + ".tmp"
+        if fmt == "npz":
+            with open(tmp, "wb") as f:
+                np.savez(f, seed=batch.seed, start=batch.start,
+                         **{column: getattr(batch, column) for column in COLUMNS})
+        else:
+            with open(tmp, "w") as f:
+                for event in batch.to_events():
+                    f.write(json.dumps(event, separators=(",", ":")))
+                    f.write("\n")
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def load_chunks(directory, limit=None):
+    """Event dicts from the chunk files write_chunks left in `directory`, in order."""
+    events = []
+    for path in sorted(glob.glob(os.path.join(directory, "chunk-*.*"))):
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                batch = EventBatch(int(data["seed"]), int(data["start"]), *(data[column] for column in COLUMNS))
+            events.extend(batch.to_events())
+        elif path.endswith(".jsonl"):
+            with open(path) as f:
+                events.extend(json.loads(line) for line in f if line.strip())
+        if limit is not None and len(events) >= limit:
+            return events[:limit]
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--events", type=int, default=1000000, help="events per platform")
+    parser.add_argument("--platforms", default="twitter,reddit,instagram,eventbrite")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--span", type=int, default=30 * 24 * 3600, help="seconds of history to spread events over")
+    parser.add_argument("--batch-size", type=int, default=SYNTHETIC_BATCH_SIZE)
+    parser.add_argument("--format", choices=("jsonl", "npz"), default="jsonl")
+    args = parser.parse_args()
+
+    start = int(time.time()) - args.span
+    for platform in args.platforms.split(","):
+        generator = SyntheticEventGenerator(f"{args.seed}:{platform}", start=start, span=args.span)
+        paths = write_chunks(generator, os.path.join(args.out, platform), args.events, args.batch_size, args.format)
+        print(f"Wrote {args.events} {platform} events to {len(paths)} chunks in {os.path.join(args.out, platform)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The service modules import each other by plain name, as they do when run from
+# social_media/, and the shared ones from common/ at the repo root
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
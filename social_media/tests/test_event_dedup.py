@@ -0,0 +1,85 @@
+import pytest
+
+from event_dedup import EventDeduplicator
+
+TITLE = "Water logging at Marathahalli underpass"
+DESCRIPTION = "Heavy rain has flooded the underpass near Marathahalli bridge and traffic is crawling towards Whitefield."
+MARATHAHALLI = (12.9569, 77.7011)
+HEBBAL = (13.0358, 77.5970)
+
+
+def tweet(post_id, where=MARATHAHALLI, title=TITLE, description=DESCRIPTION, posted="2026-10-18T08:00:00"):
+    return {"id": post_id, "text": f"{title}: {description}", "created_at": posted,
+            "geo": {"coordinates": {"latitude": where[0], "longitude": where[1]}, "place_name": "Marathahalli"}}
+
+
+def listing(post_id, where=MARATHAHALLI, start="2030-01-01T18:00:00"):
+    return {"id": post_id, "name": {"text": TITLE}, "description": {"text": DESCRIPTION},
+            "start": {"local": start, "timezone": "Asia/Kolkata"},
+            "venue": {"address": {"localized_address_display": "Marathahalli",
+                                  "latitude": where[0], "longitude": where[1]}}}
+
+
+def caption(post_id, where=MARATHAHALLI):
+    return {"id": post_id, "caption": f"{TITLE} #traffic", "timestamp": "2026-10-18T08:01:00",
+            "location": {"name": "Marathahalli", "latitude": where[0], "longitude": where[1]}}
+
+
+@pytest.fixture
+def dedup():
+    return EventDeduplicator(window=300)
+
+
+def test_same_incident_across_platforms_is_one_cluster(dedup):
+    assert dedup.add("twitter", tweet(1), now=1000) == []
+    assert dedup.add("instagram", caption("i1"), now=1010) == []
+    assert dedup.add("eventbrite", listing("e1"), now=1020) == []
+    assert dedup.open_clusters() == 1
+
+    [cluster] = dedup.flush()
+    # eventbrite is the most structured of the three, so its copy is forwarded
+    assert cluster["platform"] == "eventbrite" and cluster["item"]["id"] == "e1"
+    assert cluster["members"] == [{"platform": "twitter", "id": 1}, {"platform": "instagram", "id": "i1"},
+                                  {"platform": "eventbrite", "id": "e1"}]
+    assert cluster["size"] == 3
+    assert (cluster["first_seen"], cluster["last_seen"]) == (1000, 1020)
+
+
+def test_different_place_or_text_opens_another_cluster(dedup):
+    dedup.add("twitter", tweet(1), now=1000)
+    dedup.add("twitter", tweet(2, where=HEBBAL), now=1001)
+    dedup.add("twitter", tweet(3, title="Food festival at Marathahalli",
+                               description="Street food stalls and live music all evening by the lake."), now=1002)
+    assert dedup.open_clusters() == 3
+    assert dedup.stats["duplicates"] == 0
+
+
+def test_windows_follow_arrival_time_not_post_times(dedup):
+    dedup.add("twitter", tweet(1), now=1000)
+    # The listing's start is years ahead; it must neither close the tweet's cluster nor miss it
+    assert dedup.add("eventbrite", listing("e1"), now=1100) == []
+    assert dedup.open_clusters() == 1
+    assert dedup.watermark == 1100
+
+    # Past the window, the same incident starts a new cluster and the old one closes
+    [closed] = dedup.add("twitter", tweet(2), now=1301)
+    assert [m["id"] for m in closed["members"]] == [1, "e1"]
+    assert dedup.open_clusters() == 1
+
+
+def test_refetched_member_is_ignored(dedup):
+    dedup.add("twitter", tweet(1), now=1000)
+    assert dedup.add("twitter", tweet(1), now=1030) == []
+    assert dedup.stats["replays"] == 1
+    [cluster] = dedup.flush()
+    assert cluster["size"] == 1
+
+
+def test_bare_headline_matching_two_incidents_stays_alone(dedup):
+    dedup.add("twitter", tweet(1), now=1000)
+    dedup.add("twitter", tweet(2, description="Two cars collided under the Marathahalli bridge, one lane is closed "
+                                              "while police clear the vehicles."), now=1001)
+    assert dedup.open_clusters() == 2
+    dedup.add("instagram", caption("i1"), now=1002)
+    assert dedup.open_clusters() == 3
+    assert dedup.stats["ambiguous"] == 1
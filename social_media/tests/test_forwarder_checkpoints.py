@@ -0,0 +1,160 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import forwarder_scheduler
+from forwarder_scheduler import ForwarderScheduler, extract_items, mark_forwarded, wrap_items
+from common import checkpoint_store
+from common.checkpoint_store import CheckpointStore
+
+AGENT_URL = "http://agent.test/agent"
+FASTAPI_URL = "http://api.test"
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    store = CheckpointStore(str(tmp_path / "state.db"), batch_size=1000, flush_interval=60)
+    yield store
+    store.close()
+
+
+def posts(*ids):
+    return [{"id": i, "text": f"post {i}"} for i in ids]
+
+
+def test_cursor_waits_for_every_outstanding_page(checkpoints):
+    checkpoints.advance("poll:twitter", "twitter", "0", "a", posts(1, 2))
+    checkpoints.advance("poll:twitter", "twitter", "a", "b", posts(3))
+    assert checkpoints.cursor("poll:twitter") == "0"
+
+    # The later page is accepted first: the cursor still waits on the first
+    checkpoints.mark_seen("twitter", posts(3))
+    assert checkpoints.cursor("poll:twitter") == "0"
+    checkpoints.mark_seen("twitter", posts(1))
+    assert checkpoints.cursor("poll:twitter") == "0"
+    checkpoints.mark_seen("twitter", posts(2))
+    assert checkpoints.cursor("poll:twitter") == "b"
+    assert checkpoints.stats()["outstanding_pages"] == {}
+
+
+def test_pages_without_new_items_settle_at_once(checkpoints):
+    checkpoints.mark_seen("reddit", posts(1))
+    checkpoints.advance("poll:reddit", "reddit", "0", "a", posts(1))
+    checkpoints.advance("poll:reddit", "reddit", "a", "b", [])
+    assert checkpoints.cursor("poll:reddit") == "b"
+
+
+def test_abandons_the_oldest_page_past_the_limit(checkpoints, monkeypatch):
+    monkeypatch.setattr(checkpoint_store, "WALK_MAX_PENDING_PAGES", 2)
+    for start, end, item in (("0", "a", 1), ("a", "b", 2), ("b", "c", 3)):
+        checkpoints.advance("poll:reddit", "reddit", start, end, posts(item))
+    assert checkpoints.stats()["pages_abandoned"] == 1
+    assert checkpoints.cursor("poll:reddit") == "a"
+
+
+def test_unseen_and_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = CheckpointStore(path)
+    store.mark_seen("reddit", [{"kind": "t3", "data": {"id": "r1"}}])
+    store.set_cursor("rotate:reddit", "t3_r1")
+    assert store.unseen("reddit", [{"data": {"id": "r1"}}, {"data": {"id": "r2"}}, {"data": {"id": "r2"}}]) \
+        == [{"data": {"id": "r2"}}]
+    store.close()
+
+    store = CheckpointStore(path)
+    assert store.is_seen("reddit", "r1")
+    assert not store.is_seen("twitter", "r1")
+    assert store.cursor("rotate:reddit") == "t3_r1"
+    store.close()
+
+
+def test_mark_forwarded_marks_dedup_members_on_their_platforms(checkpoints):
+    canonical = dict(posts(7)[0], dedup={"members": [{"platform": "twitter", "id": 7},
+                                                     {"platform": "reddit", "id": "r9"}]})
+    mark_forwarded(checkpoints, "twitter", wrap_items("twitter", [canonical]))
+    assert checkpoints.is_seen("twitter", "7")
+    assert checkpoints.is_seen("reddit", "r9")
+
+
+class FakeServices:
+    """The /api/instagram page and /agent, answering from httpx.MockTransport."""
+
+    def __init__(self, items, agent_failures=0):
+        self.body = wrap_items("instagram", items)
+        self.agent_failures = agent_failures
+        self.fetches = []  # If-None-Match sent with each fetch
+        self.posted = []  # item ids of each POST /agent
+
+    def handler(self, request):
+        if request.url.host == "api.test":
+            self.fetches.append(request.headers.get("if-none-match"))
+            if request.headers.get("if-none-match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, json=self.body, headers={"etag": '"v1"'})
+        self.posted.append([item["id"] for item in extract_items("instagram", json.loads(request.content))])
+        if self.agent_failures:
+            self.agent_failures -= 1
+            return httpx.Response(500)
+        return httpx.Response(202)
+
+
+def poll(services, checkpoints, until):
+    """Run the instagram poller against `services` until until() holds."""
+    scheduler = ForwarderScheduler(["instagram"], FASTAPI_URL, AGENT_URL, checkpoints=checkpoints)
+    scheduler.intervals["instagram"] = 0
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(services.handler)) as client:
+            scheduler._client = client
+            scheduler._post_slots = asyncio.Semaphore(1)
+            task = asyncio.create_task(scheduler._poll_platform("instagram"))
+            for _ in range(500):
+                await asyncio.sleep(0.005)
+                if until():
+                    break
+            task.cancel()
+            await asyncio.gather(task, *scheduler._posts, return_exceptions=True)
+    asyncio.run(run())
+    return scheduler
+
+
+@pytest.fixture
+def fast_repoll(monkeypatch):
+    monkeypatch.setattr(forwarder_scheduler, "FORWARDER_EXHAUSTED_REPOLL", 0)
+
+
+def test_failed_post_is_sent_again_instead_of_304(checkpoints, fast_repoll):
+    services = FakeServices(posts(1, 2), agent_failures=1)
+    scheduler = poll(services, checkpoints, until=lambda: '"v1"' in services.fetches)
+
+    # The failed POST left no ETag behind: the page came back in full and was resent
+    assert services.posted[:2] == [[1, 2], [1, 2]]
+    assert services.fetches[:2] == [None, None]
+    assert '"v1"' in services.fetches
+    assert scheduler.stats["instagram"].post_errors == 1
+    assert checkpoints.is_seen("instagram", "1") and checkpoints.is_seen("instagram", "2")
+    assert checkpoints.cursor("poll:instagram") == "0"
+    assert checkpoints.stats()["outstanding_pages"] == {}
+
+
+def test_etag_is_remembered_only_after_the_post_succeeds(checkpoints, fast_repoll):
+    services = FakeServices(posts(1), agent_failures=1000)
+    scheduler = poll(services, checkpoints, until=lambda: len(services.fetches) >= 4)
+
+    assert set(services.fetches) == {None}
+    assert scheduler._seen_pages["instagram"] == {}
+    assert not checkpoints.is_seen("instagram", "1")
+    assert checkpoints.stats()["outstanding_pages"]["poll:instagram"] >= 1
+
+
+def test_filtered_page_does_not_remember_its_etag(checkpoints, fast_repoll):
+    checkpoints.mark_seen("instagram", posts(1))
+    services = FakeServices(posts(1, 2))
+    scheduler = poll(services, checkpoints, until=lambda: len(services.fetches) >= 3)
+
+    # Only the unseen item was sent, and the cut-down page never answered 304
+    assert services.posted[0] == [2]
+    assert set(services.fetches) == {None}
+    assert scheduler._seen_pages["instagram"] == {}
@@ -0,0 +1,198 @@
+import os
+import time
+
+import pytest
+
+from spool_log import SpoolLog, SpoolCorrupt, HEADER, SEGMENT_SUFFIX
+
+
+def open_spool(directory, **kwargs):
+    kwargs.setdefault("fsync_interval", 0)
+    return SpoolLog(str(directory), **kwargs)
+
+
+def payloads(records):
+    return [record.payload for record in records]
+
+
+def segment_paths(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_append_and_read(tmp_path):
+    spool = open_spool(tmp_path)
+    assert [spool.append(b"record %d" % i) for i in range(5)] == [0, 1, 2, 3, 4]
+    assert spool.end_offset() == 5
+    records = spool.read(0, 10)
+    assert [r.offset for r in records] == [0, 1, 2, 3, 4]
+    assert payloads(records) == [b"record %d" % i for i in range(5)]
+    assert payloads(spool.read(2, 2)) == [b"record 2", b"record 3"]
+    assert spool.read(5) == []
+    spool.close()
+
+
+def test_append_json_and_wait(tmp_path):
+    spool = open_spool(tmp_path)
+    assert not spool.wait(0, 0.01)
+    spool.append_json({"platform": "reddit", "body": {"data": {"children": []}}})
+    assert spool.wait(0, 0.01)
+    assert spool.read(0)[0].payload == b'{"platform":"reddit","body":{"data":{"children":[]}}}'
+    spool.close()
+
+
+def test_roll_reads_across_segments(tmp_path):
+    record_bytes = HEADER.size + 10
+    spool = open_spool(tmp_path, segment_bytes=3 * record_bytes)
+    for i in range(10):
+        spool.append(b"payload-%02d" % i)
+    assert len(segment_paths(tmp_path)) == 4
+    assert spool.stats()["segments"] == 4
+    assert payloads(spool.read(0, 100)) == [b"payload-%02d" % i for i in range(10)]
+    # Reads that start mid-segment and cross a segment boundary
+    assert [r.offset for r in spool.read(2, 3)] == [2, 3, 4]
+    assert [r.offset for r in spool.read(5, 3)] == [5, 6, 7]
+    assert spool.next_segment_offset(4) == 6
+    assert spool.next_segment_offset(9) == 10
+    spool.close()
+
+
+def test_reopen_resumes_offsets_and_commits(tmp_path):
+    spool = open_spool(tmp_path, segment_bytes=64)
+    for i in range(6):
+        spool.append(b"r%d" % i)
+    spool.commit("agent", 4)
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_bytes=64)
+    assert spool.end_offset() == 6
+    assert spool.committed("agent") == 4
+    assert spool.committed("other") == 0
+    assert spool.append(b"r6") == 6
+    assert payloads(spool.read(4)) == [b"r4", b"r5", b"r6"]
+    spool.close()
+
+
+def test_recover_truncates_torn_tail(tmp_path):
+    spool = open_spool(tmp_path)
+    for i in range(3):
+        spool.append(b"complete %d" % i)
+    spool.close()
+    path = segment_paths(tmp_path)[-1]
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        # A crash mid-append: a header promising more payload than was written
+        f.write(HEADER.pack(100, 0, 0) + b"partial")
+
+    spool = open_spool(tmp_path)
+    assert os.path.getsize(path) == size
+    assert spool.end_offset() == 3
+    assert spool.append(b"after recovery") == 3
+    assert payloads(spool.read(0)) == [b"complete 0", b"complete 1", b"complete 2", b"after recovery"]
+    spool.close()
+
+
+def test_readonly_open_does_not_repair(tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append(b"kept")
+    spool.close()
+    path = segment_paths(tmp_path)[-1]
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02")
+    size = os.path.getsize(path)
+
+    reader = open_spool(tmp_path, readonly=True)
+    assert os.path.getsize(path) == size
+    assert payloads(reader.read(0)) == [b"kept"]
+    with pytest.raises(ValueError):
+        reader.append(b"nope")
+    reader.close()
+
+
+def test_corrupt_record_raises_after_good_ones(tmp_path):
+    spool = open_spool(tmp_path)
+    for i in range(4):
+        spool.append(b"record %d" % i)
+    path = segment_paths(tmp_path)[-1]
+    record_bytes = HEADER.size + len(b"record 0")
+    with open(path, "r+b") as f:
+        f.seek(2 * record_bytes + HEADER.size)  # payload of record 2
+        f.write(b"X")
+
+    assert payloads(spool.read(0, 10)) == [b"record 0", b"record 1"]
+    with pytest.raises(SpoolCorrupt):
+        spool.read(2, 10)
+    assert spool.next_segment_offset(2) == 4
+    spool.close()
+
+
+def test_retention_keeps_everything_without_consumers(tmp_path):
+    record_bytes = HEADER.size + 4
+    spool = open_spool(tmp_path, segment_bytes=2 * record_bytes, retention_seconds=60)
+    for i in range(6):
+        spool.append(b"r%03d" % i)
+    for path in segment_paths(tmp_path):
+        age(path, 3600)
+    spool.enforce_retention()
+    # Expired, but nobody has read them yet
+    assert spool.start_offset() == 0
+    assert len(segment_paths(tmp_path)) == 3
+    spool.close()
+
+
+def test_retention_deletes_expired_consumed_segments(tmp_path):
+    record_bytes = HEADER.size + 4
+    spool = open_spool(tmp_path, segment_bytes=2 * record_bytes, retention_seconds=60)
+    for i in range(6):
+        spool.append(b"r%03d" % i)
+    spool.commit("agent", 3)
+    paths = segment_paths(tmp_path)
+    for path in paths:
+        age(path, 3600)
+    spool.enforce_retention()
+    # [0, 1] is fully consumed; [2, 3] is not, so it and everything after stay
+    assert segment_paths(tmp_path) == paths[1:]
+    assert spool.start_offset() == 2
+    assert spool.stats()["segments_deleted"] == 1
+
+    # Not yet expired: consumed segments are kept for replays
+    spool.commit("agent", 6)
+    age(paths[1], 0)
+    spool.enforce_retention()
+    assert spool.start_offset() == 2
+    # Reads of deleted offsets skip ahead to the oldest record left
+    assert spool.read(0, 1)[0].offset == 2
+    spool.close()
+
+
+def test_retention_waits_for_the_slowest_consumer(tmp_path):
+    record_bytes = HEADER.size + 4
+    spool = open_spool(tmp_path, segment_bytes=2 * record_bytes, retention_seconds=60)
+    for i in range(6):
+        spool.append(b"r%03d" % i)
+    spool.commit("agent", 6)
+    spool.commit("replay", 0)
+    for path in segment_paths(tmp_path):
+        age(path, 3600)
+    spool.enforce_retention()
+    assert spool.start_offset() == 0
+    spool.close()
+
+
+def test_max_bytes_drops_unconsumed_records(tmp_path):
+    record_bytes = HEADER.size + 4
+    spool = open_spool(tmp_path, segment_bytes=2 * record_bytes, max_bytes=4 * record_bytes)
+    for i in range(8):
+        spool.append(b"r%03d" % i)
+    # Checked on every roll and by the drain when idle; the oldest segments go first
+    spool.enforce_retention()
+    stats = spool.stats()
+    assert stats["bytes"] <= 4 * record_bytes
+    assert stats["start_offset"] == 4
+    assert stats["records_dropped"] == 4
+    assert payloads(spool.read(0)) == [b"r004", b"r005", b"r006", b"r007"]
+    spool.close()